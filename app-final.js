@@ -33,6 +33,7 @@ const Icon = ({ name, className = 'w-5 h-5', size }) => {
   if (name === 'Menu') content = '☰';
   if (name === 'Eye') content = '👁️';
   if (name === 'EyeOff') content = '🙈';
+  if (name === 'Search') content = '🔍';
 
   return React.createElement(
     'span',
@@ -319,8 +320,14 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
   const [isSending, setIsSending] = React.useState(false);
   const [error, setError] = React.useState(null);
   const messagesEndRef = React.useRef(null);
+  const [conversationsCursor, setConversationsCursor] = React.useState(null); // Daha eski sohbetler için
+  const [olderMessagesCursor, setOlderMessagesCursor] = React.useState(null); // Daha eski mesajlar için
+  const skipScrollRef = React.useRef(false);
   const [sidebarOpen, setSidebarOpen] = React.useState(false);
   const [showDeleteModal, setShowDeleteModal] = React.useState(false);
+  const [searchQuery, setSearchQuery] = React.useState('');
+  const [searchResults, setSearchResults] = React.useState(null); // null: arama yok, liste gösterilir
+  const [searchCursor, setSearchCursor] = React.useState(null);
 
   // ---- Yeni eklenen state'ler ----
   const [selectedFile, setSelectedFile] = React.useState(null);         // Gönderilecek resim
@@ -342,6 +349,11 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
 
   // Mesajlar ekranını en alta kaydırma
   const scrollToBottom = () => {
+    // Eski mesajlar yukarı eklendiğinde kaydırma
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
   useEffect(scrollToBottom, [messages]);
@@ -350,36 +362,72 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
   const fetchConversations = useCallback(async () => {
     try {
       const response = await axios.get(`${API}/chat/conversations`, { headers: getHeaders() });
-      setConversations(response.data);
-      if (response.data.length > 0 && !selectedConvId) {
-        setSelectedConvId(response.data[0].id);
-      } else if (response.data.length > 0 && selectedConvId) {
-        const exists = response.data.some((conv) => conv.id === selectedConvId);
-        if (!exists) setSelectedConvId(response.data[0].id);
+      const items = response.data.items;
+      setConversations(items);
+      setConversationsCursor(response.data.next_cursor);
+      if (items.length > 0 && !selectedConvId) {
+        setSelectedConvId(items[0].id);
+      } else if (items.length > 0 && selectedConvId) {
+        const exists = items.some((conv) => conv.id === selectedConvId);
+        if (!exists) setSelectedConvId(items[0].id);
       }
     } catch (err) {
       setError('Sohbetler yüklenirken bir hata oluştu.');
     }
   }, [getHeaders, selectedConvId]);
 
-  // Mesajları Yükleme
+  // Daha eski sohbetleri yükleme
+  const fetchMoreConversations = async () => {
+    if (!conversationsCursor) return;
+    try {
+      const response = await axios.get(`${API}/chat/conversations`, {
+        headers: getHeaders(),
+        params: { before: conversationsCursor }
+      });
+      setConversations((prev) => [...prev, ...response.data.items]);
+      setConversationsCursor(response.data.next_cursor);
+    } catch (err) {
+      setError('Sohbetler yüklenirken bir hata oluştu.');
+    }
+  };
+
+  // Mesajları Yükleme (son sayfa)
   const fetchMessages = useCallback(
     async (convId) => {
       if (!convId) {
         setMessages([]);
+        setOlderMessagesCursor(null);
         return;
       }
       try {
         const response = await axios.get(`${API}/chat/conversation/${convId}/messages`, { headers: getHeaders() });
-        setMessages(response.data);
+        setMessages(response.data.items);
+        setOlderMessagesCursor(response.data.next_cursor);
       } catch (err) {
         setError('Mesajlar yüklenirken bir hata oluştu.');
         setMessages([]);
+        setOlderMessagesCursor(null);
       }
     },
     [getHeaders]
   );
 
+  // Daha eski mesajları yükleme (yukarı eklenir)
+  const fetchOlderMessages = async () => {
+    if (!selectedConvId || !olderMessagesCursor) return;
+    try {
+      const response = await axios.get(`${API}/chat/conversation/${selectedConvId}/messages`, {
+        headers: getHeaders(),
+        params: { before: olderMessagesCursor }
+      });
+      skipScrollRef.current = true;
+      setMessages((prev) => [...response.data.items, ...prev]);
+      setOlderMessagesCursor(response.data.next_cursor);
+    } catch (err) {
+      setError('Mesajlar yüklenirken bir hata oluştu.');
+    }
+  };
+
   // Sohbet ve Mesajları senkronize et
   useEffect(() => {
     fetchConversations();
@@ -389,6 +437,56 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
     fetchMessages(selectedConvId);
   }, [selectedConvId, fetchMessages]);
 
+  // Mesajlarda arama (yazmayı bırakınca)
+  useEffect(() => {
+    const q = searchQuery.trim();
+    if (!q) {
+      setSearchResults(null);
+      setSearchCursor(null);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/chat/search`, { headers: getHeaders(), params: { q } });
+        if (cancelled) return;
+        setSearchResults(response.data.items);
+        setSearchCursor(response.data.next_cursor);
+      } catch (err) {
+        if (!cancelled) setError('Arama yapılırken bir hata oluştu.');
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery, getHeaders]);
+
+  const fetchMoreSearchResults = async () => {
+    if (!searchCursor) return;
+    try {
+      const response = await axios.get(`${API}/chat/search`, {
+        headers: getHeaders(),
+        params: { q: searchQuery.trim(), cursor: searchCursor }
+      });
+      setSearchResults((prev) => [...(prev || []), ...response.data.items]);
+      setSearchCursor(response.data.next_cursor);
+    } catch (err) {
+      setError('Arama yapılırken bir hata oluştu.');
+    }
+  };
+
+  const openSearchResult = (hit) => {
+    // Listede henüz yüklenmemiş eski bir sohbet olabilir: başlığı görünsün diye ekle
+    setConversations((prev) =>
+      prev.some((conv) => conv.id === hit.conversation_id)
+        ? prev
+        : [...prev, { id: hit.conversation_id, title: hit.conversation_title }]
+    );
+    setSelectedConvId(hit.conversation_id);
+    setSidebarOpen(false);
+  };
+
   // Yeni Sohbet Başlatma
   const startNewConversation = async () => {
     try {
@@ -470,6 +568,52 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
     if (input) input.value = '';
   };
 
+  // ----- WebSocket kanalı: mesaj akışı + başlık/sohbet bildirimleri -----
+  const socketRef = React.useRef(null);
+  const pendingTurnsRef = React.useRef({}); // rid -> olay işleyici
+  const ridRef = React.useRef(0);
+
+  useEffect(() => {
+    let closedByUs = false;
+    let retryTimer = null;
+    let current = null;
+
+    const connect = () => {
+      const socket = new WebSocket(`${API.replace(/^http/, 'ws')}/chat/ws`);
+      current = socket;
+      socket.onopen = () => socket.send(JSON.stringify({ type: 'auth', token }));
+      socket.onmessage = (msg) => {
+        const event = JSON.parse(msg.data);
+        if (event.type === 'ready') {
+          socketRef.current = socket;
+        } else if (event.type === 'conversation_updated') {
+          setConversations((prev) =>
+            prev.map((conv) => (conv.id === event.conversation.id ? { ...conv, ...event.conversation } : conv))
+          );
+        } else if (event.type === 'conversation_deleted') {
+          setConversations((prev) => prev.filter((conv) => !event.conversation_ids.includes(conv.id)));
+        } else if (event.rid != null && pendingTurnsRef.current[event.rid]) {
+          pendingTurnsRef.current[event.rid](event);
+        }
+      };
+      socket.onclose = () => {
+        if (socketRef.current === socket) socketRef.current = null;
+        // Yarım kalan turları hata ile bitir
+        Object.values(pendingTurnsRef.current).forEach((handler) =>
+          handler({ type: 'error', detail: 'Bağlantı koptu. Lütfen tekrar deneyin.' })
+        );
+        if (!closedByUs) retryTimer = setTimeout(connect, 3000);
+      };
+    };
+
+    connect();
+    return () => {
+      closedByUs = true;
+      clearTimeout(retryTimer);
+      if (current) current.close();
+    };
+  }, [token]);
+
   // Mesaj Gönderme
   const handleSend = async (e) => {
     e.preventDefault();
@@ -477,6 +621,7 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
 
     let convId = selectedConvId;
     let newConvTitle = null;
+    const isFirstMessage = messages.length === 0;
 
     if (!convId && conversations.length === 0) {
       try {
@@ -507,39 +652,110 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
     setError(null);
 
     try {
-      const formData = new FormData();
-      formData.append('conversation_id', convId);
-      formData.append('message', userMessage.content);
-
-      // Eğer resim seçiliyse ekle
-      if (selectedFile) {
-        formData.append('file', selectedFile);
-      }
+      // Asistan balonunu boş ekle, parçalar geldikçe doldur
+      const addAssistantBubble = () =>
+        setMessages((prev) => [
+          ...prev,
+          { conversation_id: convId, role: 'assistant', content: '', timestamp: new Date().toISOString() }
+        ]);
+      const updateAssistant = (patch) =>
+        setMessages((prev) => {
+          const next = prev.slice();
+          next[next.length - 1] = { ...next[next.length - 1], ...patch };
+          return next;
+        });
 
-      const response = await axios.post(`${API}/chat/message`, formData, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
+      let content = '';
+      let streamError = null;
+
+      const applyEvent = (event) => {
+        if (event.type === 'delta') {
+          content += event.text;
+          updateAssistant({ content });
+        } else if (event.type === 'done') {
+          updateAssistant({ content: event.assistant_message.content, timestamp: event.assistant_message.created_at });
+        } else if (event.type === 'error') {
+          streamError = event.detail;
+        }
+      };
+
+      const socket = socketRef.current;
+      const usedSocket = Boolean(socket && socket.readyState === WebSocket.OPEN && !selectedFile);
+
+      if (usedSocket) {
+        // Açık WebSocket üzerinden gönder (resimli mesajlar HTTP ile gider)
+        addAssistantBubble();
+        await new Promise((resolve) => {
+          const rid = ++ridRef.current;
+          pendingTurnsRef.current[rid] = (event) => {
+            applyEvent(event);
+            if (event.type === 'done' || event.type === 'error') {
+              delete pendingTurnsRef.current[rid];
+              resolve();
+            }
+          };
+          socket.send(JSON.stringify({ type: 'send', rid, conversation_id: convId, message: userMessage.content }));
+        });
+      } else {
+        const formData = new FormData();
+        formData.append('conversation_id', convId);
+        formData.append('message', userMessage.content);
 
-      const ai = response.data.assistant_message;
+        // Eğer resim seçiliyse ekle
+        if (selectedFile) {
+          formData.append('file', selectedFile);
+        }
 
-      setMessages((prev) => [
-        ...prev,
-        {
-          conversation_id: convId,
-          role: 'assistant',
-          content: ai.content,
-          timestamp: ai.created_at
+        // Yanıtı akış (NDJSON) olarak al: her satır bir olay
+        const response = await fetch(`${API}/chat/message/stream`, {
+          method: 'POST',
+          headers: { Authorization: `Bearer ${token}` },
+          body: formData
+        });
+        if (!response.ok || !response.body) {
+          // 429/503 gibi reddetmelerde sunucunun mesajını göster
+          const body = await response.json().catch(() => ({}));
+          const httpError = new Error(`HTTP ${response.status}`);
+          httpError.detail = body.detail;
+          throw httpError;
         }
-      ]);
+        addAssistantBubble();
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        const handleLine = (line) => {
+          if (line.trim()) applyEvent(JSON.parse(line));
+        };
+
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split('\n');
+          buffer = lines.pop();
+          lines.forEach(handleLine);
+        }
+        handleLine(buffer);
+      }
+
+      if (streamError) {
+        setError(streamError);
+        // Boş kalan asistan balonunu kaldır
+        if (!content) setMessages((prev) => prev.slice(0, prev.length - 1));
+      }
 
       // Gönderimden sonra seçili resmi temizle
       clearSelectedFile();
 
-      if (newConvTitle && convId) {
+      // Başlık sunucuda arka planda üretilir: WebSocket açıksa bildirim olarak gelir,
+      // değilse kısa bir süre sonra listeyi yenile
+      if ((newConvTitle || isFirstMessage) && convId && !usedSocket) {
         fetchConversations();
+        setTimeout(fetchConversations, 3000);
       }
     } catch (err) {
-      setError('Mesaj gönderilirken bir hata oluştu.');
+      setError(err.detail || 'Mesaj gönderilirken bir hata oluştu.');
       setMessages((prev) => prev.slice(0, prev.length - 1));
     } finally {
       setIsSending(false);
@@ -622,13 +838,19 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
       }
     };
 
-    // Resim varsa göster
+    // Resim varsa göster (yeni mesajlar blob store'dan imzalı URL ile, eski mesajlar base64)
+    const imageSrc = message.image_url
+      ? `${API}${message.image_url}`
+      : message.image_data
+      ? `data:image/jpeg;base64,${message.image_data}`
+      : null;
+    const thumbSrc = message.thumb_url ? `${API}${message.thumb_url}` : imageSrc;
     const imageElement =
-      message.has_image && message.image_data
+      message.has_image && imageSrc
         ? React.createElement('img', {
-            src: `data:image/jpeg;base64,${message.image_data}`,
+            src: thumbSrc,
             className: 'mt-2 max-h-64 rounded-lg cursor-zoom-in',
-            onClick: () => setPreviewImage(`data:image/jpeg;base64,${message.image_data}`)
+            onClick: () => setPreviewImage(imageSrc)
           })
         : null;
 
@@ -693,12 +915,54 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
           },
           React.createElement(Icon, { name: 'Plus', className: 'w-5 h-5 mr-2' }),
           'Yeni Sohbet'
+        ),
+        // Mesajlarda arama
+        React.createElement(
+          'div',
+          { className: 'mt-3 flex items-center px-3 py-2 rounded-xl bg-gray-100 dark:bg-slate-800' },
+          React.createElement(Icon, { name: 'Search', className: 'w-4 h-4 mr-2' }),
+          React.createElement('input', {
+            type: 'search',
+            value: searchQuery,
+            onChange: (e) => setSearchQuery(e.target.value),
+            placeholder: 'Mesajlarda ara',
+            className: 'flex-1 bg-transparent text-sm text-gray-700 dark:text-gray-200 focus:outline-none'
+          })
         )
       ),
-      // Sohbet Listesi
+      // Sohbet Listesi (arama varken sonuçlar)
       React.createElement(
         'nav',
         { className: 'flex-1 overflow-y-auto px-4 space-y-2 pb-4' },
+        searchResults !== null && searchResults.length === 0 &&
+          React.createElement('p', { className: 'p-3 text-sm text-gray-500 dark:text-gray-400' }, 'Sonuç bulunamadı.'),
+        searchResults !== null &&
+          searchResults.map((hit) =>
+            React.createElement(
+              'a',
+              {
+                key: hit.message_id,
+                href: '#',
+                className: 'block p-3 rounded-xl text-gray-600 dark:text-gray-300 hover:bg-gray-100 dark:hover:bg-slate-800',
+                onClick: (e) => {
+                  e.preventDefault();
+                  openSearchResult(hit);
+                }
+              },
+              React.createElement('span', { className: 'block truncate text-sm font-semibold' }, hit.conversation_title),
+              React.createElement('span', { className: 'block text-xs text-gray-500 dark:text-gray-400' }, hit.snippet)
+            )
+          ),
+        searchResults !== null && searchCursor &&
+          React.createElement(
+            'button',
+            {
+              className: 'w-full p-2 text-sm text-blue-600 hover:bg-gray-100 dark:hover:bg-slate-800 rounded-xl',
+              onClick: fetchMoreSearchResults
+            },
+            'Daha fazla sonuç'
+          ),
+        searchResults === null &&
         conversations.map((conv) =>
           React.createElement(
             'a',
@@ -719,7 +983,16 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
             React.createElement(Icon, { name: 'MessageSquare', className: 'w-4 h-4 mr-3 flex-shrink-0' }),
             React.createElement('span', { className: 'truncate text-sm' }, conv.title)
           )
-        )
+        ),
+        searchResults === null && conversationsCursor &&
+          React.createElement(
+            'button',
+            {
+              className: 'w-full p-2 text-sm text-blue-600 hover:bg-gray-100 dark:hover:bg-slate-800 rounded-xl',
+              onClick: fetchMoreConversations
+            },
+            'Daha fazla sohbet'
+          )
       )
     ),
 
@@ -777,7 +1050,20 @@ const Chat = function ({ token, user, onLogout, theme, onToggleTheme }) {
       React.createElement(
         'main',
         { className: 'flex-1 overflow-y-auto p-6 space-y-4 bg-gray-50 dark:bg-slate-950' },
-        messages.map((msg, index) => React.createElement(Message, { key: index, message: msg })),
+        olderMessagesCursor &&
+          React.createElement(
+            'div',
+            { className: 'flex justify-center' },
+            React.createElement(
+              'button',
+              {
+                className: 'px-4 py-2 text-sm text-blue-600 hover:bg-gray-100 dark:hover:bg-slate-800 rounded-xl',
+                onClick: fetchOlderMessages
+              },
+              'Daha eski mesajları yükle'
+            )
+          ),
+        messages.map((msg, index) => React.createElement(Message, { key: msg.id || index, message: msg })),
         isSending &&
           React.createElement(
             'div',
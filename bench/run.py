@@ -0,0 +1,434 @@
+"""
+AlpineAI yük testi.
+
+Varsayılan olarak yerel Gemini taklidini (stub_gemini.py) ve uygulamayı
+(serve_app.py, bellek içi Mongo) alt süreç olarak başlatır, kullanıcı/konuşma
+verisi hazırlar ve her uç için ayrı ayrı belirtilen eşzamanlılıkla yük uygular.
+Her uç için throughput, p50/p95/p99 gecikme ve sunucu event loop gecikmesi
+raporlanır ve JSON olarak kaydedilir.
+
+Örnekler:
+    python bench/run.py --concurrency 32 --duration 20
+    python bench/run.py --mongo real --mongo-url mongodb://localhost:27017
+    python bench/run.py --stub-latency 0.5 --stub-tokens 200 --endpoints chat,chat_stream
+    python bench/run.py compare bench/results/eski.json bench/results/yeni.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+ENDPOINTS = ["login", "conversations", "messages", "chat", "chat_stream"]
+DEFAULT_ENDPOINTS = ["login", "conversations", "messages", "chat"]
+BENCH_PASSWORD = "bench-password-123"
+
+
+# =========================================================================
+# İSTATİSTİK
+# =========================================================================
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Sıralı listede nearest-rank yüzdelik değeri."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Saniye cinsinden örnekleri milisaniye özetine çevirir."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(ordered, 50) * 1000, 2),
+        "p95": round(percentile(ordered, 95) * 1000, 2),
+        "p99": round(percentile(ordered, 99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+# =========================================================================
+# SÜREÇ YÖNETİMİ
+# =========================================================================
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    """url 200 dönene kadar bekler (uygulama için /ready: Mongo ve LLM ısınması bitti)."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} {timeout:.0f} saniye içinde hazır olmadı")
+
+
+def start_services(args) -> List[subprocess.Popen]:
+    """Gemini taklidini ve uygulamayı alt süreç olarak başlatır."""
+    stub_env = dict(
+        os.environ,
+        STUB_LATENCY=str(args.stub_latency),
+        STUB_TOKENS=str(args.stub_tokens),
+        STUB_TOKEN_DELAY=str(args.stub_token_delay),
+    )
+    stub = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "stub_gemini.py"), str(args.stub_port)],
+        env=stub_env,
+    )
+
+    app_env = dict(
+        os.environ,
+        BENCH_MONGO=args.mongo,
+        MONGO_URL=args.mongo_url,
+        DB_NAME=f"alpine_bench_{uuid.uuid4().hex[:8]}",
+        JWT_SECRET=os.getenv("JWT_SECRET", "bench-secret"),
+        GEMINI_API_KEY="bench",
+        GOOGLE_GEMINI_BASE_URL=f"http://127.0.0.1:{args.stub_port}",
+        BLOB_BACKEND="local" if args.mongo == "memory" else os.getenv("BLOB_BACKEND", "gridfs"),
+        BLOB_DIR=os.getenv("BLOB_DIR", "/tmp/alpine-bench-blobs"),
+        # Kullanıcı başına mesaj sınırı kapalı: aksi halde sohbet uçlarında sınırlayıcı
+        # ölçülür (limiti denemek için ortamda CHAT_RATE_PER_MINUTE verilebilir)
+        CHAT_RATE_PER_MINUTE=os.getenv("CHAT_RATE_PER_MINUTE", "0"),
+    )
+    app = subprocess.Popen(
+        [sys.executable, str(BENCH_DIR / "serve_app.py"), str(args.app_port)],
+        env=app_env,
+        cwd=ROOT_DIR,
+    )
+    return [stub, app]
+
+
+def stop_services(processes: List[subprocess.Popen]) -> None:
+    for proc in processes:
+        proc.terminate()
+    for proc in processes:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# =========================================================================
+# VERİ HAZIRLAMA
+# =========================================================================
+
+async def seed(client: httpx.AsyncClient, api: str, users: int, messages: int) -> List[dict]:
+    """Her sanal kullanıcı için hesap, bir konuşma ve `messages` turluk geçmiş oluşturur."""
+    run_id = uuid.uuid4().hex[:8]
+
+    async def seed_user(i: int) -> dict:
+        email = f"bench-{run_id}-{i}@example.com"
+        r = await client.post(
+            f"{api}/auth/register",
+            json={"full_name": f"Bench {i}", "email": email, "password": BENCH_PASSWORD},
+        )
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = await client.post(f"{api}/chat/conversation", headers=headers)
+        r.raise_for_status()
+        conversation_id = r.json()["id"]
+        for turn in range(messages):
+            r = await client.post(
+                f"{api}/chat/message",
+                headers=headers,
+                data={"conversation_id": conversation_id, "message": f"hazırlık mesajı {turn}"},
+            )
+            r.raise_for_status()
+        return {"email": email, "headers": headers, "conversation_id": conversation_id}
+
+    return await asyncio.gather(*(seed_user(i) for i in range(users)))
+
+
+# =========================================================================
+# SENARYOLAR
+# =========================================================================
+
+def make_scenario(name: str, client: httpx.AsyncClient, api: str) -> Callable[[dict], Awaitable[Optional[float]]]:
+    """
+    Uç için tek bir isteği yapan fonksiyon döndürür. Fonksiyon başarısızlıkta
+    hata fırlatır; stream senaryosunda ilk token süresini (TTFT) döndürür.
+    """
+    async def login(user: dict) -> None:
+        r = await client.post(f"{api}/auth/login", json={"email": user["email"], "password": BENCH_PASSWORD})
+        r.raise_for_status()
+
+    async def conversations(user: dict) -> None:
+        r = await client.get(f"{api}/chat/conversations", headers=user["headers"])
+        r.raise_for_status()
+
+    async def messages(user: dict) -> None:
+        r = await client.get(
+            f"{api}/chat/conversation/{user['conversation_id']}/messages", headers=user["headers"]
+        )
+        r.raise_for_status()
+
+    async def chat(user: dict) -> None:
+        r = await client.post(
+            f"{api}/chat/message",
+            headers=user["headers"],
+            data={"conversation_id": user["conversation_id"], "message": "benchmark mesajı"},
+        )
+        r.raise_for_status()
+
+    async def chat_stream(user: dict) -> float:
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream(
+            "POST",
+            f"{api}/chat/message/stream",
+            headers=user["headers"],
+            data={"conversation_id": user["conversation_id"], "message": "benchmark mesajı"},
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "delta" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event.get("type") == "error":
+                    raise RuntimeError(event.get("detail", "stream error"))
+        return first_token if first_token is not None else time.perf_counter() - start
+
+    return {
+        "login": login,
+        "conversations": conversations,
+        "messages": messages,
+        "chat": chat,
+        "chat_stream": chat_stream,
+    }[name]
+
+
+def retry_after_seconds(error: Exception) -> float:
+    """429/503 yanıtı için Retry-After (başlık yoksa 1 sn); diğer hatalarda 0."""
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code not in (429, 503):
+        return 0.0
+    try:
+        return max(0.0, float(error.response.headers.get("Retry-After", "1")))
+    except ValueError:
+        return 1.0
+
+
+async def run_endpoint(
+    name: str,
+    client: httpx.AsyncClient,
+    base_url: str,
+    users: List[dict],
+    concurrency: int,
+    duration: float,
+    measure_loop_lag: bool,
+) -> dict:
+    """`concurrency` sanal kullanıcıyla `duration` saniye boyunca tek bir uca yük uygular."""
+    api = f"{base_url}/api"
+    scenario = make_scenario(name, client, api)
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors: Dict[str, int] = {}
+
+    if measure_loop_lag:
+        await client.get(f"{base_url}/__bench/loop-lag")  # önceki fazın örneklerini at
+
+    deadline = time.perf_counter() + duration
+
+    async def worker(user: dict) -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ttft = await scenario(user)
+            except Exception as e:
+                key = f"{e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                # Reddedilen isteği hemen tekrarlamak yalnızca 429/503 sayısını şişirir
+                backoff = retry_after_seconds(e)
+                if backoff:
+                    await asyncio.sleep(min(backoff, max(0.0, deadline - time.perf_counter())))
+                continue
+            latencies.append(time.perf_counter() - start)
+            if ttft is not None:
+                first_tokens.append(ttft)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(users[i % len(users)]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": summarize(latencies),
+    }
+    if first_tokens:
+        result["ttft_ms"] = summarize(first_tokens)
+    if measure_loop_lag:
+        r = await client.get(f"{base_url}/__bench/loop-lag")
+        result["loop_lag_ms"] = summarize(r.json()["samples"])
+    return result
+
+
+# =========================================================================
+# RAPOR
+# =========================================================================
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict) -> None:
+    print(f"\n{'endpoint':<14}{'req':>8}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'lag p99':>10}")
+    for name, r in results["endpoints"].items():
+        lat = r["latency_ms"]
+        lag = r.get("loop_lag_ms", {}).get("p99", float("nan"))
+        print(
+            f"{name:<14}{r['requests']:>8}{sum(r['errors'].values()):>6}{r['throughput_rps']:>10.1f}"
+            f"{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}{lag:>10.1f}"
+        )
+    print("(gecikmeler ms)")
+
+
+def compare(base_path: str, new_path: str, threshold: float) -> int:
+    """
+    İki sonuç dosyasını karşılaştırır. Throughput'ta ya da p95'te `threshold`
+    oranından büyük gerileme varsa 1 ile çıkar (CI'da kullanılabilir).
+    """
+    base = json.loads(Path(base_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    print(f"{'endpoint':<14}{'rps':>22}{'p95 ms':>24}{'p99 ms':>24}")
+
+    def delta(old: float, cur: float) -> str:
+        change = (cur - old) / old * 100 if old else 0.0
+        return f"{old:>8.1f} → {cur:<8.1f}{change:+6.1f}%"
+
+    regressed = []
+    for name, cur in new["endpoints"].items():
+        old = base["endpoints"].get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:<14}{delta(old['throughput_rps'], cur['throughput_rps']):>24}"
+            f"{delta(old['latency_ms']['p95'], cur['latency_ms']['p95']):>24}"
+            f"{delta(old['latency_ms']['p99'], cur['latency_ms']['p99']):>24}"
+        )
+        if old["throughput_rps"] and cur["throughput_rps"] < old["throughput_rps"] * (1 - threshold):
+            regressed.append(f"{name} throughput")
+        if old["latency_ms"]["p95"] and cur["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + threshold):
+            regressed.append(f"{name} p95")
+
+    if regressed:
+        print("Gerileme: " + ", ".join(regressed))
+        return 1
+    return 0
+
+
+# =========================================================================
+# GİRİŞ NOKTASI
+# =========================================================================
+
+async def bench(args) -> dict:
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Bilinmeyen uç(lar): {', '.join(sorted(unknown))}. Seçenekler: {', '.join(ENDPOINTS)}")
+
+    processes = []
+    base_url = args.target
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        processes = start_services(args)
+    try:
+        if processes:
+            await wait_until_up(f"{base_url}/ready")
+        limits = httpx.Limits(max_connections=args.concurrency + 8, max_keepalive_connections=args.concurrency + 8)
+        async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+            users = await seed(client, f"{base_url}/api", args.users or args.concurrency, args.seed_messages)
+            results = {}
+            for name in endpoints:
+                print(f"{name}: {args.concurrency} eşzamanlı, {args.duration:.0f} sn...", flush=True)
+                results[name] = await run_endpoint(
+                    name, client, base_url, users, args.concurrency, args.duration,
+                    measure_loop_lag=bool(processes),
+                )
+    finally:
+        stop_services(processes)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "users": args.users or args.concurrency,
+            "seed_messages": args.seed_messages,
+            "mongo": args.mongo if processes else "external",
+            "stub_latency": args.stub_latency,
+            "stub_tokens": args.stub_tokens,
+            "stub_token_delay": args.stub_token_delay,
+        },
+        "endpoints": results,
+    }
+
+
+def main() -> int:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="run.py compare", description="İki benchmark sonucunu karşılaştırır.")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.10, help="İzin verilen gerileme oranı")
+        args = parser.parse_args(sys.argv[2:])
+        return compare(args.base, args.new, args.threshold)
+
+    parser = argparse.ArgumentParser(description="AlpineAI yük testi")
+    parser.add_argument("--endpoints", default=",".join(DEFAULT_ENDPOINTS), help=f"Virgülle ayrılmış: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="Uç başına süre (saniye)")
+    parser.add_argument("--users", type=int, default=0, help="Sanal kullanıcı sayısı (varsayılan: concurrency)")
+    parser.add_argument("--seed-messages", type=int, default=10, help="Kullanıcı başına hazır geçmiş turu")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--target", default=None, help="Çalışan bir sunucuya karşı koş (servisler başlatılmaz)")
+    parser.add_argument("--mongo", choices=["memory", "real"], default="memory")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--stub-port", type=int, default=8865)
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="Gemini ilk token gecikmesi (saniye)")
+    parser.add_argument("--stub-tokens", type=int, default=40, help="Gemini yanıtındaki token sayısı")
+    parser.add_argument("--stub-token-delay", type=float, default=0.01, help="Token'lar arası gecikme (saniye)")
+    parser.add_argument("--output", default=None, help="Sonuç JSON yolu (varsayılan: bench/results/)")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args))
+    print_report(results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Sonuçlar: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark için server.py'yi ayağa kaldırır.
+
+BENCH_MONGO=memory (varsayılan) ise Motor istemcisi mongomock_motor ile
+değiştirilir; BENCH_MONGO=real ise MONGO_URL'deki gerçek/yerel mongod kullanılır.
+
+Uygulamaya event loop gecikmesini ölçen bir görev ve sonuçları okuyan
+/__bench/loop-lag ucu eklenir (yalnızca benchmark sürecinde).
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+if os.getenv("BENCH_MONGO", "memory") == "memory":
+    try:
+        import mongomock_motor
+    except ImportError:
+        sys.exit("BENCH_MONGO=memory için 'pip install mongomock-motor' gerekli (ya da BENCH_MONGO=real kullanın).")
+    import motor.motor_asyncio
+
+    class InMemoryMotorClient(mongomock_motor.AsyncMongoMockClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(tz_aware=kwargs.get("tz_aware", False))
+
+    motor.motor_asyncio.AsyncIOMotorClient = InMemoryMotorClient
+
+# Aşağıdaki import'lar Motor istemcisi değiştirildikten sonra yapılmalı
+import uvicorn  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+import server  # noqa: E402
+
+LOOP_LAG_INTERVAL = 0.01
+
+
+class LoopLagMonitor:
+    """Her LOOP_LAG_INTERVAL'de uyanıp planlanandan ne kadar geç uyandığını kaydeder."""
+
+    def __init__(self):
+        self.samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.samples.append(max(0.0, loop.time() - start - LOOP_LAG_INTERVAL))
+
+    def drain(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+
+monitor = LoopLagMonitor()
+
+
+async def loop_lag(request):
+    """Son okumadan bu yana toplanan gecikme örneklerini döndürür ve sıfırlar."""
+    return JSONResponse({"samples": monitor.drain(), "time": time.time()})
+
+
+@server.app.on_event("startup")
+async def start_loop_lag_monitor():
+    asyncio.create_task(monitor.run())
+
+
+# Frontend'in catch-all route'undan önce eşleşmesi için başa eklenir
+server.app.router.routes.insert(0, Route("/__bench/loop-lag", loop_lag))
+
+
+if __name__ == "__main__":
+    uvicorn.run(server.app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8000, log_level="warning")
@@ -0,0 +1,251 @@
+"""
+Benchmark için yerel Gemini taklidi.
+
+server.py'deki google-genai istemcisi GOOGLE_GEMINI_BASE_URL ile bu sunucuya
+yönlendirilir; generateContent, streamGenerateContent (SSE) ve countTokens
+uçlarını (ve açılış ısınmasındaki model GET'ini) gerçek API'nin yanıt şekliyle karşılar. LLM_BACKENDS'teki litellm
+backend'lerini denemek için OpenAI uyumlu /v1/chat/completions ucu da vardır
+(ör. "litellm:openai/stub" + OPENAI_API_BASE=http://127.0.0.1:<port>/v1).
+Context caching için cachedContents uçları bellekte tutulur; /stats önbellek
+isabet/ıska sayılarını da gösterir.
+
+Ayarlar (ortam değişkenleri):
+    STUB_LATENCY       İlk token'a kadar bekleme (saniye)
+    STUB_TOKENS        Yanıttaki token (kelime) sayısı
+    STUB_TOKEN_DELAY   Stream'de token'lar arası bekleme (saniye)
+    STUB_ERROR_RATE    İsteklerin bu oranı 503 ile reddedilir (failover denemesi)
+    STUB_SLOW_RATE     İsteklerin bu oranı STUB_SLOW_SECONDS kadar geciktirilir (hedging denemesi)
+    STUB_SLOW_SECONDS
+    STUB_CACHE_EVICT_AFTER  Önbellek, bildirilen TTL'den bağımsız bu kadar saniye sonra
+                       sessizce silinir (sağlayıcının erken silmesini denemek için)
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.2"))
+STUB_TOKENS = int(os.getenv("STUB_TOKENS", "40"))
+STUB_TOKEN_DELAY = float(os.getenv("STUB_TOKEN_DELAY", "0.01"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_SLOW_RATE = float(os.getenv("STUB_SLOW_RATE", "0"))
+STUB_SLOW_SECONDS = float(os.getenv("STUB_SLOW_SECONDS", "3"))
+STUB_CACHE_EVICT_AFTER = float(os.getenv("STUB_CACHE_EVICT_AFTER", "0"))
+
+STATS = {
+    "generateContent": 0, "streamGenerateContent": 0, "countTokens": 0, "chatCompletions": 0, "getModel": 0, "errors": 0,
+    "cacheCreated": 0, "cacheUpdated": 0, "cacheDeleted": 0, "cacheHits": 0, "cacheMisses": 0,
+}
+# name -> {"expires": epoch, "evicts": epoch, "tokens": int, "systemInstruction": ...}
+CACHES = {}
+
+
+def inject_fault():
+    """STUB_ERROR_RATE'e göre 503 yanıtı döndürür; yoksa None."""
+    if random.random() < STUB_ERROR_RATE:
+        STATS["errors"] += 1
+        return JSONResponse({"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}}, status_code=503)
+    return None
+
+
+def first_token_delay() -> float:
+    return STUB_LATENCY + (STUB_SLOW_SECONDS if random.random() < STUB_SLOW_RATE else 0.0)
+
+
+def reply_words(body: dict) -> list:
+    system = json.dumps(body.get("systemInstruction", ""))
+    if "title generator" in system:
+        return ["Benchmark", "Sohbeti"]
+    return [f"token{i}" for i in range(STUB_TOKENS)]
+
+
+def payload(text: str, prompt_tokens: int, cached_tokens: int = 0) -> dict:
+    usage = {
+        "promptTokenCount": prompt_tokens + cached_tokens,
+        "candidatesTokenCount": max(1, len(text) // 4),
+        "totalTokenCount": prompt_tokens + cached_tokens + max(1, len(text) // 4),
+    }
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+        "usageMetadata": usage,
+    }
+
+
+def not_found(message: str) -> JSONResponse:
+    return JSONResponse({"error": {"code": 404, "message": message, "status": "NOT_FOUND"}}, status_code=404)
+
+
+def cache_ttl(body: dict) -> float:
+    return float(str(body.get("ttl", "3600s")).rstrip("s"))
+
+
+def cache_resource(name: str) -> dict:
+    cache = CACHES[name]
+    expire = datetime.fromtimestamp(cache["expires"], timezone.utc).isoformat().replace("+00:00", "Z")
+    return {"name": name, "model": cache["model"], "expireTime": expire, "usageMetadata": {"totalTokenCount": cache["tokens"]}}
+
+
+def live_cache(name: str):
+    cache = CACHES.get(name)
+    if cache is not None and min(cache["expires"], cache["evicts"]) <= time.time():
+        del CACHES[name]
+        cache = None
+    return cache
+
+
+async def models(request: Request):
+    _, _, method = request.path_params["rest"].partition(":")
+    body = await request.json()
+    prompt_tokens = len(json.dumps(body)) // 4
+    STATS[method] = STATS.get(method, 0) + 1
+
+    if method == "countTokens":
+        return JSONResponse({"totalTokens": prompt_tokens})
+
+    fault = inject_fault()
+    if fault is not None:
+        return fault
+
+    cached_tokens = 0
+    if body.get("cachedContent"):
+        cache = live_cache(body["cachedContent"])
+        if cache is None:
+            STATS["cacheMisses"] += 1
+            return not_found(f"CachedContent not found: {body['cachedContent']}")
+        if "systemInstruction" in body:
+            return JSONResponse(
+                {"error": {"code": 400, "message": "systemInstruction not allowed with cachedContent", "status": "INVALID_ARGUMENT"}},
+                status_code=400,
+            )
+        STATS["cacheHits"] += 1
+        cached_tokens = cache["tokens"]
+        body = {**body, "systemInstruction": cache["systemInstruction"]}
+
+    words = reply_words(body)
+    if method == "generateContent":
+        await asyncio.sleep(first_token_delay() + STUB_TOKEN_DELAY * len(words))
+        return JSONResponse(payload(" ".join(words), prompt_tokens, cached_tokens))
+
+    if method == "streamGenerateContent":
+        async def events():
+            await asyncio.sleep(first_token_delay())
+            for word in words:
+                yield "data: " + json.dumps(payload(word + " ", prompt_tokens, cached_tokens)) + "\r\n\r\n"
+                await asyncio.sleep(STUB_TOKEN_DELAY)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse({"error": {"code": 404, "message": method, "status": "NOT_FOUND"}}, status_code=404)
+
+
+async def get_model(request: Request):
+    """Model metadata (uygulamanın açılıştaki bağlantı ısınması bunu çağırır)."""
+    STATS["getModel"] += 1
+    name = request.path_params["rest"]
+    return JSONResponse({"name": f"models/{name}", "displayName": name, "inputTokenLimit": 1048576})
+
+
+async def create_cache(request: Request):
+    body = await request.json()
+    name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+    CACHES[name] = {
+        "model": body.get("model"),
+        "expires": time.time() + cache_ttl(body),
+        "evicts": time.time() + STUB_CACHE_EVICT_AFTER if STUB_CACHE_EVICT_AFTER else float("inf"),
+        "tokens": len(json.dumps(body)) // 4,
+        "systemInstruction": body.get("systemInstruction", ""),
+    }
+    STATS["cacheCreated"] += 1
+    return JSONResponse(cache_resource(name))
+
+
+async def cache_item(request: Request):
+    name = f"cachedContents/{request.path_params['cache_id']}"
+    if live_cache(name) is None:
+        return not_found(f"CachedContent not found: {name}")
+    if request.method == "DELETE":
+        del CACHES[name]
+        STATS["cacheDeleted"] += 1
+        return JSONResponse({})
+    if request.method == "PATCH":
+        CACHES[name]["expires"] = time.time() + cache_ttl(await request.json())
+        STATS["cacheUpdated"] += 1
+    return JSONResponse(cache_resource(name))
+
+
+async def chat_completions(request: Request):
+    """OpenAI uyumlu chat completions (litellm backend'leri için)."""
+    body = await request.json()
+    STATS["chatCompletions"] += 1
+    fault = inject_fault()
+    if fault is not None:
+        return fault
+
+    prompt_tokens = len(json.dumps(body)) // 4
+    system = " ".join(str(m.get("content")) for m in body.get("messages", []) if m.get("role") == "system")
+    words = reply_words({"systemInstruction": system})
+    created = int(time.time())
+
+    def completion(delta: dict = None, message: dict = None, finish: str = None) -> dict:
+        choice = {"index": 0, "finish_reason": finish}
+        if delta is not None:
+            choice["delta"] = delta
+        if message is not None:
+            choice["message"] = message
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk" if delta is not None else "chat.completion",
+            "created": created, "model": body.get("model", "stub"), "choices": [choice],
+        }
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token_delay() + STUB_TOKEN_DELAY * len(words))
+        text = " ".join(words)
+        response = completion(message={"role": "assistant", "content": text}, finish="stop")
+        response["usage"] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max(1, len(text) // 4),
+            "total_tokens": prompt_tokens + max(1, len(text) // 4),
+        }
+        return JSONResponse(response)
+
+    async def events():
+        await asyncio.sleep(first_token_delay())
+        for word in words:
+            yield "data: " + json.dumps(completion(delta={"role": "assistant", "content": word + " "})) + "\n\n"
+            await asyncio.sleep(STUB_TOKEN_DELAY)
+        yield "data: " + json.dumps(completion(delta={}, finish="stop")) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def stats(request: Request):
+    return JSONResponse({**STATS, "cachesLive": sum(1 for name in list(CACHES) if live_cache(name))})
+
+
+app = Starlette(
+    routes=[
+        Route("/v1beta/models/{rest:path}", models, methods=["POST"]),
+        Route("/v1beta/models/{rest:path}", get_model, methods=["GET"]),
+        Route("/v1beta/cachedContents", create_cache, methods=["POST"]),
+        Route("/v1beta/cachedContents/{cache_id}", cache_item, methods=["GET", "PATCH", "DELETE"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/stats", stats),
+    ]
+)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765, log_level="warning")
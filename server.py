@@ -2,29 +2,77 @@
 # GEREKLİ KÜTÜPHANE İÇE AKTARMALARI
 # =========================================================================
 import os
+import asyncio
 import secrets
 import io
 import uuid
 import base64
+import hashlib
+import re
+import json
+import time
+import orjson
 import logging
+import math
+import importlib
+import gzip
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request, BackgroundTasks, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse, Response
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+from pymongo.errors import DuplicateKeyError
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from dotenv import load_dotenv
 import bcrypt
 import jwt
+from cachetools import TTLCache
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import ReturnDocument, monitoring
+from starlette.routing import Match, Mount
+from PIL import Image, ImageOps
 
-# Google GenAI kütüphanesini içe aktar
-from google import genai
-from google.genai.errors import APIError
+try:
+    import brotli  # Opsiyonel: yoksa statik dosyalar yalnızca gzip ile sunulur
+except ImportError:
+    brotli = None
+
+# Açılış raporunun başlangıcı (kütüphane import'ları bu ana kadar sürmüş olur)
+STARTUP_STARTED = time.perf_counter()
+
+
+class LazyModule:
+    """İlk öznitelik erişiminde (ya da load() ile) import edilen modül."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+# Google GenAI kütüphanesi: import'u ~1 sn sürdüğünden açılışta arka plandaki
+# thread'de yüklenir (bkz. LLMProviders); modül import'unu yavaşlatmaz
+genai = LazyModule("google.genai")
 
 # =========================================================================
 # ORTAM DEĞİŞKENLERİ VE UYGULAMA TANIMI
@@ -32,7 +80,25 @@ from google.genai.errors import APIError
 
 load_dotenv()
 
-app = FastAPI(title="Alpine AI Backend", version="1.0.0")
+# Modül seviyesinde ilk log çağrısından önce yapılmalı; yoksa logging kendi
+# varsayılanını (WARNING) kurar ve açılıştaki INFO logları kaybolur
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+# JSON çıktısı için ortak orjson ayarları: UTC tarihler "...Z" biçiminde
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson ile JSON yanıtı. Endpoint'ler bunu doğrudan dönerse jsonable_encoder atlanır."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+app = FastAPI(title="Alpine AI Backend", version="1.0.0", default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # =========================================================================
@@ -45,14 +111,310 @@ SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "168"))
 
+# bcrypt ayarları: work factor, hash işlemi için thread sayısı ve bekleyen iş sınırı
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Doğrulanmış kullanıcı önbelleği (worker başına)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+
 # Gemini Model Ayarları
 # (default'u gemini-1.5-flash yaptım, stabil bir model)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
+# LLM gateway ayarları: aynı anda en fazla kaç Gemini çağrısı, çağrı başına süre sınırı
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+# Tüm slotlar doluyken en fazla kaç çağrı sırada bekleyebilir ve ne kadar süre;
+# aşılırsa istek beklemeden 503 ile reddedilir
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Kullanıcı başına sohbet mesajı sınırı (token bucket): dakikada ortalama hız ve anlık patlama.
+# "memory" worker başına sayar; birden çok worker için "mongo" ortak sayaç kullanır.
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "20"))
+CHAT_RATE_BURST = int(os.getenv("CHAT_RATE_BURST", "10"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+# Açılış: LLM bağlantı ısınmasında backend başına süre sınırı, /ready'deki Mongo
+# ping'inin süre sınırı ve açılışta Mongo'ya ulaşılamazsa yeniden denemeler arası en uzun bekleme
+LLM_WARMUP_TIMEOUT_SECONDS = float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "10"))
+READY_PING_TIMEOUT_SECONDS = float(os.getenv("READY_PING_TIMEOUT_SECONDS", "2"))
+MONGO_CONNECT_RETRY_MAX_SECONDS = float(os.getenv("MONGO_CONNECT_RETRY_MAX_SECONDS", "30"))
+
+# Idempotency-Key ile gönderilen mesajların yanıtı bu süre boyunca tekrar oynatılır
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+
+# WebSocket: bağlantı açıldıktan sonra auth mesajı için beklenecek süre
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+
+# Bu boyuttan büyük JSON API yanıtları istemci destekliyorsa gzip ile gönderilir
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+
+# Konuşma geçmişi önbelleği (worker başına): toplam bayt sınırı ve boşta kalma süresi
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+HISTORY_CACHE_TTL_SECONDS = int(os.getenv("HISTORY_CACHE_TTL_SECONDS", "1800"))
+
+# Bağlam penceresi: her turda gönderilen geçmişin token bütçesi.
+# Bütçeye sığmayan eski turlar arka planda özetlenip konuşmaya yazılır.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Önbellek kaçışında Mongo'dan okunacak en fazla son mesaj sayısı
+HISTORY_LOAD_LIMIT = int(os.getenv("HISTORY_LOAD_LIMIT", "200"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", GEMINI_MODEL)
+
+# Başlık üretimi için (daha ucuz bir model seçilebilir)
+TITLE_MODEL = os.getenv("TITLE_MODEL", GEMINI_MODEL)
+
+# LLM yönlendirici: öncelik sırasıyla virgülle ayrılmış backend'ler, "tür:model".
+# Türler: "gemini" (google-genai) ve "litellm" (ör. "litellm:openai/gpt-4o-mini";
+# sağlayıcı anahtarı/adresi litellm'in kendi ortam değişkenlerinden okunur).
+# Bir backend hata verirse ya da devresi açıksa sıradakine geçilir.
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", f"gemini:{GEMINI_MODEL}")
+TITLE_BACKENDS = os.getenv("TITLE_BACKENDS", f"gemini:{TITLE_MODEL},{LLM_BACKENDS}")
+SUMMARY_BACKENDS = os.getenv("SUMMARY_BACKENDS", f"gemini:{SUMMARY_MODEL},{LLM_BACKENDS}")
+# Devre kesici: art arda bu kadar hata -> backend bu süre boyunca atlanır, sonra tekrar denenir
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# Hedging: birincil backend kendi p95 süresinde yanıt vermezse sıradakine de istek atılır,
+# önce biten kazanır. p95 en az LLM_HEDGE_MIN_SAMPLES ölçümden hesaplanır.
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+
+# Gemini context caching: uzun konuşmalarda sistem mesajı + geçmişin değişmeyen
+# başı sağlayıcı tarafında önbelleğe alınır, her turda yalnızca kalan kısım gönderilir.
+# MIN_TOKENS modelin kabul ettiği alt sınırdan küçük olmamalı.
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "4096"))
+# Önbellek dışında kalan kısım bu kadar token'ı geçince önbellek yeniden oluşturulur
+CONTEXT_CACHE_REFRESH_TOKENS = int(os.getenv("CONTEXT_CACHE_REFRESH_TOKENS", "2048"))
+# Konuşma aktif kaldıkça süre uzatılır
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900"))
+
+# Arka plan iş kuyruğu: worker sayısı, kuyruk kapasitesi, iş başına deneme sayısı
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Yüklenen görsellerin saklandığı yer: "gridfs" (Mongo) ya da "local" (BLOB_DIR klasörü)
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "gridfs")
+BLOB_DIR = os.getenv("BLOB_DIR", "./blobs")
+# Görsel URL'lerindeki imzanın ömrü; URL bu süreye yuvarlandığı için 1-2 katı kadar geçerlidir
+BLOB_URL_TTL_SECONDS = int(os.getenv("BLOB_URL_TTL_SECONDS", "21600"))
+
+# Görsel ön işleme: en uzun kenar sınırı, küçük resim boyutu, kalite ve işlem havuzu boyutu
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+IMAGE_THUMB_EDGE = int(os.getenv("IMAGE_THUMB_EDGE", "320"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Silinen konuşmaların arka planda temizlenmesi: parti boyutu, partiler arası bekleme,
+# boşta bekleme süresi ve yeni yüklenmiş görsellerin silinmeden önce bekleme süresi
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE_SECONDS = float(os.getenv("PURGE_BATCH_PAUSE_SECONDS", "0.2"))
+
+# NDJSON içe aktarma: insert_many başına kayıt sayısı ve tek satırın en büyük boyutu (gömülü görsel dahil)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(32 * 1024 * 1024)))
+PURGE_IDLE_SECONDS = float(os.getenv("PURGE_IDLE_SECONDS", "60"))
+PURGE_LEASE_SECONDS = int(os.getenv("PURGE_LEASE_SECONDS", "600"))
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
 # Şifre sıfırlama kodu süresi (dakika)
 PASSWORD_RESET_EXPIRE_MINUTES = int(os.getenv("RESET_CODE_EXPIRE_MINUTES", "15"))
 
+# =========================================================================
+# METRİKLER (PROMETHEUS)
+# =========================================================================
+
+# Gunicorn ile birden çok worker çalışıyorsa PROMETHEUS_MULTIPROC_DIR tanımlanmalı;
+# /metrics o zaman tüm worker'ların değerlerini birleştirir.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP istek süresi (yanıt gövdesi bitene kadar)",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "İşlenmekte olan HTTP istekleri",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "Backend başına LLM deneme süresi; outcome=ok|error|cancelled",
+    ["backend", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Backend'in raporladığı token sayısı; kind=prompt|response|cached (cached, prompt'un önbellekten gelen kısmı)",
+    ["backend", "kind"],
+)
+LLM_CONTEXT_CACHE = Counter(
+    "llm_context_cache_total", "Context cache olayları; result=hit|miss|stale|created|extended|deleted",
+    ["result"],
+)
+LLM_FAILOVERS = Counter(
+    "llm_failovers_total", "Hata ya da açık devre nedeniyle sıradaki backend'e geçişler",
+    ["backend"],
+)
+LLM_HEDGES = Counter(
+    "llm_hedged_requests_total", "p95 aşıldığı için atılan yedek istekler", ["backend"],
+)
+LLM_BREAKER_OPEN = Gauge(
+    "llm_circuit_open", "Backend devresi açık mı (1) kapalı mı (0)", ["backend"], multiprocess_mode="max",
+)
+MONGO_OPERATION_DURATION = Histogram(
+    "mongo_operation_duration_seconds", "Mongo komut süresi",
+    ["collection", "command", "outcome"], buckets=DB_BUCKETS,
+)
+HISTORY_MESSAGES = Histogram(
+    "chat_history_messages", "Tur başına yüklenen geçmiş mesaj sayısı; source=cache|db",
+    ["source"], buckets=(0, 5, 10, 20, 50, 100, 200, 500),
+)
+HISTORY_BYTES = Histogram(
+    "chat_history_bytes", "Tur başına yüklenen geçmişin boyutu (metin + görsel)",
+    ["source"], buckets=(1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 2e7),
+)
+CHAT_TURN_PHASE_DURATION = Histogram(
+    "chat_turn_phase_duration_seconds", "Sohbet turu aşamalarının süresi; phase=prepare|llm|finalize",
+    ["phase"], buckets=LATENCY_BUCKETS,
+)
+WS_CONNECTIONS = Gauge(
+    "websocket_connections", "Açık (doğrulanmış) sohbet WebSocket bağlantıları", multiprocess_mode="livesum",
+)
+REQUESTS_REJECTED = Counter(
+    "requests_rejected_total", "Yük/sınır nedeniyle reddedilen istekler; reason=rate_limit|llm_saturated",
+    ["reason"],
+)
+IDEMPOTENT_REQUESTS = Counter(
+    "chat_idempotent_requests_total",
+    "Idempotency-Key'li mesaj gönderimleri; result=executed|joined|replayed|conflict",
+    ["result"],
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "startup_phase_seconds",
+    "Açılış aşamasının bittiği an (kütüphane import'larından sonra, STARTUP_STARTED'dan itibaren); phase=import|mongo|llm_loaded|llm_warm|ready",
+    ["phase"], multiprocess_mode="max",
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "bcrypt süresi (thread içinde, kuyruk beklemesi hariç)",
+    ["operation"], buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5),
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Her Mongo komutunun süresini koleksiyon ve komut adına göre kaydeder."""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):  # getMore, killCursors vb.
+            collection = event.command.get("collection", "-")
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        MONGO_OPERATION_DURATION.labels(collection, event.command_name, outcome).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def record_llm_usage(
+    backend: str, prompt_tokens: Optional[int], response_tokens: Optional[int], cached_tokens: Optional[int] = None
+) -> None:
+    LLM_TOKENS.labels(backend, "prompt").inc(prompt_tokens or 0)
+    LLM_TOKENS.labels(backend, "response").inc(response_tokens or 0)
+    if cached_tokens:
+        LLM_TOKENS.labels(backend, "cached").inc(cached_tokens)
+
+
+class MetricsMiddleware:
+    """
+    İstekleri route şablonuna göre (/api/chat/conversation/{conversation_id}/...)
+    etiketleyip süre ve eşzamanlı istek sayısını kaydeder. Saf ASGI: streaming
+    yanıtlarda süre, gövdenin son parçası gönderilene kadar ölçülür.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_label(scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return "static" if isinstance(route, Mount) else route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = self._route_label(scope)
+        status_code = 500
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(time.perf_counter() - start)
+
+# =========================================================================
+# AÇILIŞ DURUMU
+# =========================================================================
+
+
+class StartupReport:
+    """
+    Açılış aşamalarının bittiği anı (STARTUP_STARTED'dan itibaren, saniye) tutar.
+    REQUIRED_PHASES tamamlanınca "ready" işaretlenir ve süreler tek satırda loglanır.
+    """
+
+    REQUIRED_PHASES = ("import", "mongo", "llm_loaded", "llm_warm")
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return "ready" in self.phases
+
+    def mark(self, phase: str) -> None:
+        if phase in self.phases:
+            return
+        elapsed = round(time.perf_counter() - STARTUP_STARTED, 3)
+        self.phases[phase] = elapsed
+        STARTUP_PHASE_SECONDS.labels(phase).set(elapsed)
+        if not self.ready and all(p in self.phases for p in self.REQUIRED_PHASES):
+            self.mark("ready")
+            summary = ", ".join(f"{p} {self.phases[p]:.2f}s" for p in self.REQUIRED_PHASES)
+            logging.info(f"Startup complete in {self.phases['ready']:.2f}s ({summary}).")
+
+
+startup_report = StartupReport()
+
 # =========================================================================
 # VERİTABANI BAĞLANTISI
 # =========================================================================
@@ -63,23 +425,210 @@ if not MONGO_URL:
 client = AsyncIOMotorClient(
     MONGO_URL,
     serverSelectionTimeoutMS=8000,  # 8 sn
+    tz_aware=True,  # Tarihler UTC-aware datetime olarak dönsün
+    event_listeners=[MongoCommandMetrics()],
 )
 db = client.get_database(DB_NAME)
 
 
+def utc_now() -> datetime:
+    """
+    Şu anki UTC zamanı, Mongo'nun sakladığı milisaniye hassasiyetine yuvarlanmış olarak.
+    Böylece yazdığımız değer ile okuduğumuz değer birebir aynı kalır.
+    """
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
 @app.on_event("startup")
-async def verify_mongo_connection():
-    """Uygulama açılırken Mongo'ya ping at; hata logla."""
+async def start_mongo_initialization():
+    """
+    Mongo hazırlığı arka planda yapılır; port beklemeden açılır, /ready
+    hazırlık bitene kadar 503 döner.
+    """
+    app.state.mongo_initialization = asyncio.create_task(initialize_mongo())
+
+
+async def wait_for_mongo() -> None:
+    """Mongo'ya ping atar; ulaşılamazsa artan aralıklarla yeniden dener."""
+    delay = 1.0
+    while True:
+        try:
+            await client.admin.command("ping")
+            logging.info("✅ MongoDB bağlantısı başarılı.")
+            return
+        except Exception as e:
+            logging.error(f"❌ MongoDB bağlantı HATASI ({delay:.0f} sn sonra tekrar denenecek): {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MONGO_CONNECT_RETRY_MAX_SECONDS)
+
+
+async def initialize_mongo():
+    """Bağlantı, tarih migration'ı ve indeksler; bitince açılışın "mongo" aşaması tamamlanır."""
+    await wait_for_mongo()
+    try:
+        await migrate_string_dates()
+    except Exception as e:
+        logging.error(f"❌ Date migration failed (will retry on next start): {e}")
+    await ensure_indexes()
+    startup_report.mark("mongo")
+
+    # Büyük olabilir: açılışı bekletmeden arka planda çalışsın
+    app.state.inline_image_migration = asyncio.create_task(migrate_inline_images())
+    app.state.message_user_id_migration = asyncio.create_task(migrate_message_user_ids())
+
+
+# Koleksiyon -> indeks tanımları. create_index idempotent: var olan indeks tekrar oluşturulmaz.
+MONGO_INDEXES: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        {"keys": [("email", 1)], "unique": True},
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("deleted_at", 1)], "partialFilterExpression": {"deleted_at": {"$type": "date"}}},
+    ],
+    "conversations": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("user_id", 1), ("updated_at", -1), ("id", -1)]},
+        # Yalnızca silinmeyi bekleyen konuşmalar (temizleyici kuyruğu)
+        {"keys": [("deleted_at", 1)], "partialFilterExpression": {"deleted_at": {"$type": "date"}}},
+    ],
+    "messages": [
+        {"keys": [("conversation_id", 1), ("created_at", 1), ("id", 1)]},
+        {"keys": [("image_ref", 1)], "sparse": True},
+        {"keys": [("thumb_ref", 1)], "sparse": True},
+        # Arama: user_id eşitliği önekli text indeksi; sorgu yalnızca o kullanıcının
+        # eşleşen mesajlarına bakar. "none": Türkçe/İngilizce karışık metinde kök bulma yok.
+        {"keys": [("user_id", 1), ("content", "text")], "default_language": "none", "name": "user_content_text"},
+    ],
+    "password_reset_codes": [
+        {"keys": [("user_id", 1), ("code", 1)]},
+        # Süresi dolan kodları Mongo kendisi siler
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    # RATE_LIMIT_BACKEND=mongo: boşta kalan kova kayıtları kendiliğinden silinir
+    "rate_limits": [
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    # Idempotency-Key kayıtları (_id = "user_id:key"); IDEMPOTENCY_TTL_SECONDS sonra silinir
+    "idempotency_keys": [
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+}
+
+
+async def ensure_indexes():
+    """Gerekli indeksleri oluşturur. Bir indeks hata verirse diğerleri yine denenir."""
+    for collection_name, specs in MONGO_INDEXES.items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                await db[collection_name].create_index(spec["keys"], **options)
+            except Exception as e:
+                logging.error(f"Index creation failed ({collection_name} {spec['keys']}): {e}")
+    logging.info("MongoDB indexes ensured.")
+
+
+# Eskiden ISO string olarak saklanan tarih alanları
+STRING_DATE_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at"],
+    "conversations": ["created_at", "updated_at", "summarized_until"],
+    "messages": ["created_at"],
+    "password_reset_codes": ["expires_at"],
+    "blobs": ["created_at", "last_ref_at"],
+}
+
+
+async def migrate_string_dates():
+    """
+    Tek seferlik migrasyon: ISO string tarihleri native BSON Date'e çevirir
+    (TTL indeksleri ve aralık sorguları için gerekli). Tamamlanınca
+    `migrations` koleksiyonuna işaret bırakır; sonraki açılışlarda atlanır.
+    """
+    migration_id = "bson_dates_v1"
+    if await db.migrations.find_one({"_id": migration_id}):
+        return
+
+    for collection_name, fields in STRING_DATE_FIELDS.items():
+        for field in fields:
+            result = await db[collection_name].update_many(
+                {field: {"$type": "string"}},
+                [{"$set": {field: {"$toDate": f"${field}"}}}],
+            )
+            if result.modified_count:
+                logging.info(f"Migrated {result.modified_count} {collection_name}.{field} values to BSON dates.")
+
+    await db.migrations.insert_one({"_id": migration_id, "applied_at": utc_now()})
+
+
+async def migrate_inline_images():
+    """
+    Tek seferlik, arka planda çalışan migrasyon: mesajların içinde base64 olarak
+    duran eski görselleri blob store'a taşır ve `image_data` alanını kaldırır.
+    Listeleme uçları artık `image_data` döndürmediği için eski görseller de
+    `image_ref` üzerinden görünür kalır.
+    """
+    migration_id = "inline_images_to_blobs_v1"
+    if await db.migrations.find_one({"_id": migration_id}):
+        return
+
+    moved = 0
+    try:
+        cursor = db.messages.find(
+            {"image_data": {"$type": "string"}},
+            {"_id": 1, "image_data": 1, "image_mime": 1},
+        )
+        async for msg in cursor:
+            try:
+                image_bytes = base64.b64decode(msg["image_data"])
+            except Exception as e:
+                logging.warning(f"Skipping undecodable inline image {msg['_id']}: {e}")
+                continue
+            mime_type = msg.get("image_mime") or sniff_image_mime(image_bytes) or "image/jpeg"
+            image_ref = await blob_store.put(image_bytes, mime_type)
+            await db.messages.update_one(
+                {"_id": msg["_id"]},
+                {"$set": {"image_ref": image_ref, "image_mime": mime_type}, "$unset": {"image_data": ""}},
+            )
+            moved += 1
+    except Exception as e:
+        logging.error(f"Inline image migration interrupted after {moved} messages: {e}")
+        return
+
+    await db.migrations.insert_one({"_id": migration_id, "applied_at": utc_now()})
+    logging.info(f"Moved {moved} inline images to the blob store.")
+
+
+async def migrate_message_user_ids():
+    """
+    Tek seferlik, arka planda çalışan migrasyon: arama indeksi için eski
+    mesajlara konuşmanın sahibini (`user_id`) yazar. Konuşma başına tek
+    update_many; (conversation_id, ...) indeksini kullanır.
+    """
+    migration_id = "message_user_ids_v1"
+    if await db.migrations.find_one({"_id": migration_id}):
+        return
+
+    updated = 0
     try:
-        await client.admin.command("ping")
-        logging.info("✅ MongoDB bağlantısı başarılı.")
+        async for conversation in db.conversations.find({}, {"_id": 0, "id": 1, "user_id": 1}):
+            result = await db.messages.update_many(
+                {"conversation_id": conversation["id"], "user_id": {"$exists": False}},
+                {"$set": {"user_id": conversation["user_id"]}},
+            )
+            updated += result.modified_count
     except Exception as e:
-        logging.error(f"❌ MongoDB bağlantı HATASI: {e}")
+        logging.error(f"Message user_id migration interrupted after {updated} messages: {e}")
+        return
+
+    await db.migrations.insert_one({"_id": migration_id, "applied_at": utc_now()})
+    logging.info(f"Backfilled user_id on {updated} messages.")
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """MongoDB bağlantısını kapatır."""
+    initialization = getattr(app.state, "mongo_initialization", None)
+    if initialization is not None:
+        initialization.cancel()
     client.close()
     logging.info("MongoDB connection closed.")
 
@@ -93,7 +642,9 @@ class User(BaseModel):
     email: EmailStr
     hashed_password: str
     is_active: bool = True
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Şifre sıfırlamada artar; token'daki "tv" claim'i bununla eşleşmezse token geçersizdir
+    token_version: int = 0
+    created_at: datetime = Field(default_factory=utc_now)
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
@@ -111,11 +662,15 @@ class UserLogin(BaseModel):
 class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     conversation_id: str
+    user_id: Optional[str] = None  # Konuşmanın sahibi; arama indeksi bununla kapsamlanır
     role: str  # 'user' or 'assistant'
     content: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
     has_image: bool = False
-    image_data: Optional[str] = None  # Base64 string
+    image_data: Optional[str] = None  # Base64 string (eski kayıtlar; yeni mesajlar image_ref kullanır)
+    image_ref: Optional[str] = None  # Blob store'daki SHA-256 anahtarı
+    image_mime: Optional[str] = None
+    thumb_ref: Optional[str] = None  # Sohbet ekranı için küçük resim
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
@@ -123,8 +678,13 @@ class Conversation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     title: str = "New Chat Topic"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+    # Bağlam penceresinin dışında kalan eski turların özeti
+    summary: Optional[str] = None
+    summarized_until: Optional[datetime] = None  # Özete katılan son mesajın created_at değeri
+    # Soft delete: dolu ise konuşma gizlidir, mesajları arka planda silinir
+    deleted_at: Optional[datetime] = None
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 
@@ -137,6 +697,73 @@ class ChatMessageRequest(BaseModel):
         return cls(conversation_id=conversation_id, message=message)
 
 
+# Yanıt şemaları: yalnızca istemcinin kullandığı alanlar. Listeleme
+# projeksiyonları bunlardan türetilir; ağır/iç alanlar Mongo'dan hiç okunmaz.
+class MessageOut(BaseModel):
+    id: str
+    conversation_id: str
+    role: str
+    content: str
+    created_at: datetime
+    has_image: bool = False
+    image_ref: Optional[str] = None
+    image_mime: Optional[str] = None
+    thumb_ref: Optional[str] = None
+    # API köküne göre kısa ömürlü imzalı görsel adresleri (kayıtta tutulmaz, yanıtta üretilir)
+    image_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+
+
+class ConversationOut(BaseModel):
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class MessagePage(BaseModel):
+    items: List[MessageOut]
+    next_cursor: Optional[str] = None
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationOut]
+    next_cursor: Optional[str] = None
+
+
+class ChatTurnOut(BaseModel):
+    user_message: MessageOut
+    assistant_message: MessageOut
+
+
+class SearchHit(BaseModel):
+    message_id: str
+    conversation_id: str
+    conversation_title: str
+    role: str
+    snippet: str
+    created_at: datetime
+    score: float
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+
+MESSAGE_OUT_FIELDS = set(MessageOut.model_fields) - {"image_url", "thumb_url"}
+CONVERSATION_OUT_FIELDS = set(ConversationOut.model_fields)
+
+
+def projection_for(fields: set) -> Dict[str, int]:
+    return {"_id": 0, **{field: 1 for field in sorted(fields)}}
+
+
+def message_out(message: Message) -> Dict[str, Any]:
+    """Message modelini yanıt şemasına indirger (image_data vb. gönderilmez)."""
+    return with_blob_urls(message.model_dump(include=MESSAGE_OUT_FIELDS), message.user_id)
+
+
 # Şifre sıfırlama için modeller
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
@@ -154,26 +781,135 @@ class ResetPasswordRequest(BaseModel):
 security = HTTPBearer()
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """JWT token'dan kullanıcıyı doğrular."""
+class PasswordHasherBusy(Exception):
+    """Şifre işlem kuyruğu dolu; istek hemen reddedilir."""
+
+
+class PasswordHasher:
+    """
+    bcrypt hash/doğrulama işlerini event loop dışında, sınırlı bir thread
+    havuzunda çalıştırır (bcrypt çalışırken GIL'i bırakır). Bekleyen iş sayısı
+    `max_pending`'e ulaşınca yeni istekler beklemeden reddedilir.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_pending: int):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusy()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def _hash_sync(self, password: str) -> str:
+        with PASSWORD_HASH_DURATION.labels("hash").time():
+            return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)).decode("utf-8")
+
+    @staticmethod
+    def _verify_sync(password: str, hashed_password: str) -> bool:
+        with PASSWORD_HASH_DURATION.labels("verify").time():
+            return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash_sync, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self._verify_sync, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Hash'in work factor'ü ("$2b$12$..." içindeki 12) ayardan farklı mı?"""
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+def password_hasher_busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Sunucu şu anda yoğun. Lütfen birkaç saniye sonra tekrar deneyin.",
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_password_hasher():
+    """bcrypt thread havuzunu kapatır."""
+    password_hasher.shutdown()
+
+
+# user_id -> User. Her istekte Mongo'ya gidip modeli yeniden doğrulamamak için.
+user_cache: "TTLCache[str, User]" = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    """Şifre değişimi / hesap kapatma sonrası kullanıcıyı önbellekten çıkarır."""
+    user_cache.pop(user_id, None)
+
+
+def create_access_token(user: User) -> str:
+    """Kullanıcı için JWT üretir; "tv" claim'i token_version'ı taşır."""
+    return jwt.encode(
+        {
+            "user_id": user.id,
+            "tv": user.token_version,
+            "exp": datetime.now(timezone.utc) + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS),
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+async def authenticate_token(token: str) -> User:
+    """JWT token'dan kullanıcıyı doğrular (HTTP ve WebSocket ortak)."""
     if not SECRET_KEY:
         raise HTTPException(status_code=500, detail="Server config error: SECRET_KEY not set")
 
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+        token_version = payload.get("tv", 0)
+
+        user = user_cache.get(user_id)
+        # Token önbellektekinden yeniyse başka bir worker şifreyi değiştirmiştir: yeniden yükle
+        if user is None or user.token_version < token_version:
+            user_doc = await db.users.find_one({"id": user_id})
+            if user_doc is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+            # Kendi yazdığımız doküman: doğrulama yapmadan modele aktar
+            user = User.model_construct(**user_doc)
+            user_cache[user_id] = user
 
-        user_doc = await db.users.find_one({"id": user_id})
-        if user_doc is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        if not user.is_active:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive")
+        if user.token_version != token_version:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
-        return User(**user_doc)
+        return user
 
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    """Bearer token'dan kullanıcıyı doğrular."""
+    return await authenticate_token(credentials.credentials)
+
 # =========================================================================
 # AUTH + ŞİFRE SIFIRLAMA ENDPOINTLERİ
 # =========================================================================
@@ -194,23 +930,25 @@ async def register_user(user_data: UserCreate):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = bcrypt.hashpw(user_data.password.encode("utf-8"), bcrypt.gensalt())
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy_error()
 
     new_user = User(
         full_name=user_data.full_name,
         email=user_data.email,
-        hashed_password=hashed_password.decode("utf-8"),
+        hashed_password=hashed_password,
     )
 
     user_dict = new_user.model_dump()
-    user_dict["created_at"] = user_dict["created_at"].isoformat()
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Aynı e-postayla eşzamanlı kayıt: kontrolden sonra öbürü önce yazdı (unique index)
+        raise HTTPException(status_code=400, detail="Email already registered")
 
-    access_token = jwt.encode(
-        {"user_id": new_user.id, "exp": datetime.now(timezone.utc) + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)},
-        SECRET_KEY,
-        algorithm=ALGORITHM,
-    )
+    access_token = create_access_token(new_user)
 
     return {
         "access_token": access_token,
@@ -223,23 +961,38 @@ async def register_user(user_data: UserCreate):
     }
 
 
+async def rehash_password(user_id: str, password: str):
+    """Kullanıcının şifresini güncel BCRYPT_ROUNDS ile yeniden hashler."""
+    try:
+        hashed_password = await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        # Bir sonraki girişte yeniden denenir
+        return
+    await db.users.update_one({"id": user_id}, {"$set": {"hashed_password": hashed_password}})
+    logging.info(f"Password rehashed for user {user_id} (rounds={password_hasher.rounds}).")
+
+
 @api_router.post("/auth/login")
-async def login_user(login_data: UserLogin):
+async def login_user(login_data: UserLogin, background_tasks: BackgroundTasks):
     """Kullanıcı girişi."""
     user_doc = await db.users.find_one({"email": login_data.email})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    user = User(**user_doc)
+    user = User.model_construct(**user_doc)
 
-    if not bcrypt.checkpw(login_data.password.encode("utf-8"), user.hashed_password.encode("utf-8")):
+    try:
+        password_ok = await password_hasher.verify(login_data.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy_error()
+    if not password_ok:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    access_token = jwt.encode(
-        {"user_id": user.id, "exp": datetime.now(timezone.utc) + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)},
-        SECRET_KEY,
-        algorithm=ALGORITHM,
-    )
+    # BCRYPT_ROUNDS değiştiyse şifreyi yanıt döndükten sonra yeni maliyetle yeniden hashle
+    if password_hasher.needs_rehash(user.hashed_password):
+        background_tasks.add_task(rehash_password, user.id, login_data.password)
+
+    access_token = create_access_token(user)
 
     return {
         "access_token": access_token,
@@ -267,7 +1020,7 @@ async def forgot_password(req: ForgotPasswordRequest):
 
     # 6 haneli kod üret
     code = f"{secrets.randbelow(10**6):06d}"
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=PASSWORD_RESET_EXPIRE_MINUTES)
+    expires_at = utc_now() + timedelta(minutes=PASSWORD_RESET_EXPIRE_MINUTES)
 
     # Eski kodları temizle
     await db.password_reset_codes.delete_many({"user_id": user.id})
@@ -276,7 +1029,7 @@ async def forgot_password(req: ForgotPasswordRequest):
         "user_id": user.id,
         "email": user.email,
         "code": code,
-        "expires_at": expires_at.isoformat()
+        "expires_at": expires_at
     })
 
     await send_reset_code_email(user.email, code)
@@ -299,21 +1052,25 @@ async def reset_password(req: ResetPasswordRequest):
     if not code_doc:
         raise HTTPException(status_code=400, detail="Geçersiz kod veya email")
 
-    # Süre dolmuş mu kontrol et
-    try:
-        expires_at = datetime.fromisoformat(code_doc["expires_at"])
-        if expires_at < datetime.now(timezone.utc):
-            raise HTTPException(status_code=400, detail="Doğrulama kodunun süresi dolmuş")
-    except Exception:
+    # Süre dolmuş mu kontrol et (TTL indeksi silene kadar geçen kısa süre için)
+    expires_at = code_doc.get("expires_at")
+    if not isinstance(expires_at, datetime):
         raise HTTPException(status_code=400, detail="Geçersiz doğrulama kaydı")
+    if expires_at < datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Doğrulama kodunun süresi dolmuş")
 
     # Yeni şifre hashle
-    hashed_password = bcrypt.hashpw(req.new_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    try:
+        hashed_password = await password_hasher.hash(req.new_password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy_error()
 
+    # token_version artınca eski token'lar geçersiz olur
     await db.users.update_one(
         {"id": user.id},
-        {"$set": {"hashed_password": hashed_password}}
+        {"$set": {"hashed_password": hashed_password}, "$inc": {"token_version": 1}}
     )
+    invalidate_user_cache(user.id)
 
     # Kullanılan kodu sil
     await db.password_reset_codes.delete_many({"user_id": user.id})
@@ -331,157 +1088,2174 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     }
 
 # =========================================================================
-# GEMINI CLIENT VE HELPER FONKSİYONLARI
+# GÖRSEL DEPOSU (CONTENT-ADDRESSED BLOB STORE)
 # =========================================================================
 
-try:
-    if GEMINI_API_KEY:
-        gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-        logging.info("Gemini client başarıyla başlatıldı.")
-    else:
-        logging.error("Gemini istemcisi başlatılamadı: GEMINI_API_KEY ortam değişkeni tanımlı değil.")
-        gemini_client = None
-except Exception as e:
-    logging.error(f"Gemini istemcisi başlatılamadı: {e}")
-    gemini_client = None
+BLOB_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
 
 
-async def get_gemini_chat_history(conversation_id: str) -> List[Any]:
-    """Konuşma geçmişini Gemini formatında döner."""
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id},
-        {"_id": 0, "role": 1, "content": 1, "image_data": 1, "has_image": 1},
-    ).sort("created_at", 1).to_list(1000)
+class GridFSBlobBackend:
+    """Blob baytlarını GridFS'te, _id = SHA-256 olacak şekilde saklar."""
 
-    history: List[Any] = []
+    def __init__(self, database):
+        self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name="blobs")
 
-    for msg in messages:
-        parts: List[Any] = []
+    async def write(self, blob_hash: str, data: bytes) -> None:
+        try:
+            await self._bucket.upload_from_stream_with_id(blob_hash, blob_hash, data)
+        except DuplicateKeyError:
+            # Aynı içerik eşzamanlı yüklendi; zaten mevcut
+            pass
 
-        # Metni Part'e çevir
-        parts.append(
-            genai.types.Part.from_text(
-                text=msg["content"]
-            )
-        )
+    async def read(self, blob_hash: str) -> Optional[bytes]:
+        try:
+            grid_out = await self._bucket.open_download_stream(blob_hash)
+        except NoFile:
+            return None
+        return await grid_out.read()
 
-        # Eğer görsel varsa onu da ekle
-        if msg.get("has_image") and msg.get("image_data"):
-            try:
-                image_bytes = base64.b64decode(msg["image_data"])
-                parts.append(
-                    genai.types.Part.from_bytes(
-                        data=image_bytes,
-                        mime_type="image/jpeg",  # istersen burada mime type'ı dinamikleştirebilirsin
-                    )
-                )
-            except Exception as e:
-                logging.warning(f"Failed to decode image data for history: {e}")
+    async def delete(self, blob_hash: str) -> None:
+        try:
+            await self._bucket.delete(blob_hash)
+        except NoFile:
+            pass
 
-        gemini_role = "user" if msg["role"] == "user" else "model"
 
-        # Content objesi oluştur
-        content = genai.types.Content(
-            role=gemini_role,
-            parts=parts,
-        )
+class LocalBlobBackend:
+    """Blob baytlarını yerel klasörde `<ilk 2 karakter>/<hash>` yolunda saklar."""
 
-        history.append(content)
+    def __init__(self, directory: str):
+        self._root = Path(directory)
 
-    return history
+    def _path(self, blob_hash: str) -> Path:
+        return self._root / blob_hash[:2] / blob_hash
 
+    def _write_sync(self, blob_hash: str, data: bytes) -> None:
+        path = self._path(blob_hash)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
 
-async def generate_title_from_message(first_message: str) -> str:
-    """İlk mesajdan başlık oluşturur."""
-    if not gemini_client:
-        return "New Chat Topic"
+    def _read_sync(self, blob_hash: str) -> Optional[bytes]:
+        try:
+            return self._path(blob_hash).read_bytes()
+        except FileNotFoundError:
+            return None
 
-    system_instruction = (
-        "You are a title generator AI. Your sole purpose is to take the user's first message in a chat and "
-        "generate a concise, descriptive, and human-readable title (max 5-7 words, NO punctuation marks like "
-        "quotes or periods at the end). Respond ONLY with the title."
-    )
+    def _delete_sync(self, blob_hash: str) -> None:
+        try:
+            self._path(blob_hash).unlink()
+        except FileNotFoundError:
+            pass
 
-    try:
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[f"Generate a title for this chat: '{first_message}'"],
-            config=genai.types.GenerateContentConfig(
-                system_instruction=system_instruction
-            ),
-        )
+    async def write(self, blob_hash: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write_sync, blob_hash, data)
 
-        title = response.text.strip().replace('"', "").replace("'", "").replace(".", "")
+    async def read(self, blob_hash: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read_sync, blob_hash)
 
-        # Çok saçma uzun başlık üretirse fallback
-        if len(title.split()) > 7:
-            return "New Chat Topic"
+    async def delete(self, blob_hash: str) -> None:
+        await asyncio.to_thread(self._delete_sync, blob_hash)
 
-        return title
 
-    except APIError as e:
-        logging.error(f"Gemini API Error (Title generation): {e}")
-        return "New Chat Topic"
-    except Exception as e:
-        logging.error(f"Title generation failed: {e}")
-        return "New Chat Topic"
+class BlobStore:
+    """
+    SHA-256 ile adreslenen görsel deposu. Aynı içerik yalnızca bir kez saklanır;
+    mesajlar sadece hash'i (image_ref) tutar. Tip/boyut bilgisi `db.blobs`
+    koleksiyonunda, baytlar seçilen backend'de durur.
+    """
 
-# =========================================================================
-# CHAT ENDPOINTS
-# =========================================================================
+    def __init__(self, database, backend):
+        self._meta = database.blobs
+        self._backend = backend
 
-@api_router.post("/chat/conversation")
-async def create_conversation(current_user: User = Depends(get_current_user)):
-    """Yeni konuşma oluşturur."""
-    new_conv = Conversation(user_id=current_user.id)
-    conv_dict = new_conv.model_dump()
-    conv_dict["created_at"] = conv_dict["created_at"].isoformat()
-    conv_dict["updated_at"] = conv_dict["updated_at"].isoformat()
-    await db.conversations.insert_one(conv_dict)
-    return new_conv
-
-
-@api_router.get("/chat/conversations")
-async def get_conversations(current_user: User = Depends(get_current_user)):
-    """Kullanıcının konuşmalarını listeler."""
-    conversations = await db.conversations.find(
-        {"user_id": current_user.id},
-        {"_id": 0},
-    ).sort("updated_at", -1).to_list(100)
-    return conversations
-
-
-@api_router.get("/chat/conversation/{conversation_id}/messages")
-async def get_messages(conversation_id: str, current_user: User = Depends(get_current_user)):
-    """Belirli bir konuşmanın mesajlarını döner."""
-    conversation = await db.conversations.find_one({"id": conversation_id, "user_id": current_user.id})
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        now = utc_now()
 
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id},
-        {"_id": 0},
-    ).sort("created_at", 1).to_list(1000)
-    return messages
+        existing = await self._meta.find_one({"_id": blob_hash}, {"_id": 1})
+        if existing is None:
+            # Önce baytlar, sonra metadata: metadata görünen her blob okunabilir olur
+            await self._backend.write(blob_hash, data)
 
+        await self._meta.update_one(
+            {"_id": blob_hash},
+            {
+                "$setOnInsert": {"content_type": content_type, "size": len(data), "created_at": now},
+                "$set": {"last_ref_at": now},
+            },
+            upsert=True,
+        )
+        return blob_hash
+
+    async def get(self, blob_hash: str) -> Optional[Tuple[bytes, str]]:
+        meta = await self._meta.find_one({"_id": blob_hash})
+        if meta is None:
+            return None
+        data = await self._backend.read(blob_hash)
+        if data is None:
+            return None
+        return data, meta["content_type"]
+
+    async def touch(self, blob_hash: str) -> bool:
+        """Blob varsa son kullanım zamanını yeniler (GC'den korur) ve True döner."""
+        result = await self._meta.update_one({"_id": blob_hash}, {"$set": {"last_ref_at": utc_now()}})
+        return result.matched_count > 0
+
+    async def delete(self, blob_hash: str) -> None:
+        await self._meta.delete_one({"_id": blob_hash})
+        await self._backend.delete(blob_hash)
+
+
+blob_store = BlobStore(
+    db,
+    LocalBlobBackend(BLOB_DIR) if BLOB_BACKEND == "local" else GridFSBlobBackend(db),
+)
 
-@api_router.post("/chat/message")
-async def send_message(
-    chat_req: ChatMessageRequest = Depends(ChatMessageRequest.as_form),
-    file: Optional[UploadFile] = File(None),
-    current_user: User = Depends(get_current_user),
+
+def blob_token(blob_hash: str, user_id: str) -> str:
+    """
+    Tek bir blob için kısa ömürlü imza. Bitiş zamanı BLOB_URL_TTL_SECONDS'lık
+    pencereye yuvarlanır: URL pencere boyunca değişmez, tarayıcı önbelleği tutar.
+    """
+    window = int(time.time()) // BLOB_URL_TTL_SECONDS
+    return jwt.encode(
+        {"scope": "blob", "b": blob_hash, "u": user_id, "exp": (window + 2) * BLOB_URL_TTL_SECONDS},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+def with_blob_urls(message: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Mesaj yanıtına <img> etiketlerinin kullanacağı imzalı image_url / thumb_url ekler."""
+    for ref_field, url_field in (("image_ref", "image_url"), ("thumb_ref", "thumb_url")):
+        if message.get(ref_field):
+            message[url_field] = f"/blobs/{message[ref_field]}?t={blob_token(message[ref_field], user_id)}"
+    return message
+
+
+def verify_blob_token(token: str, blob_hash: str) -> str:
+    """İmzayı doğrular ve URL'nin üretildiği kullanıcının id'sini döner."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired image link")
+    if payload.get("scope") != "blob" or payload.get("b") != blob_hash or not payload.get("u"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired image link")
+    return payload["u"]
+
+
+async def user_owns_blob(user_id: str, blob_hash: str) -> bool:
+    """Kullanıcının silinmemiş bir konuşmasında bu görseli (ya da küçük resmi) kullanan mesaj var mı?"""
+    conversation_ids = await db.messages.distinct(
+        "conversation_id", {"user_id": user_id, "$or": [{"image_ref": blob_hash}, {"thumb_ref": blob_hash}]}
+    )
+    if not conversation_ids:
+        return False
+    return await db.conversations.count_documents(
+        {"id": {"$in": conversation_ids}, "user_id": user_id, "deleted_at": None}, limit=1
+    ) > 0
+
+
+blob_security = HTTPBearer(auto_error=False)
+
+
+@api_router.get("/blobs/{blob_hash}")
+async def get_blob(
+    blob_hash: str,
+    request: Request,
+    t: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(blob_security),
+):
+    """
+    Görsel baytlarını döner; yalnızca görseli silinmemiş bir konuşmadaki kendi
+    mesajında kullanan kullanıcıya. <img> etiketleri header gönderemediği için
+    mesaj yanıtlarındaki imzalı URL (?t=) kabul edilir; API istemcileri bearer
+    token da kullanabilir. Sahip olunmayan görsel için 404 döner (varlığı
+    açığa çıkmaz). İçerik hash ile adreslendiği için yanıt hiç değişmez:
+    uzun süreli önbelleklenir ve If-None-Match ile 304 döner.
+    """
+    if not BLOB_HASH_RE.match(blob_hash):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    if t is not None:
+        user_id = verify_blob_token(t, blob_hash)
+    elif credentials is not None:
+        user_id = (await authenticate_token(credentials.credentials)).id
+    else:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    if not await user_owns_blob(user_id, blob_hash):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    etag = f'"{blob_hash}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    blob = await blob_store.get(blob_hash)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    data, content_type = blob
+    return Response(content=data, media_type=content_type, headers=cache_headers)
+
+# =========================================================================
+# GÖRSEL ÖN İŞLEME (PILLOW, PROCESS POOL)
+# =========================================================================
+
+
+class InvalidImageError(Exception):
+    """Yüklenen dosya çözülebilir bir görsel değil."""
+
+
+def _encode_image(img: "Image.Image", max_edge: int, quality: int) -> Tuple[bytes, str]:
+    """Görseli küçültüp metadata olmadan yeniden kodlar; şeffaflık varsa WEBP, yoksa JPEG."""
+    img = img.copy()
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    buf = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img.convert("RGBA").save(buf, format="WEBP", quality=quality, method=4)
+        return buf.getvalue(), "image/webp"
+
+    img.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue(), "image/jpeg"
+
+
+def _normalize_image(data: bytes, max_edge: int, thumb_edge: int, quality: int) -> Dict[str, Any]:
+    """
+    Process pool içinde çalışır: gerçek formatı tespit eder, EXIF yönünü uygular,
+    boyutu sınırlar, metadata'yı atar ve bir küçük resim üretir.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            source_format = img.format
+            img.load()  # Animasyonlu görsellerde ilk kare
+            img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        raise InvalidImageError(str(e))
+
+    image_bytes, mime_type = _encode_image(img, max_edge, quality)
+    thumb_bytes, thumb_mime = _encode_image(img, thumb_edge, quality)
+    return {
+        "data": image_bytes,
+        "mime_type": mime_type,
+        "thumb_data": thumb_bytes,
+        "thumb_mime_type": thumb_mime,
+        "source_format": source_format,
+        "width": img.width,
+        "height": img.height,
+    }
+
+
+def sniff_image_mime(data: bytes) -> Optional[str]:
+    """Görselin gerçek MIME tipini başlığından okur (eski kayıtlar için)."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return Image.MIME.get(img.format)
+    except Exception:
+        return None
+
+
+_image_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def normalize_image(data: bytes) -> Dict[str, Any]:
+    """CPU ağırlıklı görsel işlemeyi event loop dışında, ayrı process'lerde çalıştırır."""
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _image_pool, _normalize_image, data, IMAGE_MAX_EDGE, IMAGE_THUMB_EDGE, IMAGE_QUALITY
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_image_pool():
+    """Görsel işleme havuzunu kapatır."""
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+
+# =========================================================================
+# ARKA PLAN İŞ KUYRUĞU
+# =========================================================================
+
+
+class BackgroundJobQueue:
+    """
+    Yanıt yolunu bekletmemesi gereken işler (başlık üretimi, özet yenileme) için
+    process içi iş kuyruğu. Sabit sayıda worker çalışır; hata veren iş üstel
+    bekleme ile `max_attempts` kez denenir. Aynı `key` ile bekleyen bir iş
+    varken yenisi eklenmez. Kuyruk doluysa iş düşürülür (log'lanır).
+    """
+
+    def __init__(self, workers: int, max_size: int, max_attempts: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._queue: "asyncio.Queue[Tuple[str, Callable[[], Awaitable[Any]]]]" = asyncio.Queue(maxsize=max_size)
+        self._pending_keys: set = set()
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Bekleyen işlerin bitmesini `drain_timeout` saniyeye kadar bekler, sonra worker'ları durdurur."""
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Background job queue stopped with {self._queue.qsize()} pending jobs")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]]) -> bool:
+        if key in self._pending_keys:
+            return False
+        try:
+            self._queue.put_nowait((key, job))
+        except asyncio.QueueFull:
+            logging.warning(f"Background job queue full; dropping job {key}")
+            return False
+        self._pending_keys.add(key)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key, job = await self._queue.get()
+            try:
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        await job()
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        if attempt == self.max_attempts:
+                            logging.error(f"Background job {key} failed after {attempt} attempts: {e}")
+                        else:
+                            logging.warning(f"Background job {key} failed (attempt {attempt}): {e}")
+                            await asyncio.sleep(2 ** attempt)
+            finally:
+                self._pending_keys.discard(key)
+                self._queue.task_done()
+
+
+job_queue = BackgroundJobQueue(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_MAX_ATTEMPTS)
+
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+# =========================================================================
+# GEMINI CLIENT VE HELPER FONKSİYONLARI
+# =========================================================================
+
+
+class LLMProviders:
+    """
+    Sağlayıcı SDK'ları (google-genai, litellm) ve Gemini istemcisi.
+
+    Import'lar saniyeler sürdüğünden açılışta thread'de yüklenir, ardından her
+    backend'e bağlantıyı açan ucuz bir istek atılır (ısınma). Port bu sırada
+    açıktır; /ready ısınma bitene kadar 503 döner. Yüklemeden önce gelen LLM
+    çağrıları ensure_loaded() ile yüklemeyi bekler, event loop bloklanmaz.
+    """
+
+    def __init__(self):
+        self.gemini_client = None
+        # Backend adı -> ısınma sonucu (None: ısınma isteği yok, erişim denenmedi)
+        self.reachable: Dict[str, Optional[bool]] = {}
+        self._load: Optional[asyncio.Future] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._load is not None and self._load.done() and not self._load.cancelled() and not self._load.exception()
+
+    def _load_sync(self) -> None:
+        genai.load()
+        if GEMINI_API_KEY:
+            try:
+                self.gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+                logging.info("Gemini client başarıyla başlatıldı.")
+            except Exception as e:
+                logging.error(f"Gemini istemcisi başlatılamadı: {e}")
+        else:
+            logging.error("Gemini istemcisi başlatılamadı: GEMINI_API_KEY ortam değişkeni tanımlı değil.")
+        for backend in list(_llm_backends.values()):
+            try:
+                backend.load()
+            except Exception as e:
+                logging.error(f"LLM backend {backend.name} could not be loaded: {e}")
+
+    async def _load_all(self) -> None:
+        await asyncio.to_thread(self._load_sync)
+        startup_report.mark("llm_loaded")
+
+    async def ensure_loaded(self) -> None:
+        if self._load is None:
+            self._load = asyncio.ensure_future(self._load_all())
+        # Bekleyen isteğin iptali ortak yüklemeyi iptal etmesin
+        await asyncio.shield(self._load)
+
+    async def warm_up(self) -> None:
+        try:
+            await self.ensure_loaded()
+        except Exception as e:
+            logging.error(f"LLM provider SDKs failed to load: {e}")
+            return
+        backends = [b for b in _llm_backends.values() if b.configured]
+        results = await asyncio.gather(
+            *(asyncio.wait_for(b.warm_up(), LLM_WARMUP_TIMEOUT_SECONDS) for b in backends), return_exceptions=True
+        )
+        for backend, result in zip(backends, results):
+            if isinstance(result, BaseException):
+                logging.warning(f"LLM backend {backend.name} warm-up failed: {result!r}")
+                result = False
+            self.reachable[backend.name] = result
+        startup_report.mark("llm_warm")
+
+
+llm_providers = LLMProviders()
+
+
+@app.on_event("startup")
+async def start_llm_warm_up():
+    app.state.llm_warm_up = asyncio.create_task(llm_providers.warm_up())
+
+
+@app.on_event("shutdown")
+async def close_llm_providers():
+    # Startup warm-up'tan önce düştüyse task yoktur; asıl hatayı gizlemeyelim
+    warm_up = getattr(app.state, "llm_warm_up", None)
+    if warm_up is not None:
+        warm_up.cancel()
+    if llm_providers.gemini_client is not None:
+        await llm_providers.gemini_client.aio.aclose()
+
+
+class LLMTimeoutError(Exception):
+    """LLM çağrısı LLM_TIMEOUT_SECONDS içinde tamamlanmadı."""
+
+
+class LLMClientDisconnected(Exception):
+    """İstemci bağlantıyı kapattı; LLM çağrısı iptal edildi."""
+
+
+class LLMOverloaded(Exception):
+    """Tüm LLM slotları dolu ve bekleme sırası/süresi aşıldı; çağrı yapılmadı."""
+
+
+class LLMUnavailable(Exception):
+    """Hiçbir LLM backend'i yanıt veremedi (hepsi hata verdi ya da devreleri açık)."""
+
+
+def _part_text_and_images(parts: List[Any]) -> Tuple[str, List[Tuple[str, bytes]]]:
+    text = "".join(p.text for p in parts if p.text)
+    images = [(p.inline_data.mime_type, p.inline_data.data) for p in parts if p.inline_data and p.inline_data.data]
+    return text, images
+
+
+def _message_parts(message: Any) -> List[Any]:
+    """send_message'a verilen str / Part / Part listesini Part listesine çevirir."""
+    if isinstance(message, str):
+        return [genai.types.Part.from_text(text=message)]
+    if isinstance(message, list):
+        return message
+    return [message]
+
+
+class LatencyTracker:
+    """Son başarılı çağrıların sürelerinden p95 hesaplar (hedging gecikmesi için)."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class CircuitBreaker:
+    """
+    Art arda `failure_threshold` hatadan sonra açılır; `cooldown` geçince
+    yarı açık olur ve istek geçirir. Başarı devreyi kapatır, yarı açıkken
+    gelen hata cooldown'u yeniden başlatır.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logging.info(f"LLM backend {self.name} recovered; circuit closed.")
+            LLM_BREAKER_OPEN.labels(self.name).set(0)
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logging.error(f"LLM backend {self.name} failing; circuit opened for {self.cooldown:.0f}s.")
+                LLM_BREAKER_OPEN.labels(self.name).set(1)
+            self.opened_at = time.monotonic()
+
+
+class ContextCacheRef:
+    """Sağlayıcıdaki bir context cache: `model` için sistem mesajı + geçmişin ilk `covered` Content'i."""
+
+    def __init__(self, name: str, model: str, covered: int, expire_time: datetime):
+        self.name = name
+        self.model = model
+        self.covered = covered
+        self.expire_time = expire_time
+        # Sağlayıcı önbelleği tanımazsa (süresi dolmuş/silinmiş) backend True yapar
+        self.stale = False
+
+
+class GeminiBackend:
+    """
+    google-genai üzerinden Gemini. Eşleşen bir context cache verilirse sistem
+    mesajı ve geçmişin önbellekteki kısmı gönderilmez; sağlayıcı önbelleği
+    tanımazsa istek önbelleksiz tekrarlanır.
+    """
+
+    # Önbellek bulunamadığında dönen kodlar (429 gibi hatalar failover'a kalır)
+    STALE_CACHE_CODES = (400, 403, 404)
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    @property
+    def configured(self) -> bool:
+        return llm_providers.gemini_client is not None
+
+    def load(self) -> None:
+        """İstemci LLMProviders'ta ortak; ayrıca yüklenecek bir şey yok."""
+
+    async def warm_up(self) -> bool:
+        """Model metadata isteği: bağlantı havuzunu açar ve modelin erişilebilir olduğunu doğrular."""
+        await llm_providers.gemini_client.aio.models.get(model=self.model)
+        return True
+
+    def _session(self, history: List[Any], system_instruction: Optional[str], cache: Optional[ContextCacheRef]):
+        if llm_providers.gemini_client is None:
+            raise LLMUnavailable("Gemini client is not configured")
+        if cache is not None:
+            config = genai.types.GenerateContentConfig(cached_content=cache.name)
+            history = history[cache.covered:]
+        else:
+            config = genai.types.GenerateContentConfig(system_instruction=system_instruction)
+        return llm_providers.gemini_client.aio.chats.create(model=self.model, history=history, config=config)
+
+    def _usable(self, cache: Optional[ContextCacheRef]) -> Optional[ContextCacheRef]:
+        return cache if cache is not None and not cache.stale and cache.model == self.model else None
+
+    def _is_stale(self, cache: Optional[ContextCacheRef], error: Exception) -> bool:
+        if cache is None or error.code not in self.STALE_CACHE_CODES:
+            return False
+        logging.warning(f"Context cache {cache.name} rejected ({error.code}); retrying without it.")
+        LLM_CONTEXT_CACHE.labels("stale").inc()
+        cache.stale = True
+        return True
+
+    def _record_usage(self, usage: Any) -> None:
+        if usage is not None:
+            record_llm_usage(
+                self.name, usage.prompt_token_count, usage.candidates_token_count, usage.cached_content_token_count
+            )
+
+    async def chat(
+        self, history: List[Any], message: Any, system_instruction: Optional[str], cache: Optional[ContextCacheRef] = None
+    ) -> str:
+        cache = self._usable(cache)
+        try:
+            response = await self._session(history, system_instruction, cache).send_message(message)
+        except genai.errors.ClientError as e:
+            if not self._is_stale(cache, e):
+                raise
+            response = await self._session(history, system_instruction, None).send_message(message)
+        self._record_usage(response.usage_metadata)
+        return response.text or ""
+
+    async def stream(
+        self, history: List[Any], message: Any, system_instruction: Optional[str], cache: Optional[ContextCacheRef] = None
+    ) -> AsyncIterator[str]:
+        cache = self._usable(cache)
+        usage = None
+        while True:
+            started = False
+            try:
+                async for chunk in await self._session(history, system_instruction, cache).send_message_stream(message):
+                    # Son parçadaki usage_metadata tüm yanıtın toplamıdır
+                    usage = chunk.usage_metadata or usage
+                    if chunk.text:
+                        started = True
+                        yield chunk.text
+                break
+            except genai.errors.ClientError as e:
+                if started or not self._is_stale(cache, e):
+                    raise
+                cache = None
+        self._record_usage(usage)
+
+
+class LiteLLMBackend:
+    """
+    litellm üzerinden OpenAI uyumlu sağlayıcılar. Gemini Content geçmişi chat
+    mesajlarına çevrilir; görseller data URL olarak gönderilir. litellm yalnızca
+    böyle bir backend yapılandırıldıysa, LLMProviders tarafından thread'de
+    import edilir (import yavaştır; istek sırasında yapılırsa event loop'u bloklar).
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = f"litellm:{model}"
+        self._litellm = None
+
+    @property
+    def configured(self) -> bool:
+        return self._litellm is not None
+
+    def load(self) -> None:
+        if self._litellm is None:
+            litellm = importlib.import_module("litellm")
+            litellm.suppress_debug_info = True
+            self._litellm = litellm
+
+    async def warm_up(self) -> None:
+        # Sağlayıcıdan bağımsız ücretsiz bir istek yok; ısınma import ile sınırlı
+        return None
+
+    def _client(self):
+        return self._litellm
+
+    @staticmethod
+    def _content(parts: List[Any]) -> Any:
+        text, images = _part_text_and_images(parts)
+        if not images:
+            return text
+        content: List[Dict[str, Any]] = [{"type": "text", "text": text}] if text else []
+        for mime, data in images:
+            url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+            content.append({"type": "image_url", "image_url": {"url": url}})
+        return content
+
+    def _messages(self, history: List[Any], message: Any, system_instruction: Optional[str]) -> List[Dict[str, Any]]:
+        messages = [{"role": "system", "content": system_instruction}] if system_instruction else []
+        for content in history:
+            role = "assistant" if content.role == "model" else "user"
+            messages.append({"role": role, "content": self._content(content.parts or [])})
+        messages.append({"role": "user", "content": self._content(_message_parts(message))})
+        return messages
+
+    async def chat(
+        self, history: List[Any], message: Any, system_instruction: Optional[str], cache: Optional[ContextCacheRef] = None
+    ) -> str:
+        # Context cache yalnızca Gemini'ye özgü; burada tam geçmiş gönderilir
+        response = await self._client().acompletion(
+            model=self.model, messages=self._messages(history, message, system_instruction), max_retries=0
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_llm_usage(self.name, usage.prompt_tokens, usage.completion_tokens)
+        return response.choices[0].message.content or ""
+
+    async def stream(
+        self, history: List[Any], message: Any, system_instruction: Optional[str], cache: Optional[ContextCacheRef] = None
+    ) -> AsyncIterator[str]:
+        response = await self._client().acompletion(
+            model=self.model,
+            messages=self._messages(history, message, system_instruction),
+            stream=True,
+            stream_options={"include_usage": True},
+            max_retries=0,
+        )
+        async for chunk in response:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                record_llm_usage(self.name, usage.prompt_tokens, usage.completion_tokens)
+
+
+LLM_BACKEND_TYPES = {"gemini": GeminiBackend, "litellm": LiteLLMBackend}
+
+# "tür:model" -> backend. Aynı backend birden çok router'da kullanılırsa devre ve gecikme istatistiği ortaktır.
+_llm_backends: Dict[str, Any] = {}
+
+
+def llm_backend(spec: str):
+    spec = spec.strip()
+    if spec not in _llm_backends:
+        kind, _, model = spec.partition(":")
+        if kind not in LLM_BACKEND_TYPES or not model:
+            raise ValueError(f"Invalid LLM backend '{spec}'. Use '<{'|'.join(LLM_BACKEND_TYPES)}>:<model>'.")
+        backend = LLM_BACKEND_TYPES[kind](model)
+        backend.breaker = CircuitBreaker(backend.name, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS)
+        backend.latency = LatencyTracker()
+        backend.first_token_latency = LatencyTracker()
+        _llm_backends[spec] = backend
+    return _llm_backends[spec]
+
+
+class LLMRouter:
+    """
+    Öncelik sıralı backend listesi önünde failover + hedging.
+
+    - Devresi açık backend'ler atlanır; hata veren backend'den sıradakine geçilir.
+    - Hedging: denenen backend p95 süresi içinde bitmezse sıradaki de başlatılır,
+      önce başarıyla biten kazanır, diğeri iptal edilir. Stream'lerde ölçüt ilk
+      parçanın gelme süresidir; ilk parça alındıktan sonra backend değiştirilemez.
+    """
+
+    def __init__(self, specs: str, hedge: bool):
+        backends = []
+        for spec in specs.split(","):
+            if spec.strip():
+                backend = llm_backend(spec)
+                if backend not in backends:
+                    backends.append(backend)
+        self.backends = backends
+        self.hedge = hedge
+
+    @property
+    def configured(self) -> bool:
+        return any(b.configured for b in self.backends)
+
+    def _candidates(self) -> List[Any]:
+        candidates = [b for b in self.backends if b.configured and b.breaker.allow()]
+        if not candidates:
+            raise LLMUnavailable("No LLM backend available (all circuits open)")
+        return candidates
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        if not self.hedge:
+            return None
+        p95 = tracker.p95()
+        return None if p95 is None else max(p95, LLM_HEDGE_MIN_DELAY_SECONDS)
+
+    @staticmethod
+    def _record(backend, operation: str, outcome: str, started: float) -> None:
+        LLM_REQUEST_DURATION.labels(backend.name, operation, outcome).observe(time.perf_counter() - started)
+
+    async def _attempt(
+        self, backend, history: List[Any], message: Any, system_instruction: Optional[str], cache: Optional[ContextCacheRef]
+    ) -> str:
+        started = time.perf_counter()
+        try:
+            text = await backend.chat(history, message, system_instruction, cache)
+        except asyncio.CancelledError:
+            self._record(backend, "chat", "cancelled", started)
+            raise
+        except Exception as e:
+            self._record(backend, "chat", "error", started)
+            backend.breaker.record_failure()
+            logging.error(f"LLM backend {backend.name} failed: {e}")
+            raise
+        self._record(backend, "chat", "ok", started)
+        backend.breaker.record_success()
+        backend.latency.add(time.perf_counter() - started)
+        return text
+
+    async def chat(
+        self,
+        history: List[Any],
+        message: Any,
+        system_instruction: Optional[str] = None,
+        cache: Optional[ContextCacheRef] = None,
+    ) -> str:
+        candidates = self._candidates()
+        running: Dict["asyncio.Task[str]", Any] = {}
+        last_error: Optional[BaseException] = None
+        next_index = 0
+        try:
+            while running or next_index < len(candidates):
+                if not running:
+                    backend = candidates[next_index]
+                    next_index += 1
+                    running[asyncio.ensure_future(self._attempt(backend, history, message, system_instruction, cache))] = backend
+                    delay = self._hedge_delay(backend.latency)
+
+                can_hedge = next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    running, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # p95 aşıldı: yedek isteği de başlat
+                    backend = candidates[next_index]
+                    next_index += 1
+                    LLM_HEDGES.labels(backend.name).inc()
+                    running[asyncio.ensure_future(self._attempt(backend, history, message, system_instruction, cache))] = backend
+                    delay = None
+                    continue
+
+                for task in done:
+                    failed_backend = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    LLM_FAILOVERS.labels(failed_backend.name).inc()
+        finally:
+            for task in running:
+                task.cancel()
+
+        raise LLMUnavailable("All LLM backends failed") from last_error
+
+    async def stream(
+        self,
+        history: List[Any],
+        message: Any,
+        system_instruction: Optional[str] = None,
+        cache: Optional[ContextCacheRef] = None,
+    ) -> AsyncIterator[str]:
+        candidates = self._candidates()
+        # İlk parça yarışı: task -> (backend, generator, başlangıç)
+        running: Dict["asyncio.Task[str]", Tuple[Any, Any, float]] = {}
+        last_error: Optional[BaseException] = None
+        next_index = 0
+        winner = None
+
+        def start(backend) -> None:
+            generator = backend.stream(history, message, system_instruction, cache)
+            running[asyncio.ensure_future(generator.__anext__())] = (backend, generator, time.perf_counter())
+
+        try:
+            while winner is None and (running or next_index < len(candidates)):
+                if not running:
+                    start(candidates[next_index])
+                    delay = self._hedge_delay(candidates[next_index].first_token_latency)
+                    next_index += 1
+
+                can_hedge = next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    running, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    LLM_HEDGES.labels(candidates[next_index].name).inc()
+                    start(candidates[next_index])
+                    next_index += 1
+                    delay = None
+                    continue
+
+                for task in done:
+                    backend, generator, started = running.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = (backend, generator, started, None if error else task.result())
+                        break
+                    self._record(backend, "chat_stream", "error", started)
+                    backend.breaker.record_failure()
+                    logging.error(f"LLM backend {backend.name} failed (stream): {error}")
+                    last_error = error
+                    LLM_FAILOVERS.labels(backend.name).inc()
+        finally:
+            for task, (backend, generator, started) in running.items():
+                task.cancel()
+                self._record(backend, "chat_stream", "cancelled", started)
+            for task, (_, generator, _) in running.items():
+                await asyncio.gather(task, return_exceptions=True)
+                await generator.aclose()
+
+        if winner is None:
+            raise LLMUnavailable("All LLM backends failed") from last_error
+
+        backend, generator, started, first = winner
+        backend.first_token_latency.add(time.perf_counter() - started)
+        outcome = "error"
+        try:
+            if first is not None:
+                yield first
+                async for text in generator:
+                    yield text
+            outcome = "ok"
+            backend.breaker.record_success()
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except Exception:
+            backend.breaker.record_failure()
+            raise
+        finally:
+            self._record(backend, "chat_stream", outcome, started)
+            await generator.aclose()
+
+
+chat_router = LLMRouter(LLM_BACKENDS, LLM_HEDGE_ENABLED)
+title_router = LLMRouter(TITLE_BACKENDS, LLM_HEDGE_ENABLED)
+summary_router = LLMRouter(SUMMARY_BACKENDS, LLM_HEDGE_ENABLED)
+
+
+class LLMGateway:
+    """
+    Tüm LLM çağrılarının geçtiği async katman; backend seçimi LLMRouter'dadır.
+
+    - Çağrılar async'tir, event loop bloklanmaz.
+    - Aynı anda en fazla `max_concurrency` çağrı çalışır. Fazlası en fazla
+      `max_queue` kadar ve `queue_timeout` saniye sırada bekler; aşılırsa
+      LLMOverloaded ile hemen reddedilir (istek zaman aşımına kadar asılı kalmaz).
+    - Her çağrı `timeout` saniye ile sınırlıdır (failover ve hedging dahil).
+    - `request` verilirse istemci koptuğunda çağrı iptal edilir.
+    """
+
+    DISCONNECT_POLL_SECONDS = 0.5
+
+    def __init__(self, max_concurrency: int, timeout: float, max_queue: int, queue_timeout: float):
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+
+    def is_saturated(self) -> bool:
+        """Yeni bir çağrı sıraya bile giremeyecekse True."""
+        return self._semaphore.locked() and self._waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def _slot(self):
+        if self.is_saturated():
+            raise LLMOverloaded()
+        self._waiting += 1
+        try:
+            # wait_for ayrı bir task'ta bekler; süre, acquire tamamlandığı anda dolarsa
+            # alınan slot serbest bırakılmadan kaybolur. timeout() aynı task'ta iptal eder.
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            raise LLMOverloaded()
+        finally:
+            self._waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _watch_disconnect(self, request: Request) -> None:
+        while not await request.is_disconnected():
+            await asyncio.sleep(self.DISCONNECT_POLL_SECONDS)
+
+    async def _call(self, factory: Callable[[], Awaitable[Any]], request: Optional[Request] = None) -> Any:
+        await llm_providers.ensure_loaded()
+        async with self._slot():
+            task = asyncio.ensure_future(asyncio.wait_for(factory(), self.timeout))
+            if request is None:
+                try:
+                    return await task
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError()
+
+            watcher = asyncio.ensure_future(self._watch_disconnect(request))
+            try:
+                done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                watcher.cancel()
+
+            if task not in done:
+                task.cancel()
+                raise LLMClientDisconnected()
+            try:
+                return task.result()
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError()
+
+    async def generate_content(self, *, router: LLMRouter, prompt: str, system_instruction: str) -> str:
+        """Geçmişsiz tek seferlik istek (başlık, özet)."""
+        return await self._call(lambda: router.chat([], prompt, system_instruction))
+
+    async def send_chat_message(
+        self,
+        *,
+        router: LLMRouter,
+        history: List[Any],
+        message: Any,
+        system_instruction: str,
+        cache: Optional[ContextCacheRef] = None,
+        request: Optional[Request] = None,
+    ) -> str:
+        return await self._call(lambda: router.chat(history, message, system_instruction, cache), request)
+
+    async def stream_chat_message(
+        self,
+        *,
+        router: LLMRouter,
+        history: List[Any],
+        message: Any,
+        system_instruction: str,
+        cache: Optional[ContextCacheRef] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yanıt metnini parça parça üretir. Slot akış bitene kadar tutulur;
+        süre sınırı akışın tamamı için geçerlidir. İstemci koptuğunda
+        StreamingResponse bu generator'ı iptal eder.
+        """
+        await llm_providers.ensure_loaded()
+        async with self._slot():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            stream = router.stream(history, message, system_instruction, cache)
+            try:
+                while True:
+                    try:
+                        text = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    yield text
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError()
+            finally:
+                await stream.aclose()
+
+
+llm_gateway = LLMGateway(LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS)
+
+
+HISTORY_MESSAGE_PROJECTION = {
+    "_id": 0, "id": 1, "role": 1, "content": 1, "created_at": 1,
+    "image_data": 1, "has_image": 1, "image_ref": 1, "image_mime": 1,
+}
+
+
+async def fetch_recent_history_messages(conversation_id: str) -> List[Dict[str, Any]]:
+    """Konuşmanın en son HISTORY_LOAD_LIMIT mesajını kronolojik sırada döner."""
+    messages = await db.messages.find(
+        {"conversation_id": conversation_id},
+        HISTORY_MESSAGE_PROJECTION,
+    ).sort([("created_at", -1), ("id", -1)]).to_list(HISTORY_LOAD_LIMIT)
+    messages.reverse()
+    return messages
+
+
+async def fetch_unsummarized_messages_before(
+    conversation_id: str, summarized_until: Optional[datetime], first: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """`first` mesajından önceki, henüz özete katılmamış mesajları kronolojik sırada döner."""
+    query: Dict[str, Any] = {
+        "conversation_id": conversation_id,
+        "$or": [
+            {"created_at": {"$lt": first["created_at"]}},
+            {"created_at": first["created_at"], "id": {"$lt": first["id"]}},
+        ],
+    }
+    if summarized_until is not None:
+        query["created_at"] = {"$gt": summarized_until}
+    return await db.messages.find(query, HISTORY_MESSAGE_PROJECTION).sort([("created_at", 1), ("id", 1)]).to_list(None)
+
+
+async def build_gemini_history(messages: List[Dict[str, Any]]) -> List[Any]:
+    """Mesaj dokümanlarını Gemini formatındaki geçmişe çevirir."""
+    # Görselleri blob store'dan eşzamanlı çek
+    refs = list({msg["image_ref"] for msg in messages if msg.get("image_ref")})
+    blobs = dict(zip(refs, await asyncio.gather(*(blob_store.get(ref) for ref in refs))))
+
+    history: List[Any] = []
+
+    for msg in messages:
+        parts: List[Any] = []
+
+        # Metni Part'e çevir
+        parts.append(
+            genai.types.Part.from_text(
+                text=msg["content"]
+            )
+        )
+
+        # Eğer görsel varsa onu da ekle
+        if msg.get("has_image") and msg.get("image_ref"):
+            blob = blobs.get(msg["image_ref"])
+            if blob is not None:
+                image_bytes, mime_type = blob
+                parts.append(
+                    genai.types.Part.from_bytes(
+                        data=image_bytes,
+                        mime_type=msg.get("image_mime") or mime_type,
+                    )
+                )
+            else:
+                logging.warning(f"Image blob missing for history: {msg['image_ref']}")
+        elif msg.get("has_image") and msg.get("image_data"):
+            # Eski kayıtlar: görsel base64 olarak mesajın içinde
+            try:
+                image_bytes = base64.b64decode(msg["image_data"])
+                parts.append(
+                    genai.types.Part.from_bytes(
+                        data=image_bytes,
+                        mime_type=msg.get("image_mime") or sniff_image_mime(image_bytes) or "image/jpeg",
+                    )
+                )
+            except Exception as e:
+                logging.warning(f"Failed to decode image data for history: {e}")
+
+        gemini_role = "user" if msg["role"] == "user" else "model"
+
+        # Content objesi oluştur
+        content = genai.types.Content(
+            role=gemini_role,
+            parts=parts,
+        )
+
+        history.append(content)
+
+    return history
+
+
+def _content_size(content: Any) -> int:
+    """Bir Content objesinin bellekte tuttuğu yaklaşık bayt miktarı (metin + görsel)."""
+    size = 0
+    for part in content.parts or []:
+        if part.text:
+            size += len(part.text)
+        if part.inline_data and part.inline_data.data:
+            size += len(part.inline_data.data)
+    return size
+
+
+class HistoryCache:
+    """
+    Konuşma başına hazır Gemini geçmişini tutan LRU + TTL önbellek.
+
+    Toplam boyut `max_bytes` üstüne çıkınca en eski kullanılan girişler atılır.
+    Her giriş, yüklendiği andaki konuşma `updated_at` değerini (version) taşır;
+    başka bir worker konuşmayı güncellediyse version tutmaz ve Mongo'dan
+    yeniden yüklenir.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, conversation_id: str, version: Any) -> Optional[List[Any]]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic() or entry["version"] != version:
+            self.invalidate(conversation_id)
+            return None
+        self._entries.move_to_end(conversation_id)
+        entry["expires_at"] = time.monotonic() + self.ttl_seconds
+        return list(entry["history"])
+
+    def put(self, conversation_id: str, history: List[Any], version: Any) -> None:
+        self.invalidate(conversation_id)
+        size = sum(_content_size(c) for c in history)
+        if size > self.max_bytes:
+            return
+        self._entries[conversation_id] = {
+            "history": list(history),
+            "bytes": size,
+            "version": version,
+            "expires_at": time.monotonic() + self.ttl_seconds,
+        }
+        self.total_bytes += size
+        self._evict()
+
+    def append(self, conversation_id: str, contents: List[Any], version: Any) -> None:
+        """Önbellekteki girişe yeni turları ekler; giriş yoksa bir şey yapmaz."""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return
+        size = sum(_content_size(c) for c in contents)
+        entry["history"].extend(contents)
+        entry["bytes"] += size
+        entry["version"] = version
+        entry["expires_at"] = time.monotonic() + self.ttl_seconds
+        self.total_bytes += size
+        self._entries.move_to_end(conversation_id)
+        self._evict()
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def invalidate(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self.total_bytes -= entry["bytes"]
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry["bytes"]
+
+
+history_cache = HistoryCache(HISTORY_CACHE_MAX_BYTES, HISTORY_CACHE_TTL_SECONDS)
+
+
+def history_cache_version(conversation: Dict[str, Any]) -> Tuple[Any, Any]:
+    # Özet ilerlediğinde de önbellek girişi geçersiz sayılır
+    return conversation.get("updated_at"), conversation.get("summarized_until")
+
+
+async def load_conversation_with_history(
+    conversation_id: str, user_id: str
+) -> Tuple[Optional[Dict[str, Any]], List[Any]]:
+    """
+    Sahiplik kontrolü ile geçmişi birlikte yükler. Önbellekte giriş varsa tek
+    bir find_one yeterlidir; yoksa konuşma ve son mesajlar eşzamanlı okunur
+    (tek round-trip süresi). Özete katılmış mesajlar sonradan elenir; son
+    mesajların hepsi özetten sonraysa aradakiler ikinci bir sorguyla eklenir.
+    """
+    conversation_query = db.conversations.find_one(
+        {"id": conversation_id, "user_id": user_id, "deleted_at": None},
+        {"_id": 0, "id": 1, "updated_at": 1, "summary": 1, "summarized_until": 1, "context_cache": 1},
+    )
+
+    if conversation_id in history_cache:
+        conversation = await conversation_query
+        if not conversation:
+            return None, []
+        history = history_cache.get(conversation_id, history_cache_version(conversation))
+        if history is not None:
+            observe_history(history, "cache")
+            return conversation, history
+        messages = await fetch_recent_history_messages(conversation_id)
+    else:
+        conversation, messages = await asyncio.gather(
+            conversation_query, fetch_recent_history_messages(conversation_id)
+        )
+        if not conversation:
+            return None, []
+
+    summarized_until = conversation.get("summarized_until")
+    if summarized_until is not None:
+        messages = [m for m in messages if m["created_at"] > summarized_until]
+    if len(messages) >= HISTORY_LOAD_LIMIT:
+        # Son HISTORY_LOAD_LIMIT mesajdan öncekiler de özette yok: atlanmasınlar diye
+        # onlar da yüklenir (prepare_chat_turn bu durumda özet yenilemeyi başlatır)
+        messages = await fetch_unsummarized_messages_before(conversation_id, summarized_until, messages[0]) + messages
+
+    history = await build_gemini_history(messages)
+    history_cache.put(conversation_id, history, history_cache_version(conversation))
+    observe_history(history, "db")
+    return conversation, history
+
+
+def observe_history(history: List[Any], source: str) -> None:
+    HISTORY_MESSAGES.labels(source).observe(len(history))
+    HISTORY_BYTES.labels(source).observe(sum(_content_size(c) for c in history))
+
+
+CHAT_SYSTEM_INSTRUCTION = (
+    "You are Alpine, a helpful and friendly AI assistant created to help users with any questions or tasks. "
+    "Be conversational, informative, and helpful."
+)
+
+
+# Görsel başına yaklaşık token maliyeti (Gemini küçük görseller için 258 sayar)
+IMAGE_TOKEN_ESTIMATE = 258
+
+
+def estimate_tokens(content: Any) -> int:
+    """Bir Content objesinin yaklaşık token sayısı (~4 karakter = 1 token)."""
+    tokens = 0
+    for part in content.parts or []:
+        if part.text:
+            tokens += len(part.text) // 4 + 1
+        if part.inline_data is not None:
+            tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def split_history_by_budget(history: List[Any], budget: int) -> int:
+    """
+    Sondan başlayarak bütçeye sığan en uzun tur dizisinin başlangıç indeksini döner.
+    Pencere her zaman bir kullanıcı turuyla başlar.
+    """
+    used = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        used += estimate_tokens(history[i])
+        if used > budget:
+            break
+        start = i
+
+    while start < len(history) and history[start].role != "user":
+        start += 1
+    return start
+
+
+def build_system_instruction(conversation: Dict[str, Any]) -> str:
+    """Sistem mesajına, varsa konuşmanın önceki bölümünün özetini ekler."""
+    summary = conversation.get("summary")
+    if not summary:
+        return CHAT_SYSTEM_INSTRUCTION
+    return (
+        f"{CHAT_SYSTEM_INSTRUCTION}\n\n"
+        f"Summary of the earlier part of this conversation (older turns are not shown):\n{summary}"
+    )
+
+
+def schedule_summary_refresh(conversation_id: str) -> None:
+    """Konuşma için (kuyrukta zaten yoksa) arka planda özet yenilemeyi başlatır."""
+    job_queue.submit(f"summary:{conversation_id}", lambda: refresh_conversation_summary(conversation_id))
+
+
+async def refresh_conversation_summary(conversation_id: str) -> None:
+    """
+    Bağlam penceresine sığmayan eski turları mevcut özetle birleştirip yeni bir
+    özet üretir ve konuşma dokümanına yazar. Bütçenin yarısı kadar yeni tur
+    pencerede bırakılır ki özet her turda yeniden üretilmesin. İş kuyruğunda
+    çalışır; hata olursa kuyruk yeniden dener.
+    """
+    conversation = await db.conversations.find_one({"id": conversation_id})
+    if not conversation:
+        return
+
+    query: Dict[str, Any] = {"conversation_id": conversation_id}
+    if conversation.get("summarized_until") is not None:
+        query["created_at"] = {"$gt": conversation["summarized_until"]}
+    messages = await db.messages.find(
+        query,
+        {"_id": 0, "role": 1, "content": 1, "has_image": 1, "created_at": 1},
+    ).sort("created_at", 1).to_list(None)
+
+    keep_tokens = 0
+    fold_count = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        keep_tokens += len(messages[i]["content"]) // 4 + 1
+        if messages[i].get("has_image"):
+            keep_tokens += IMAGE_TOKEN_ESTIMATE
+        if keep_tokens > HISTORY_TOKEN_BUDGET // 2:
+            fold_count = i + 1
+            break
+    else:
+        return
+
+    # Kalan pencere bir kullanıcı turuyla başlasın
+    while fold_count < len(messages) and messages[fold_count]["role"] != "user":
+        fold_count += 1
+    folded = messages[:fold_count]
+    if not folded:
+        return
+
+    transcript = "\n".join(
+        f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}"
+        + (" [image attached]" if m.get("has_image") else "")
+        for m in folded
+    )
+    previous = conversation.get("summary") or "(none)"
+    response = await llm_gateway.generate_content(
+        router=summary_router,
+        prompt=f"Previous summary:\n{previous}\n\nNew turns:\n{transcript}",
+        system_instruction=(
+            "You maintain a running summary of a chat between a user and an AI assistant. "
+            "Merge the previous summary with the new turns into one concise summary that keeps "
+            "facts, names, decisions, open questions and user preferences. Respond ONLY with the summary."
+        ),
+    )
+    summary = response.strip()
+    if not summary:
+        return
+
+    await db.conversations.update_one(
+        {"id": conversation_id},
+        {"$set": {"summary": summary, "summarized_until": folded[-1]["created_at"]}},
+    )
+    history_cache.invalidate(conversation_id)
+    logging.info(f"Conversation {conversation_id}: {len(folded)} messages folded into summary.")
+
+
+async def generate_title_from_message(first_message: str) -> str:
+    """İlk mesajdan başlık oluşturur. LLM hataları yukarı iletilir (iş kuyruğu yeniden dener)."""
+    system_instruction = (
+        "You are a title generator AI. Your sole purpose is to take the user's first message in a chat and "
+        "generate a concise, descriptive, and human-readable title (max 5-7 words, NO punctuation marks like "
+        "quotes or periods at the end). Respond ONLY with the title."
+    )
+
+    response = await llm_gateway.generate_content(
+        router=title_router,
+        prompt=f"Generate a title for this chat: '{first_message}'",
+        system_instruction=system_instruction,
+    )
+
+    title = response.strip().replace('"', "").replace("'", "").replace(".", "")
+
+    # Boş ya da çok saçma uzun başlık üretirse fallback
+    if not title or len(title.split()) > 7:
+        return "New Chat Topic"
+
+    return title
+
+
+async def update_conversation_title(conversation_id: str, first_message: str) -> None:
+    """
+    Arka plan işi: başlığı üretip konuşmaya yazar ve kullanıcının açık
+    WebSocket bağlantılarına bildirir; diğer client'lar bir sonraki listelemede görür.
+    Bu arada silinen konuşmaya yazılmaz ve bildirim gönderilmez.
+    """
+    title = await generate_title_from_message(first_message)
+    conversation = await db.conversations.find_one_and_update(
+        {"id": conversation_id, "deleted_at": None},
+        {"$set": {"title": title}},
+        projection=CONVERSATION_EVENT_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if conversation is not None:
+        publish_conversation_updated(conversation)
+
+
+def schedule_title_generation(conversation_id: str, first_message: str) -> None:
+    if not title_router.configured:
+        return
+    job_queue.submit(
+        f"title:{conversation_id}",
+        lambda: update_conversation_title(conversation_id, first_message),
+    )
+
+# =========================================================================
+# GEMINI CONTEXT CACHE
+# =========================================================================
+
+
+def context_prefix_digest(system_instruction: str, contents: List[Any]) -> str:
+    """Sistem mesajı + Content listesinin içerik özeti; önbelleğin hâlâ aynı öneki kapsadığını doğrular."""
+    digest = hashlib.sha256(system_instruction.encode("utf-8"))
+    for content in contents:
+        digest.update(b"\x00" + (content.role or "").encode("utf-8"))
+        for part in content.parts or []:
+            if part.text:
+                digest.update(b"\x01" + part.text.encode("utf-8"))
+            if part.inline_data and part.inline_data.data:
+                digest.update(b"\x02" + part.inline_data.data)
+    return digest.hexdigest()
+
+
+class ContextCacheManager:
+    """
+    Konuşma başına Gemini context cache'ini yönetir. Kayıt konuşma dokümanında
+    tutulur (context_cache: name, model, digest, covered, expire_time) ki tüm
+    worker'lar aynı önbelleği kullansın.
+
+    Önbellek sabit bir öneki kapsar: sistem mesajı (özet dahil) + özetlenmemiş
+    geçmişin ilk `covered` Content'i. Bu önek özet yenilenene kadar yalnızca
+    uzar; bütçe penceresi gibi her turda kaymaz. Özet değişince digest tutmaz,
+    yerine gelen önbellek eskisini siler.
+
+    Önek ilk kez yeterince uzadığında yalnızca aday olarak kaydedilir
+    (name=None); önbellek ancak sonraki tur aynı öneki kullanırsa oluşturulur.
+    Oluşturma, yenileme ve süre uzatma turdan sonra iş kuyruğunda yapılır; tur
+    hiçbir zaman önbellek oluşturmayı beklemez.
+    """
+
+    # Süresi bu kadar içinde dolacak önbellek kullanılmaz
+    EXPIRY_MARGIN = timedelta(seconds=30)
+
+    def __init__(self, router: LLMRouter, ttl_seconds: int, min_tokens: int, refresh_tokens: int):
+        self.backend = next((b for b in router.backends if isinstance(b, GeminiBackend)), None)
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.refresh_tokens = refresh_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return CONTEXT_CACHE_ENABLED and self.backend is not None and self.backend.configured
+
+    def lookup(
+        self, record: Optional[Dict[str, Any]], system_instruction: str, history: List[Any]
+    ) -> Tuple[Optional[ContextCacheRef], bool]:
+        """
+        Kayıt (önbellek ya da aday) bu turun sistem mesajı + özetlenmemiş geçmiş
+        önekiyle eşleşiyor mu? (kullanılabilir önbellek, önek yeniden kullanıldı mı)
+        döner. Önbellek dışında kalan kısım bütçeyi aşıyorsa önbellek kullanılmaz;
+        tur bütçe penceresine döner.
+        """
+        if not self.enabled or not record:
+            return None, False
+        covered = record["covered"]
+        reused = (
+            record["model"] == self.backend.model
+            and covered <= len(history)
+            and record["digest"] == context_prefix_digest(system_instruction, history[:covered])
+        )
+        if not record.get("name"):
+            return None, reused
+        if (
+            not reused
+            or record["expire_time"] <= utc_now() + self.EXPIRY_MARGIN
+            or sum(estimate_tokens(c) for c in history[covered:]) > HISTORY_TOKEN_BUDGET
+        ):
+            LLM_CONTEXT_CACHE.labels("miss").inc()
+            return None, reused
+        LLM_CONTEXT_CACHE.labels("hit").inc()
+        return ContextCacheRef(record["name"], record["model"], covered, record["expire_time"]), True
+
+    def after_turn(self, conversation_id: str, user_id: str, turn: Dict[str, Any], new_contents: List[Any]) -> None:
+        """
+        Turdan sonra: önek yeniden kullanıldıysa ve önbellek yoksa (ya da dışında
+        kalan kısım büyüdüyse) oluşturmayı, eşleşmeyen kayıt ya da yeni uzun
+        önek için aday kaydını, aksi halde süresi yarılanmış önbelleğin
+        uzatılmasını kuyruğa atar. Özet yenilemesi bekleyen turda önek birazdan
+        değişeceği için önbellek oluşturulmaz.
+        """
+        if not self.enabled or turn["summary_pending"]:
+            return
+        cache: Optional[ContextCacheRef] = turn["context_cache"]
+        if cache is not None and cache.stale:
+            cache = None
+        prefix = turn["context_prefix"] + new_contents
+
+        if cache is not None:
+            if sum(estimate_tokens(c) for c in prefix[cache.covered:]) >= self.refresh_tokens:
+                job_queue.submit(f"context-cache:{conversation_id}", lambda: self.rebuild(conversation_id, user_id, True))
+            elif cache.expire_time - utc_now() < timedelta(seconds=self.ttl_seconds / 2):
+                job_queue.submit(f"context-cache-ttl:{conversation_id}", lambda: self.extend(conversation_id, cache.name))
+            return
+
+        if turn["context_prefix_reused"]:
+            job_queue.submit(f"context-cache:{conversation_id}", lambda: self.rebuild(conversation_id, user_id, True))
+        elif (
+            turn["context_cache_record"] is not None
+            or sum(estimate_tokens(c) for c in prefix) + len(turn["system_instruction"]) // 4 >= self.min_tokens
+        ):
+            # Eski önbellek/aday bu önekle eşleşmiyor ya da önek yeni uzadı: yalnızca aday yazılır
+            job_queue.submit(f"context-cache:{conversation_id}", lambda: self.rebuild(conversation_id, user_id, False))
+
+    async def rebuild(self, conversation_id: str, user_id: str, create: bool) -> None:
+        """
+        Konuşmanın güncel öneki için kaydı yeniler: create ise önbelleği oluşturur,
+        değilse aday yazar. Yerine geçilen önbellek sağlayıcıdan silinir.
+        """
+        conversation, history = await load_conversation_with_history(conversation_id, user_id)
+        if not conversation or not self.enabled:
+            return
+        system_instruction = build_system_instruction(conversation)
+        old = conversation.get("context_cache")
+
+        record = None
+        if sum(estimate_tokens(c) for c in history) + len(system_instruction) // 4 >= self.min_tokens:
+            record = {
+                "name": None,
+                "model": self.backend.model,
+                "digest": context_prefix_digest(system_instruction, history),
+                "covered": len(history),
+                "expire_time": None,
+            }
+            if create:
+                cached = await asyncio.wait_for(
+                    llm_providers.gemini_client.aio.caches.create(
+                        model=self.backend.model,
+                        config=genai.types.CreateCachedContentConfig(
+                            contents=history,
+                            system_instruction=system_instruction,
+                            ttl=f"{self.ttl_seconds}s",
+                            display_name=f"conversation:{conversation_id}",
+                        ),
+                    ),
+                    LLM_TIMEOUT_SECONDS,
+                )
+                LLM_CONTEXT_CACHE.labels("created").inc()
+                record["name"] = cached.name
+                record["expire_time"] = cached.expire_time or utc_now() + timedelta(seconds=self.ttl_seconds)
+
+        old_name = old.get("name") if old else None
+        # Arada başka bir worker önbelleği değiştirdiyse ya da konuşma silindiyse yazılmaz
+        result = await db.conversations.update_one(
+            {"id": conversation_id, "deleted_at": None, "context_cache.name": old_name},
+            {"$set": {"context_cache": record}},
+        )
+        if result.matched_count == 0:
+            if record is not None and record["name"]:
+                await self.delete(record["name"])
+        elif old_name:
+            await self.delete(old_name)
+
+    async def extend(self, conversation_id: str, name: str) -> None:
+        try:
+            cached = await llm_providers.gemini_client.aio.caches.update(
+                name=name, config=genai.types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+            )
+        except genai.errors.ClientError as e:
+            if e.code not in GeminiBackend.STALE_CACHE_CODES:
+                raise
+            # Sağlayıcıda artık yok: kaydı bırak, sonraki tur yeniden oluşturur
+            await db.conversations.update_one(
+                {"id": conversation_id, "context_cache.name": name}, {"$set": {"context_cache": None}}
+            )
+            return
+        LLM_CONTEXT_CACHE.labels("extended").inc()
+        await db.conversations.update_one(
+            {"id": conversation_id, "context_cache.name": name},
+            {"$set": {"context_cache.expire_time": cached.expire_time or utc_now() + timedelta(seconds=self.ttl_seconds)}},
+        )
+
+    async def delete(self, name: str) -> None:
+        """Sağlayıcıdaki önbelleği siler; zaten yoksa sorun değil."""
+        await llm_providers.ensure_loaded()
+        if llm_providers.gemini_client is None:
+            return
+        try:
+            await llm_providers.gemini_client.aio.caches.delete(name=name)
+        except genai.errors.ClientError as e:
+            if e.code != 404:
+                logging.error(f"Failed to delete context cache {name}: {e}")
+                return
+        LLM_CONTEXT_CACHE.labels("deleted").inc()
+
+
+context_caches = ContextCacheManager(
+    chat_router, CONTEXT_CACHE_TTL_SECONDS, CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_REFRESH_TOKENS
+)
+
+# =========================================================================
+# İSTEK SINIRLAMA (TOKEN BUCKET) VE YÜK ATMA
+# =========================================================================
+
+
+class InMemoryTokenBucketBackend:
+    """Worker içi kovalar. Uzun süre boşta kalan kovalar TTLCache ile düşer."""
+
+    def __init__(self, max_keys: int = 100_000, idle_seconds: int = 3600):
+        self._buckets: TTLCache = TTLCache(maxsize=max_keys, ttl=idle_seconds)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+
+
+class MongoTokenBucketBackend:
+    """
+    Tüm worker'ların paylaştığı kovalar (rate_limits koleksiyonu). Dolum ve
+    harcama tek bir pipeline update ile atomik yapılır.
+    """
+
+    def __init__(self, collection, idle_seconds: int = 3600):
+        self._collection = collection
+        self._idle_seconds = idle_seconds
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = utc_now()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        doc = await self._collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=self._idle_seconds),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return 0.0
+        return (1 - doc["tokens"]) / rate
+
+
+class RateLimiter:
+    """Kullanıcı başına token bucket. `rate` saniyede eklenen token, `burst` kova kapasitesi."""
+
+    def __init__(self, backend, rate_per_minute: float, burst: int):
+        self.backend = backend
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+
+    async def check(self, key: str) -> float:
+        """İzin varsa 0, yoksa tekrar denemeden önce beklenecek saniye."""
+        if self.rate <= 0:
+            return 0.0
+        try:
+            return await self.backend.take(key, self.rate, self.burst)
+        except Exception as e:
+            # Sayaç deposu erişilemezse istekleri engelleme
+            logging.error(f"Rate limiter backend error: {e}")
+            return 0.0
+
+
+chat_rate_limiter = RateLimiter(
+    MongoTokenBucketBackend(db.rate_limits) if RATE_LIMIT_BACKEND == "mongo" else InMemoryTokenBucketBackend(),
+    CHAT_RATE_PER_MINUTE,
+    CHAT_RATE_BURST,
+)
+
+
+def llm_overloaded_error() -> HTTPException:
+    REQUESTS_REJECTED.labels("llm_saturated").inc()
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="AI servisi şu anda çok yoğun. Lütfen birkaç saniye sonra tekrar deneyin.",
+        headers={"Retry-After": "5"},
+    )
+
+
+LLM_UNAVAILABLE_DETAIL = "AI servisine şu anda ulaşılamıyor. Lütfen biraz sonra tekrar deneyin."
+
+
+def llm_unavailable_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=LLM_UNAVAILABLE_DETAIL,
+        headers={"Retry-After": str(math.ceil(LLM_BREAKER_COOLDOWN_SECONDS))},
+    )
+
+
+async def chat_admission(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Sohbet uçlarının önündeki kabul kontrolü: kullanıcı kotası dolduysa 429,
+    LLM slotları ve sırası doluysa 503 döner; istek Gemini'ye hiç gitmez.
+    """
+    retry_after = await chat_rate_limiter.check(f"chat:{current_user.id}")
+    if retry_after > 0:
+        REQUESTS_REJECTED.labels("rate_limit").inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Çok fazla mesaj gönderdiniz. Lütfen biraz bekleyip tekrar deneyin.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    if llm_gateway.is_saturated():
+        raise llm_overloaded_error()
+    return current_user
+
+# =========================================================================
+# İDEMPOTENT MESAJ GÖNDERİMİ
+# =========================================================================
+
+
+class IdempotencyKeyReused(Exception):
+    """Aynı Idempotency-Key farklı içerikli bir istekle kullanıldı."""
+
+
+class IdempotencyInProgress(Exception):
+    """Aynı anahtarlı istek başka bir worker'da hâlâ işleniyor."""
+
+
+class SingleFlight:
+    """
+    Idempotency-Key'li istekler için single-flight + yanıt tekrarı.
+
+    - Aynı worker'da eşzamanlı kopyalar süren çağrıya bağlanır ve onun sonucunu alır.
+    - Anahtar Mongo'da "pending" olarak sahiplenilir; başka bir worker'a düşen
+      kopya kayıt "done" olana kadar bekler. Çöken worker'ın kaydı `lease_seconds`
+      sonra devralınır.
+    - Tamamlanan yanıtlar `ttl_seconds` boyunca bellekte ve Mongo'da tutulur;
+      tekrar gelen istek LLM'e gitmeden aynı yanıtı alır.
+    - Çağrı hata verirse kayıt silinir; sonraki deneme baştan çalışır.
+    """
+
+    POLL_SECONDS = 0.25
+
+    def __init__(self, collection, ttl_seconds: int, lease_seconds: float, max_cached: int = 10_000):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self._inflight: Dict[str, Tuple[str, "asyncio.Future[Dict[str, Any]]"]] = {}
+        self._done: TTLCache = TTLCache(maxsize=max_cached, ttl=ttl_seconds)
+
+    async def run(
+        self, key: str, fingerprint: str, factory: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        done = self._done.get(key)
+        if done is not None:
+            return self._replay(fingerprint, *done)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                raise IdempotencyKeyReused()
+            IDEMPOTENT_REQUESTS.labels("joined").inc()
+            # shield: bekleyen kopya iptal edilirse asıl çağrı etkilenmez
+            return await asyncio.shield(inflight[1])
+
+        future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            body = await self._lead(key, fingerprint, factory)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # bekleyen yoksa "never retrieved" uyarısı çıkmasın
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(body)
+        return body
+
+    def _replay(self, fingerprint: str, stored_fingerprint: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        IDEMPOTENT_REQUESTS.labels("replayed").inc()
+        return body
+
+    async def _claim(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Anahtarı sahiplenir (None döner) ya da mevcut kaydı döner."""
+        now = utc_now()
+        try:
+            await self.collection.insert_one({
+                "_id": key,
+                "fingerprint": fingerprint,
+                "status": "pending",
+                "claimed_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # Sahibi çökmüş (lease süresi geçmiş) bekleyen kayıt devralınır
+        taken = await self.collection.find_one_and_update(
+            {"_id": key, "status": "pending", "claimed_at": {"$lt": now - timedelta(seconds=self.lease_seconds)}},
+            {"$set": {"fingerprint": fingerprint, "claimed_at": now}},
+        )
+        if taken is not None:
+            return None
+        return await self.collection.find_one({"_id": key}) or {}
+
+    async def _lead(
+        self, key: str, fingerprint: str, factory: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lease_seconds
+        while True:
+            record = await self._claim(key, fingerprint)
+            if record is None:
+                break
+            if not record:
+                # Sahibi hata verip kaydı sildi: yeniden sahiplenmeyi dene
+                continue
+            if record["status"] == "done":
+                self._done[key] = (record["fingerprint"], record["response"])
+                return self._replay(fingerprint, record["fingerprint"], record["response"])
+            if record["fingerprint"] != fingerprint:
+                raise IdempotencyKeyReused()
+            if loop.time() >= deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(self.POLL_SECONDS)
+
+        IDEMPOTENT_REQUESTS.labels("executed").inc()
+        try:
+            body = await factory()
+        except BaseException:
+            await self.collection.delete_one({"_id": key, "status": "pending"})
+            raise
+
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "status": "done",
+                "response": body,
+                "expires_at": utc_now() + timedelta(seconds=self.ttl_seconds),
+            }},
+        )
+        self._done[key] = (fingerprint, body)
+        return body
+
+
+# Sahiplik süresi: çağrının sırada bekleyip zaman aşımına uğrayabileceği en uzun süre + pay
+chat_single_flight = SingleFlight(
+    db.idempotency_keys,
+    IDEMPOTENCY_TTL_SECONDS,
+    lease_seconds=LLM_QUEUE_TIMEOUT_SECONDS + LLM_TIMEOUT_SECONDS + 30,
+)
+
+
+async def chat_request_fingerprint(chat_req: ChatMessageRequest, file: Optional[UploadFile]) -> str:
+    """Aynı anahtarın farklı bir istekle kullanılmasını yakalamak için istek özeti."""
+    digest = hashlib.sha256(f"{chat_req.conversation_id}\x00{chat_req.message}".encode("utf-8"))
+    if file and file.filename:
+        digest.update(f"\x00{file.filename}\x00{file.content_type}\x00".encode("utf-8"))
+        digest.update(await file.read())
+        await file.seek(0)
+    return digest.hexdigest()
+
+# =========================================================================
+# CHAT ENDPOINTS
+# =========================================================================
+
+@api_router.post("/chat/conversation", response_model=ConversationOut)
+async def create_conversation(current_user: User = Depends(get_current_user)):
+    """Yeni konuşma oluşturur."""
+    new_conv = Conversation(user_id=current_user.id)
+    await db.conversations.insert_one(new_conv.model_dump())
+    return FastJSONResponse(new_conv.model_dump(include=CONVERSATION_OUT_FIELDS))
+
+
+# Listeleme yanıtlarında yalnızca şemadaki alanlar okunur
+CONVERSATION_LIST_PROJECTION = projection_for(CONVERSATION_OUT_FIELDS)
+MESSAGE_LIST_PROJECTION = projection_for(MESSAGE_OUT_FIELDS)
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+
+def encode_cursor(timestamp: datetime, item_id: str) -> str:
+    """(zaman, id) çiftini URL'de taşınabilir opak bir cursor'a çevirir."""
+    raw = json.dumps({"t": timestamp.isoformat(), "id": item_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), data["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def keyset_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    time_field: str,
+    newest_first: bool,
+    limit: int,
+    before: Optional[str],
+    after: Optional[str],
+) -> Dict[str, Any]:
+    """
+    (time_field, id) üzerinde keyset sayfalama. `before` daha eski, `after` daha
+    yeni kayıtlara doğru ilerler; hiçbiri yoksa en yeni kayıtlardan başlanır.
+    `next_cursor` aynı yönde bir sonraki sayfayı verir, yoksa None'dur.
+    Kayıtlar `newest_first` sırasıyla döner.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
+    query = dict(query)
+    going_older = after is None
+    cursor = before or after
+    if cursor:
+        t, item_id = decode_cursor(cursor)
+        op = "$lt" if going_older else "$gt"
+        query["$or"] = [{time_field: {op: t}}, {time_field: t, "id": {op: item_id}}]
+
+    direction = -1 if going_older else 1
+    docs = await collection.find(query, projection).sort(
+        [(time_field, direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1][time_field], docs[-1]["id"]) if has_more else None
+
+    # Sorgu yönünü istenen sıralamaya çevir
+    if going_older != newest_first:
+        docs.reverse()
+
+    return {"items": docs, "next_cursor": next_cursor}
+
+
+@api_router.get("/chat/conversations", response_model=ConversationPage)
+async def get_conversations(
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Kullanıcının konuşmalarını en son güncellenenden başlayarak sayfa sayfa listeler."""
+    page = await keyset_page(
+        db.conversations,
+        {"user_id": current_user.id, "deleted_at": None},
+        CONVERSATION_LIST_PROJECTION,
+        time_field="updated_at",
+        newest_first=True,
+        limit=limit,
+        before=before,
+        after=after,
+    )
+    return FastJSONResponse(page)
+
+
+@api_router.get("/chat/conversation/{conversation_id}/messages", response_model=MessagePage)
+async def get_messages(
+    conversation_id: str,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
 ):
-    """Mesaj gönderir ve AI'dan yanıt alır."""
-    # 1. Gemini hazır mı?
-    if not gemini_client:
+    """
+    Belirli bir konuşmanın mesajlarını döner. Varsayılan olarak son `limit`
+    mesaj gelir; `before=next_cursor` ile daha eskiler yüklenir. Mesajlar her
+    sayfada kronolojik sıradadır.
+    """
+    conversation = await db.conversations.find_one(
+        {"id": conversation_id, "user_id": current_user.id, "deleted_at": None}, {"_id": 1}
+    )
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    page = await keyset_page(
+        db.messages,
+        {"conversation_id": conversation_id},
+        MESSAGE_LIST_PROJECTION,
+        time_field="created_at",
+        newest_first=False,
+        limit=limit,
+        before=before,
+        after=after,
+    )
+    for item in page["items"]:
+        with_blob_urls(item, current_user.id)
+    return FastJSONResponse(page)
+
+
+SEARCH_PAGE_SIZE_DEFAULT = 20
+SEARCH_PAGE_SIZE_MAX = 50
+# Alaka sırası keyset ile sayfalanamaz (puan sorguya özgü); offset bu kadarla sınırlı
+SEARCH_MAX_OFFSET = 500
+SEARCH_SNIPPET_CHARS = 160
+SEARCH_TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def search_terms(query: str) -> List[str]:
+    """Mongo $text sözdizimindeki ifadeleri ve kelimeleri ("-" ile dışlananlar hariç) küçük harfle döner."""
+    terms = []
+    for phrase, word in SEARCH_TERM_RE.findall(query):
+        term = phrase or word
+        if term and not term.startswith("-"):
+            terms.append(term.lower())
+    return terms
+
+
+def search_snippet(content: str, terms: List[str], width: int = SEARCH_SNIPPET_CHARS) -> str:
+    """Mesajın ilk eşleşen terim etrafındaki `width` karakterlik kısmı."""
+    lowered = content.lower()
+    positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    end = min(len(content), start + width)
+    start = max(0, end - width)
+    snippet = " ".join(content[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+
+def encode_offset_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["o"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not 0 <= offset <= SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+
+@api_router.get("/chat/search", response_model=SearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(SEARCH_PAGE_SIZE_DEFAULT, ge=1, le=SEARCH_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Kullanıcının tüm konuşmalarındaki mesajlarda tam metin arama. (user_id,
+    content) text indeksi kullanılır; geçmişin tamamı taranmaz. Sonuçlar alaka
+    puanına, eşitlikte yeniliğe göre sıralanır. Mongo $text sözdizimi geçerlidir:
+    "tam ifade", -hariç.
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    terms = search_terms(q)
+    if not terms:
+        return FastJSONResponse({"items": [], "next_cursor": None})
+
+    # Silinmiş ama henüz temizlenmemiş konuşmalar hariç (liste kısa: temizleyici boşaltır)
+    deleted_ids = await db.conversations.distinct(
+        "id", {"user_id": current_user.id, "deleted_at": {"$type": "date"}}
+    )
+    query: Dict[str, Any] = {"user_id": current_user.id, "$text": {"$search": q}}
+    if deleted_ids:
+        query["conversation_id"] = {"$nin": deleted_ids}
+
+    docs = await db.messages.find(
+        query,
+        {
+            "_id": 0, "id": 1, "conversation_id": 1, "role": 1, "content": 1, "created_at": 1,
+            "score": {"$meta": "textScore"},
+        },
+    ).sort([("score", {"$meta": "textScore"}), ("created_at", -1)]).skip(offset).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(docs) > limit and offset + limit < SEARCH_MAX_OFFSET
+    docs = docs[:limit]
+
+    conversation_ids = list({doc["conversation_id"] for doc in docs})
+    titles = {
+        conv["id"]: conv["title"]
+        async for conv in db.conversations.find(
+            {"id": {"$in": conversation_ids}, "deleted_at": None}, {"_id": 0, "id": 1, "title": 1}
+        )
+    }
+
+    items = [
+        {
+            "message_id": doc["id"],
+            "conversation_id": doc["conversation_id"],
+            "conversation_title": titles[doc["conversation_id"]],
+            "role": doc["role"],
+            "snippet": search_snippet(doc["content"], terms),
+            "created_at": doc["created_at"],
+            "score": doc["score"],
+        }
+        for doc in docs
+        # Bu arada silinen konuşmalar
+        if doc["conversation_id"] in titles
+    ]
+    return FastJSONResponse({
+        "items": items,
+        "next_cursor": encode_offset_cursor(offset + limit) if has_more else None,
+    })
+
+
+async def prepare_chat_turn(
+    chat_req: ChatMessageRequest,
+    file: Optional[UploadFile],
+    current_user: User,
+) -> Dict[str, Any]:
+    """
+    Bir sohbet turunun LLM çağrısından önceki kısmını hazırlar:
+    sahiplik kontrolü, geçmiş, Gemini Part'leri ve kullanıcı mesajı.
+    """
+    # 1. En az bir LLM backend'i hazır mı? (Açılıştaki SDK yüklemesi bitmediyse beklenir)
+    await llm_providers.ensure_loaded()
+    if not chat_router.configured:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Gemini hizmeti kullanıma hazır değil.",
+            detail="AI hizmeti kullanıma hazır değil.",
         )
 
-    # 2. Konuşma var mı, bu kullanıcıya mı ait?
-    conversation = await db.conversations.find_one(
-        {"id": chat_req.conversation_id, "user_id": current_user.id}
+    # 2-3. Konuşma bu kullanıcıya mı ait + önceki mesajlar (history), birlikte.
+    # Yalnızca token bütçesine sığan son turlar gönderilir; dışarıda kalanlar özetlenir.
+    conversation, history = await load_conversation_with_history(
+        chat_req.conversation_id, current_user.id
     )
     if not conversation:
         raise HTTPException(
@@ -489,38 +3263,20 @@ async def send_message(
             detail="Conversation not found",
         )
 
-    # 3. Önceki mesajları al (history)
-    history = await get_gemini_chat_history(chat_req.conversation_id)
-
-    # 4. Sistem mesajı
-    system_instruction = (
-        "You are Alpine, a helpful and friendly AI assistant created to help users with any questions or tasks. "
-        "Be conversational, informative, and helpful."
-    )
-
-    # 5. Gemini chat oturumu oluştur
-    try:
-        chat_session = gemini_client.chats.create(
-            model=GEMINI_MODEL,
-            history=history,
-            config=genai.types.GenerateContentConfig(
-                system_instruction=system_instruction
-            ),
-        )
-    except Exception as e:
-        logging.error(f"Gemini chat oturumu oluşturulamadı: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="AI oturumu başlatılamadı. Lütfen daha sonra tekrar deneyin.",
-        )
+    window_start = split_history_by_budget(history, HISTORY_TOKEN_BUDGET)
+    summary_pending = window_start > 0 or len(history) >= HISTORY_LOAD_LIMIT
+    if summary_pending:
+        schedule_summary_refresh(chat_req.conversation_id)
 
-    # 6. Kullanıcı mesajını hazırla
+    # 4. Kullanıcı mesajını hazırla
     user_message_content = chat_req.message
 
-    image_data_to_save = None
+    image_ref_to_save = None
+    image_mime_to_save = None
+    thumb_ref_to_save = None
     has_image_to_save = False
 
-    # 7. Gemini'e gidecek Part listesi
+    # 5. Gemini'e gidecek Part listesi
     gemini_parts: List[Any] = []
 
     # Metni mutlaka Part'e çevir
@@ -533,14 +3289,25 @@ async def send_message(
     if file and file.filename:
         file_bytes = await file.read()
         if file.content_type and file.content_type.startswith("image/"):
-            image_base64 = base64.b64encode(file_bytes).decode("utf-8")
-            image_data_to_save = image_base64
+            # Küçült, metadata'yı at, yeniden kodla; gerçek MIME tipini kaydet
+            try:
+                image = await normalize_image(file_bytes)
+            except InvalidImageError as e:
+                logging.warning(f"Invalid image upload ({file.filename}): {e}")
+                raise HTTPException(status_code=400, detail="Görsel dosyası okunamadı.")
+
+            # Görsel mesaja gömülmez; blob store'a bir kez yazılır, mesaj hash'ini tutar
+            image_ref_to_save, thumb_ref_to_save = await asyncio.gather(
+                blob_store.put(image["data"], image["mime_type"]),
+                blob_store.put(image["thumb_data"], image["thumb_mime_type"]),
+            )
+            image_mime_to_save = image["mime_type"]
             has_image_to_save = True
 
             gemini_parts.append(
                 genai.types.Part.from_bytes(
-                    data=file_bytes,
-                    mime_type=file.content_type,
+                    data=image["data"],
+                    mime_type=image["mime_type"],
                 )
             )
         else:
@@ -549,92 +3316,966 @@ async def send_message(
                 f"\n\n(Dosya adı: {file.filename}, Tür: {file.content_type} eklendi.)"
             )
 
-    # 8. Kullanıcı mesajını DB'ye kaydet
+    # 6. Kullanıcı mesajı LLM çağrısından önce kaydedilir; çağrı başarısız olsa da kaybolmaz
     user_message = Message(
         conversation_id=chat_req.conversation_id,
+        user_id=current_user.id,
         role="user",
         content=user_message_content,
         has_image=has_image_to_save,
-        image_data=image_data_to_save,
+        image_ref=image_ref_to_save,
+        image_mime=image_mime_to_save,
+        thumb_ref=thumb_ref_to_save,
+    )
+    await db.messages.insert_one(user_message.model_dump())
+
+    # send_message tek Part ya da Part listesi kabul ediyor
+    if len(gemini_parts) == 1:
+        send_content = gemini_parts[0]
+    else:
+        send_content = gemini_parts
+
+    system_instruction = build_system_instruction(conversation)
+    # Sistem mesajı + özetlenmemiş geçmişin başı sağlayıcıda önbellekteyse geçmiş
+    # sabit önekten başlar ve yalnızca kalanı gönderilir; yoksa bütçe penceresi
+    context_cache_record = conversation.get("context_cache")
+    context_cache, prefix_reused = context_caches.lookup(context_cache_record, system_instruction, history)
+
+    return {
+        "history": history if context_cache is not None else history[window_start:],
+        "system_instruction": system_instruction,
+        "context_cache": context_cache,
+        "context_cache_record": context_cache_record,
+        "context_prefix": history,
+        "context_prefix_reused": prefix_reused,
+        "summary_pending": summary_pending,
+        "user_id": current_user.id,
+        "user_content": genai.types.Content(role="user", parts=gemini_parts),
+        "send_content": send_content,
+        "user_message": user_message,
+        "summarized_until": conversation.get("summarized_until"),
+        # İlk mesaj mı?
+        "is_first_message": len(history) == 0 and not conversation.get("summary"),
+    }
+
+
+async def touch_conversation(conversation_id: str, updated_at: datetime) -> None:
+    """
+    Konuşmanın updated_at alanını ileri taşır (geri almaz) ve açık client'lara
+    bildirir. Tur sürerken silinen konuşma için bildirim gönderilmez.
+    """
+    conversation = await db.conversations.find_one_and_update(
+        {"id": conversation_id, "deleted_at": None},
+        {"$max": {"updated_at": updated_at}},
+        projection=CONVERSATION_EVENT_PROJECTION,
+        return_document=ReturnDocument.AFTER,
     )
-    user_msg_dict = user_message.model_dump()
-    user_msg_dict["created_at"] = user_msg_dict["created_at"].isoformat()
-    await db.messages.insert_one(user_msg_dict)
+    publish_conversation_updated(conversation)
 
-    # 9. İlk mesaj mı?
-    is_first_message = len(history) == 0
 
-    # 10. Gemini'den yanıt al
-    try:
-        # send_message için: async değil, keyword yok → sadece pozisyonel argüman
-        if len(gemini_parts) == 1:
-            send_content = gemini_parts[0]
-        else:
-            send_content = gemini_parts
+async def finalize_chat_turn(
+    chat_req: ChatMessageRequest,
+    turn: Dict[str, Any],
+    assistant_message_content: str,
+) -> Message:
+    """
+    Asistan mesajını kaydeder ve konuşmanın updated_at alanını eşzamanlı
+    günceller (kullanıcı mesajı prepare_chat_turn'de kaydedildi). updated_at
+    geçmiş önbelleğinin sürümüdür; kuyrukta düşebilecek bir işe bırakılmaz.
+    İlk turda başlık üretimi kuyruğa atılır. Yeni tur geçmiş önbelleğine
+    eklenir, context cache bakımı kuyruğa atılır.
+    """
+    assistant_message = Message(
+        conversation_id=chat_req.conversation_id,
+        user_id=turn["user_id"],
+        role="assistant",
+        content=assistant_message_content,
+    )
+    updated_at = assistant_message.created_at
+    await asyncio.gather(
+        db.messages.insert_one(assistant_message.model_dump()),
+        touch_conversation(chat_req.conversation_id, updated_at),
+    )
+
+    # Başlık yanıtı bekletmeden arka planda üretilir
+    if turn["is_first_message"]:
+        schedule_title_generation(chat_req.conversation_id, chat_req.message)
+
+    new_contents = [
+        turn["user_content"],
+        genai.types.Content(
+            role="model",
+            parts=[genai.types.Part.from_text(text=assistant_message_content)],
+        ),
+    ]
+    history_cache.append(
+        chat_req.conversation_id,
+        new_contents,
+        history_cache_version({"updated_at": updated_at, "summarized_until": turn["summarized_until"]}),
+    )
+    context_caches.after_turn(chat_req.conversation_id, turn["user_id"], turn, new_contents)
+
+    return assistant_message
 
-        llm_response = chat_session.send_message(send_content)
-        assistant_message_content = llm_response.text
-    except APIError as e:
-        logging.error(f"Gemini API Error: {e}")
+
+async def abandon_chat_turn(chat_req: ChatMessageRequest, turn: Dict[str, Any]) -> None:
+    """
+    LLM yanıtı alınamadı (hata, zaman aşımı, istemci koptu). Kullanıcı mesajı
+    kayıtlı kalır; konuşma o mesajla güncellenmiş sayılır ve geçmiş önbelleği
+    bırakılır. İstek iptal edilmiş olsa da güncelleme tamamlanır.
+    """
+    history_cache.invalidate(chat_req.conversation_id)
+    touch = asyncio.ensure_future(touch_conversation(chat_req.conversation_id, turn["user_message"].created_at))
+    await asyncio.shield(touch)
+
+
+async def run_chat_turn(
+    chat_req: ChatMessageRequest,
+    file: Optional[UploadFile],
+    current_user: User,
+    request: Optional[Request],
+) -> Dict[str, Any]:
+    """Tam bir sohbet turu: hazırlık, LLM çağrısı ve kayıt. `request` verilirse istemci koptuğunda iptal edilir."""
+    with CHAT_TURN_PHASE_DURATION.labels("prepare").time():
+        turn = await prepare_chat_turn(chat_req, file, current_user)
+
+    # Gemini'den yanıt al (async gateway: event loop bloklanmaz, istemci koparsa iptal)
+    llm_started = time.perf_counter()
+    answered = False
+    try:
+        assistant_message_content = await llm_gateway.send_chat_message(
+            router=chat_router,
+            history=turn["history"],
+            message=turn["send_content"],
+            system_instruction=turn["system_instruction"],
+            cache=turn["context_cache"],
+            request=request,
+        )
+        answered = True
+    except LLMClientDisconnected:
+        logging.info("Client disconnected; LLM call cancelled.")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except LLMOverloaded:
+        raise llm_overloaded_error()
+    except LLMTimeoutError:
+        logging.error("LLM call timed out")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="AI'dan yanıt alınamadı. Lütfen API anahtarınızı kontrol edin.",
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="AI yanıtı zaman aşımına uğradı. Lütfen tekrar deneyin.",
         )
+    except LLMUnavailable as e:
+        logging.error(f"All LLM backends failed: {e.__cause__ or e}")
+        raise llm_unavailable_error()
     except Exception as e:
         logging.error(f"Unexpected error during chat: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Beklenmedik bir hata oluştu.",
         )
+    finally:
+        CHAT_TURN_PHASE_DURATION.labels("llm").observe(time.perf_counter() - llm_started)
+        if not answered:
+            await abandon_chat_turn(chat_req, turn)
 
-    # 11. Asistan mesajını DB'ye kaydet
-    assistant_message = Message(
-        conversation_id=chat_req.conversation_id,
-        role="assistant",
-        content=assistant_message_content,
-    )
-    assistant_msg_dict = assistant_message.model_dump()
-    assistant_msg_dict["created_at"] = assistant_msg_dict["created_at"].isoformat()
-    await db.messages.insert_one(assistant_msg_dict)
+    with CHAT_TURN_PHASE_DURATION.labels("finalize").time():
+        assistant_message = await finalize_chat_turn(chat_req, turn, assistant_message_content)
 
-    # 12. Konuşma başlığını / updated_at alanını güncelle
-    if is_first_message:
-        title = await generate_title_from_message(chat_req.message)
-        await db.conversations.update_one(
-            {"id": chat_req.conversation_id},
-            {
-                "$set": {
-                    "title": title,
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
-                }
-            },
+    return {
+        "user_message": message_out(turn["user_message"]),
+        "assistant_message": message_out(assistant_message),
+    }
+
+
+@api_router.post("/chat/message", response_model=ChatTurnOut)
+async def send_message(
+    request: Request,
+    chat_req: ChatMessageRequest = Depends(ChatMessageRequest.as_form),
+    file: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Mesaj gönderir ve AI'dan yanıt alır.
+
+    İsteğe bağlı `Idempotency-Key` başlığı: aynı anahtarla tekrar gelen istek
+    (yavaş yanıtta istemci/proxy yeniden denemesi) yeni mesaj kaydetmez ve
+    LLM'i tekrar çağırmaz; süren çağrıya bağlanır ya da kaydedilmiş yanıtı
+    alır. Bu durumda çağrı istemci koptuğunda iptal edilmez, çünkü sonucu
+    yeniden deneme alacaktır.
+    """
+    if idempotency_key is None:
+        await chat_admission(current_user)
+        return FastJSONResponse(await run_chat_turn(chat_req, file, current_user, request))
+
+    async def admitted_turn() -> Dict[str, Any]:
+        # Kota yalnızca gerçekten çalışan istekten düşülür; tekrarlar ücretsiz
+        await chat_admission(current_user)
+        return await run_chat_turn(chat_req, file, current_user, None)
+
+    try:
+        body = await chat_single_flight.run(
+            f"{current_user.id}:{idempotency_key}",
+            await chat_request_fingerprint(chat_req, file),
+            admitted_turn,
         )
-    else:
-        await db.conversations.update_one(
-            {"id": chat_req.conversation_id},
-            {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+    except IdempotencyKeyReused:
+        IDEMPOTENT_REQUESTS.labels("conflict").inc()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Bu Idempotency-Key farklı bir istek için kullanılmış.",
         )
+    except IdempotencyInProgress:
+        IDEMPOTENT_REQUESTS.labels("conflict").inc()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Aynı istek hâlâ işleniyor. Lütfen biraz sonra tekrar deneyin.",
+            headers={"Retry-After": "5"},
+        )
+    return FastJSONResponse(body)
 
-    # 13. Frontend'e cevap
-    return {
-        "user_message": user_message,
-        "assistant_message": assistant_message,
-    }
+
+def ndjson_line(event: Dict[str, Any]) -> bytes:
+    """Tek bir NDJSON satırı üretir (datetime vb. alanlar dahil)."""
+    return orjson.dumps(event, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+
+async def stream_chat_turn(chat_req: ChatMessageRequest, turn: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Hazırlanmış bir turu LLM'e akıtıp olayları üretir (NDJSON ve WebSocket ortak):
+    user_message, delta..., ardından done ya da error.
+    """
+    yield {"type": "user_message", "message": message_out(turn["user_message"])}
+
+    chunks: List[str] = []
+    llm_started = time.perf_counter()
+    answered = False
+    try:
+        async for text in llm_gateway.stream_chat_message(
+            router=chat_router,
+            history=turn["history"],
+            message=turn["send_content"],
+            system_instruction=turn["system_instruction"],
+            cache=turn["context_cache"],
+        ):
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+        answered = True
+    except LLMOverloaded:
+        REQUESTS_REJECTED.labels("llm_saturated").inc()
+        yield {"type": "error", "detail": "AI servisi şu anda çok yoğun. Lütfen birkaç saniye sonra tekrar deneyin."}
+        return
+    except LLMTimeoutError:
+        logging.error("LLM stream timed out")
+        yield {"type": "error", "detail": "AI yanıtı zaman aşımına uğradı. Lütfen tekrar deneyin."}
+        return
+    except LLMUnavailable as e:
+        logging.error(f"All LLM backends failed (stream): {e.__cause__ or e}")
+        yield {"type": "error", "detail": LLM_UNAVAILABLE_DETAIL}
+        return
+    except Exception as e:
+        logging.error(f"Unexpected error during chat stream: {e}")
+        yield {"type": "error", "detail": "Beklenmedik bir hata oluştu."}
+        return
+    finally:
+        CHAT_TURN_PHASE_DURATION.labels("llm").observe(time.perf_counter() - llm_started)
+        if not answered:
+            await abandon_chat_turn(chat_req, turn)
+
+    # Akış bitti: tam asistan mesajını kaydet
+    with CHAT_TURN_PHASE_DURATION.labels("finalize").time():
+        assistant_message = await finalize_chat_turn(chat_req, turn, "".join(chunks))
+    yield {"type": "done", "assistant_message": message_out(assistant_message)}
+
+
+@api_router.post("/chat/message/stream")
+async def send_message_stream(
+    chat_req: ChatMessageRequest = Depends(ChatMessageRequest.as_form),
+    file: Optional[UploadFile] = File(None),
+    current_user: User = Depends(chat_admission),
+):
+    """
+    Mesaj gönderir ve AI yanıtını üretildikçe NDJSON olarak akıtır.
+
+    Satır tipleri:
+      {"type": "user_message", "message": {...}}
+      {"type": "delta", "text": "..."}
+      {"type": "done", "assistant_message": {...}}
+      {"type": "error", "detail": "..."}
+    """
+    with CHAT_TURN_PHASE_DURATION.labels("prepare").time():
+        turn = await prepare_chat_turn(chat_req, file, current_user)
+
+    async def event_stream() -> AsyncIterator[bytes]:
+        async for event in stream_chat_turn(chat_req, turn):
+            yield ndjson_line(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @api_router.delete("/chat/conversation/{conversation_id}")
 async def delete_conversation(conversation_id: str, current_user: User = Depends(get_current_user)):
-    """Konuşmayı ve mesajlarını siler."""
-    conv_result = await db.conversations.delete_one({"id": conversation_id, "user_id": current_user.id})
-    if conv_result.deleted_count == 0:
+    """
+    Konuşmayı hemen gizler (soft delete). Mesajlar ve görseller arka plandaki
+    temizleyici tarafından partiler halinde silinir.
+    """
+    conv_result = await db.conversations.update_one(
+        {"id": conversation_id, "user_id": current_user.id, "deleted_at": None},
+        {"$set": {"deleted_at": utc_now()}},
+    )
+    if conv_result.matched_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found or not authorized",
         )
 
-    await db.messages.delete_many({"conversation_id": conversation_id})
+    history_cache.invalidate(conversation_id)
+    conversation_purger.wake()
+    publish_conversations_deleted(current_user.id, [conversation_id])
     return {"message": "Conversation and messages deleted successfully"}
 
+
+class DeleteConversationsRequest(BaseModel):
+    conversation_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+@api_router.post("/chat/conversations/delete")
+async def delete_conversations(req: DeleteConversationsRequest, current_user: User = Depends(get_current_user)):
+    """
+    Birden çok konuşmayı tek istekte siler (soft delete + arka plan temizliği).
+    Yalnızca kullanıcının henüz silinmemiş konuşmaları silinir ve diğer
+    sekmelere yalnızca bunlar bildirilir; başkasının ya da zaten silinmiş
+    id'ler yok sayılır.
+    """
+    conversation_ids = await db.conversations.distinct(
+        "id", {"id": {"$in": req.conversation_ids}, "user_id": current_user.id, "deleted_at": None}
+    )
+    if not conversation_ids:
+        return {"deleted_count": 0}
+
+    result = await db.conversations.update_many(
+        {"id": {"$in": conversation_ids}, "user_id": current_user.id, "deleted_at": None},
+        {"$set": {"deleted_at": utc_now()}},
+    )
+    for conversation_id in conversation_ids:
+        history_cache.invalidate(conversation_id)
+    conversation_purger.wake()
+    publish_conversations_deleted(current_user.id, conversation_ids)
+    return {"deleted_count": result.modified_count}
+
+# =========================================================================
+# DIŞA / İÇE AKTARMA (NDJSON)
+# =========================================================================
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_CONVERSATION_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "created_at": 1, "updated_at": 1, "summary": 1, "summarized_until": 1,
+}
+EXPORT_MESSAGE_PROJECTION = {
+    "_id": 0, "id": 1, "conversation_id": 1, "role": 1, "content": 1, "created_at": 1,
+    "has_image": 1, "image_ref": 1, "image_mime": 1, "image_data": 1,
+}
+
+
+async def export_lines(user: User, include_images: bool) -> AsyncIterator[bytes]:
+    """
+    Kullanıcının konuşmalarını ve mesajlarını NDJSON satırları olarak üretir.
+    Mongo cursor'ları parti parti okunur; bellekte aynı anda tek mesaj
+    (ve görseli) tutulur, hesap ne kadar büyük olursa olsun.
+    """
+    yield ndjson_line({
+        "type": "export",
+        "version": EXPORT_FORMAT_VERSION,
+        "exported_at": utc_now(),
+        "user": {"id": user.id, "full_name": user.full_name, "email": user.email},
+    })
+
+    conversations = db.conversations.find(
+        {"user_id": user.id, "deleted_at": None}, EXPORT_CONVERSATION_PROJECTION
+    ).sort([("created_at", 1), ("id", 1)])
+    async for conversation in conversations:
+        yield ndjson_line({"type": "conversation", "conversation": conversation})
+
+        messages = db.messages.find(
+            {"conversation_id": conversation["id"]}, EXPORT_MESSAGE_PROJECTION
+        ).sort([("created_at", 1), ("id", 1)])
+        async for message in messages:
+            image_ref = message.pop("image_ref", None)
+            if include_images and message.get("has_image") and not message.get("image_data") and image_ref:
+                blob = await blob_store.get(image_ref)
+                if blob is not None:
+                    message["image_data"] = base64.b64encode(blob[0]).decode("ascii")
+                    message["image_mime"] = message.get("image_mime") or blob[1]
+            elif not include_images:
+                message.pop("image_data", None)
+                if image_ref:
+                    # Aynı kurulumda içe aktarılırsa görsel bu referansla bulunur
+                    message["image_ref"] = image_ref
+            yield ndjson_line({"type": "message", "message": message})
+
+
+@api_router.get("/chat/export")
+async def export_conversations(
+    images: bool = Query(True, description="Görselleri base64 olarak göm"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Tüm konuşmaları ve mesajları NDJSON olarak akıtır: önce bir "export"
+    başlık satırı, sonra her konuşma için bir "conversation" satırı ve onun
+    "message" satırları. Çıktı /chat/import ile geri yüklenebilir.
+    """
+    filename = f"alpine-export-{utc_now():%Y%m%d}.ndjson"
+    return StreamingResponse(
+        export_lines(current_user, images),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+async def ndjson_records(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    İstek gövdesini parça parça okuyup (satır no, satır) üretir; gövde belleğe
+    alınmaz. Yarım kalan satırın parçaları ayrı tutulur ki uzun satırlar her
+    parçada baştan taranmasın.
+    """
+    pending: List[bytes] = []
+    pending_size = 0
+    line_no = 0
+    async for chunk in request.stream():
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            lines[0] = b"".join(pending) + lines[0]
+            pending, pending_size = [], 0
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+        if rest:
+            pending.append(rest)
+            pending_size += len(rest)
+            if pending_size > IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Satır {line_no + 1} çok büyük (en fazla {IMPORT_MAX_LINE_BYTES} bayt).",
+                )
+    line = b"".join(pending)
+    if line.strip():
+        yield line_no + 1, line
+
+
+class ConversationImporter:
+    """
+    NDJSON içe aktarma durumu. Konuşmalar ve mesajlar yeni id'lerle,
+    IMPORT_BATCH_SIZE'lık insert_many partileri halinde yazılır; dışa
+    aktarımdaki konuşma id'leri yenileriyle eşlenir (yalnızca id'ler bellekte).
+    """
+
+    MAX_REPORTED_ERRORS = 20
+
+    def __init__(self, user: User):
+        self.user = user
+        self.conversation_ids: Dict[str, str] = {}
+        self.conversations: List[Dict[str, Any]] = []
+        self.messages: List[Dict[str, Any]] = []
+        self.imported_conversations = 0
+        self.imported_messages = 0
+        self.skipped = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def fail(self, line_no: int, detail: str) -> None:
+        self.skipped += 1
+        if len(self.errors) < self.MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "detail": detail})
+
+    async def add(self, line_no: int, record: Dict[str, Any]) -> None:
+        kind = record.get("type")
+        if kind == "export":
+            if record.get("version") != EXPORT_FORMAT_VERSION:
+                raise HTTPException(status_code=400, detail=f"Desteklenmeyen dışa aktarma sürümü: {record.get('version')}")
+        elif kind == "conversation":
+            await self.add_conversation(record["conversation"])
+        elif kind == "message":
+            await self.add_message(line_no, record["message"])
+        else:
+            self.fail(line_no, f"Unknown record type: {kind}")
+
+    async def add_conversation(self, data: Dict[str, Any]) -> None:
+        conversation = Conversation(
+            user_id=self.user.id,
+            title=data.get("title") or "New Chat Topic",
+            created_at=data.get("created_at") or utc_now(),
+            updated_at=data.get("updated_at") or data.get("created_at") or utc_now(),
+            summary=data.get("summary"),
+            summarized_until=data.get("summarized_until"),
+        )
+        self.conversation_ids[data["id"]] = conversation.id
+        self.conversations.append(conversation.model_dump())
+        # Mesajsız çok sayıda konuşma da bellekte birikmesin
+        if len(self.conversations) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def add_message(self, line_no: int, data: Dict[str, Any]) -> None:
+        conversation_id = self.conversation_ids.get(data.get("conversation_id"))
+        if conversation_id is None:
+            self.fail(line_no, "Message refers to a conversation that was not imported")
+            return
+        if data.get("role") not in ("user", "assistant"):
+            self.fail(line_no, f"Invalid role: {data.get('role')}")
+            return
+
+        message = Message(
+            conversation_id=conversation_id,
+            user_id=self.user.id,
+            role=data["role"],
+            content=data.get("content") or "",
+            created_at=data.get("created_at") or utc_now(),
+        )
+        if data.get("image_data"):
+            # Yüklemeyle aynı yol: doğrula, küçült, küçük resmi üret
+            try:
+                image = await normalize_image(base64.b64decode(data["image_data"]))
+            except Exception as e:
+                self.fail(line_no, f"Invalid image: {e}")
+            else:
+                message.image_ref, message.thumb_ref = await asyncio.gather(
+                    blob_store.put(image["data"], image["mime_type"]),
+                    blob_store.put(image["thumb_data"], image["thumb_mime_type"]),
+                )
+                message.image_mime = image["mime_type"]
+                message.has_image = True
+        elif (
+            BLOB_HASH_RE.match(str(data.get("image_ref")))
+            and await user_owns_blob(self.user.id, data["image_ref"])
+            and await blob_store.touch(data["image_ref"])
+        ):
+            # Görselsiz dışa aktarım, aynı kurulum: blob hâlâ duruyor. Yalnızca
+            # kullanıcının zaten sahip olduğu görsel bağlanır; hash'i bilmek yetmez.
+            message.image_ref = data["image_ref"]
+            message.image_mime = data.get("image_mime")
+            message.has_image = True
+
+        self.messages.append(message.model_dump())
+        if len(self.messages) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        # Önce konuşmalar: yarıda kesilirse mesajlar sahipsiz kalmaz
+        if self.conversations:
+            await db.conversations.insert_many(self.conversations, ordered=False)
+            self.imported_conversations += len(self.conversations)
+            for conversation in self.conversations:
+                publish_conversation_updated(
+                    {field: conversation[field] for field in ("id", "user_id", "title", "updated_at")}
+                )
+            self.conversations = []
+        if self.messages:
+            await db.messages.insert_many(self.messages, ordered=False)
+            self.imported_messages += len(self.messages)
+            self.messages = []
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "imported_conversations": self.imported_conversations,
+            "imported_messages": self.imported_messages,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+@api_router.post("/chat/import")
+async def import_conversations(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    /chat/export çıktısını (ham NDJSON gövdesi) hesaba ekler. Gövde akış olarak
+    okunur ve partiler halinde yazılır, büyük hesaplar belleğe sığmak zorunda
+    değildir. Konuşmalar yeni id'ler alır; aynı dosya iki kez yüklenirse
+    konuşmalar iki kez eklenir. Hatalı satırlar atlanır ve raporlanır.
+    """
+    importer = ConversationImporter(current_user)
+    try:
+        async for line_no, line in ndjson_records(request):
+            try:
+                record = orjson.loads(line)
+                await importer.add(line_no, record)
+            except HTTPException:
+                raise
+            except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError, ValidationError) as e:
+                importer.fail(line_no, f"Invalid record: {e}")
+        await importer.flush()
+    except HTTPException:
+        # Hatalı satıra kadar okunan geçerli kayıtlar yine yazılır
+        await importer.flush()
+        raise
+
+    result = importer.result()
+    logging.info(
+        f"User {current_user.id} imported {result['imported_conversations']} conversations, "
+        f"{result['imported_messages']} messages ({result['skipped']} skipped)."
+    )
+    return FastJSONResponse(result)
+
+
+# =========================================================================
+# WEBSOCKET SOHBET KANALI
+# =========================================================================
+
+CONVERSATION_EVENT_PROJECTION = {"_id": 0, "id": 1, "user_id": 1, "title": 1, "updated_at": 1}
+
+
+class ConversationEventHub:
+    """
+    Kullanıcı başına açık WebSocket bağlantılarına olay dağıtır (başlık
+    üretildi, konuşma güncellendi/silindi). Worker içidir: olay, onu üreten
+    worker'daki bağlantılara gider; diğer worker'lardaki sekmeler bir sonraki
+    listelemede görür.
+    """
+
+    MAX_PENDING_EVENTS = 256
+
+    def __init__(self):
+        self._subscribers: Dict[str, set] = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.MAX_PENDING_EVENTS)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Olayları okumayan yavaş bağlantı: bu olay atlanır
+                pass
+
+
+conversation_events = ConversationEventHub()
+
+
+def publish_conversation_updated(conversation: Optional[Dict[str, Any]]) -> None:
+    if conversation is None:
+        return
+    user_id = conversation.pop("user_id")
+    conversation_events.publish(user_id, {"type": "conversation_updated", "conversation": conversation})
+
+
+def publish_conversations_deleted(user_id: str, conversation_ids: List[str]) -> None:
+    conversation_events.publish(user_id, {"type": "conversation_deleted", "conversation_ids": conversation_ids})
+
+
+class ChatSocketSession:
+    """
+    Doğrulanmış tek bir WebSocket bağlantısı. Farklı konuşmalara gönderilen
+    mesajlar eşzamanlı işlenir; aynı konuşmadaki mesajlar sırayla. Tüm giden
+    olaylar tek bir yazıcı görevden geçer.
+    """
+
+    def __init__(self, websocket: WebSocket, token: str, user: User):
+        self.websocket = websocket
+        self.token = token
+        self.user = user
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._turns: Dict[str, "asyncio.Task[None]"] = {}
+        self._conversation_locks: Dict[str, asyncio.Lock] = {}
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        await self._outbox.put(event)
+
+    async def _write_events(self) -> None:
+        try:
+            while True:
+                event = await self._outbox.get()
+                if isinstance(event, int):
+                    # Kapatma kodu: önceki olaylar gönderildikten sonra bağlantıyı kapat
+                    await self.websocket.close(code=event)
+                    return
+                await self.websocket.send_text(orjson.dumps(event, option=ORJSON_OPTIONS).decode("utf-8"))
+        except (WebSocketDisconnect, RuntimeError):
+            # Bağlantı kapandı; okuma döngüsü oturumu sonlandırır
+            pass
+
+    async def _forward_conversation_events(self, queue: asyncio.Queue) -> None:
+        while True:
+            await self.send(await queue.get())
+
+    async def _run_turn(self, rid: Any, chat_req: ChatMessageRequest) -> None:
+        tag = {"rid": rid, "conversation_id": chat_req.conversation_id}
+        lock = self._conversation_locks.setdefault(chat_req.conversation_id, asyncio.Lock())
+        async with lock:
+            try:
+                # Token iptal edildiyse (şifre sıfırlama, hesap silme) bağlantı da düşer
+                self.user = await authenticate_token(self.token)
+                await chat_admission(self.user)
+                with CHAT_TURN_PHASE_DURATION.labels("prepare").time():
+                    turn = await prepare_chat_turn(chat_req, None, self.user)
+            except HTTPException as e:
+                event = {"type": "error", **tag, "status": e.status_code, "detail": e.detail}
+                if e.headers and "Retry-After" in e.headers:
+                    event["retry_after"] = int(e.headers["Retry-After"])
+                await self.send(event)
+                if e.status_code == status.HTTP_401_UNAUTHORIZED:
+                    await self._outbox.put(4401)
+                return
+            except Exception as e:
+                logging.error(f"Unexpected error preparing websocket chat turn: {e}")
+                await self.send({"type": "error", **tag, "status": 500, "detail": "Beklenmedik bir hata oluştu."})
+                return
+
+            async for event in stream_chat_turn(chat_req, turn):
+                await self.send({**event, **tag})
+
+    def _start_turn(self, data: Dict[str, Any]) -> None:
+        rid = data.get("rid")
+        try:
+            chat_req = ChatMessageRequest(conversation_id=data.get("conversation_id"), message=data.get("message"))
+        except ValidationError:
+            self._outbox.put_nowait({"type": "error", "rid": rid, "status": 422, "detail": "conversation_id and message are required"})
+            return
+        key = str(rid) if rid is not None else uuid.uuid4().hex
+        if key in self._turns:
+            # Aynı rid ile süren tur varken ikincisi iptal edilemez olurdu
+            self._outbox.put_nowait({"type": "error", "rid": rid, "status": 409, "detail": "A turn with this rid is still running"})
+            return
+        task = asyncio.create_task(self._run_turn(rid, chat_req))
+        self._turns[key] = task
+        task.add_done_callback(lambda done: self._turns.pop(key) if self._turns.get(key) is done else None)
+
+    async def run(self) -> None:
+        events = conversation_events.subscribe(self.user.id)
+        background = [
+            asyncio.create_task(self._write_events()),
+            asyncio.create_task(self._forward_conversation_events(events)),
+        ]
+        WS_CONNECTIONS.inc()
+        try:
+            await self.send({"type": "ready", "user": {"id": self.user.id, "full_name": self.user.full_name}})
+            while True:
+                try:
+                    data = orjson.loads(await self.websocket.receive_text())
+                except orjson.JSONDecodeError:
+                    await self.send({"type": "error", "status": 400, "detail": "Invalid JSON"})
+                    continue
+                kind = data.get("type") if isinstance(data, dict) else None
+                if kind == "send":
+                    self._start_turn(data)
+                elif kind == "cancel":
+                    task = self._turns.get(str(data.get("rid")))
+                    if task is not None:
+                        task.cancel()
+                elif kind == "ping":
+                    await self.send({"type": "pong"})
+                else:
+                    await self.send({"type": "error", "status": 400, "detail": f"Unknown message type: {kind}"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            WS_CONNECTIONS.dec()
+            conversation_events.unsubscribe(self.user.id, events)
+            # Bağlantı koptu: süren LLM çağrıları iptal edilir
+            for task in [*self._turns.values(), *background]:
+                task.cancel()
+
+
+@api_router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Tek bağlantı üzerinden sohbet. Auth bağlantı başına bir kez yapılır:
+    ilk mesaj {"type": "auth", "token": "..."} olmalıdır.
+
+    İstemci -> sunucu:
+      {"type": "send", "rid": ..., "conversation_id": "...", "message": "..."}
+      {"type": "cancel", "rid": ...}
+      {"type": "ping"}
+    Sunucu -> istemci (rid ve conversation_id ile etiketli):
+      ready, user_message, delta, done, error, pong,
+      conversation_updated (başlık / updated_at), conversation_deleted
+    Görsel ekli mesajlar HTTP uçlarından gönderilir. Aynı rid ile süren bir
+    tur varken gelen "send" 409 hatasıyla reddedilir.
+    """
+    await websocket.accept()
+    try:
+        data = orjson.loads(await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT_SECONDS))
+        if not isinstance(data, dict) or data.get("type") != "auth" or not data.get("token"):
+            raise ValueError("auth message expected")
+        token = data["token"]
+        user = await authenticate_token(token)
+    except (asyncio.TimeoutError, ValueError, HTTPException):
+        await websocket.close(code=4401)
+        return
+    except WebSocketDisconnect:
+        return
+
+    await ChatSocketSession(websocket, token, user).run()
+
+# =========================================================================
+# HESAP SİLME VE ARKA PLAN TEMİZLEYİCİ
+# =========================================================================
+
+
+@api_router.delete("/auth/me")
+async def delete_account(current_user: User = Depends(get_current_user)):
+    """
+    Hesabı siler: kullanıcı hemen devre dışı kalır (mevcut token'lar geçersiz,
+    email yeniden kayda açık), tüm konuşmaları gizlenir. Veriler temizleyici
+    tarafından partiler halinde silinir; en son kullanıcı dokümanı kaldırılır.
+    """
+    now = utc_now()
+    await db.users.update_one(
+        {"id": current_user.id},
+        {
+            "$set": {"is_active": False, "deleted_at": now, "email": f"deleted+{current_user.id}@deleted.example.com"},
+            "$inc": {"token_version": 1},
+        },
+    )
+    invalidate_user_cache(current_user.id)
+    await db.password_reset_codes.delete_many({"user_id": current_user.id})
+    await db.conversations.update_many(
+        {"user_id": current_user.id, "deleted_at": None},
+        {"$set": {"deleted_at": now}},
+    )
+    conversation_purger.wake()
+    return {"message": "Hesabınız silindi."}
+
+
+class ConversationPurger:
+    """
+    Soft delete edilmiş konuşmaların mesajlarını PURGE_BATCH_SIZE'lık partiler
+    halinde, aralarda PURGE_BATCH_PAUSE_SECONDS bekleyerek siler; böylece büyük
+    silmeler veritabanında ani yük oluşturmaz. Başka mesajın kullanmadığı
+    görselleri de blob store'dan kaldırır. Birden çok worker aynı konuşmayı
+    almasın diye her konuşma süreli bir "claim" ile işaretlenir. Konuşmanın
+    Gemini context cache'i de sağlayıcıdan silinir.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                worked = await self._purge_next_conversation()
+                if not worked:
+                    worked = await self._purge_next_user()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Conversation purger error: {e}")
+                worked = False
+
+            if not worked:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), PURGE_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _purge_next_conversation(self) -> bool:
+        now = utc_now()
+        conversation = await db.conversations.find_one_and_update(
+            {
+                "deleted_at": {"$type": "date"},
+                "$or": [
+                    {"purge_claimed_at": None},
+                    {"purge_claimed_at": {"$lt": now - timedelta(seconds=PURGE_LEASE_SECONDS)}},
+                ],
+            },
+            {"$set": {"purge_claimed_at": now}},
+            projection={"_id": 0, "id": 1, "context_cache": 1},
+        )
+        if conversation is None:
+            return False
+
+        conversation_id = conversation["id"]
+        if (conversation.get("context_cache") or {}).get("name"):
+            await context_caches.delete(conversation["context_cache"]["name"])
+        deleted = 0
+        while True:
+            batch = await db.messages.find(
+                {"conversation_id": conversation_id},
+                {"_id": 1, "image_ref": 1, "thumb_ref": 1},
+            ).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+            if not batch:
+                break
+
+            await db.messages.delete_many({"_id": {"$in": [m["_id"] for m in batch]}})
+            deleted += len(batch)
+
+            refs = {m[field] for m in batch for field in ("image_ref", "thumb_ref") if m.get(field)}
+            for ref in refs:
+                await release_blob(ref)
+
+            await asyncio.sleep(PURGE_BATCH_PAUSE_SECONDS)
+
+        await db.conversations.delete_one({"id": conversation_id})
+        logging.info(f"Purged conversation {conversation_id} ({deleted} messages).")
+        return True
+
+    async def _purge_next_user(self) -> bool:
+        """Konuşmaları tamamen temizlenmiş silinmiş kullanıcıları kaldırır."""
+        async for user_doc in db.users.find({"deleted_at": {"$type": "date"}}, {"_id": 0, "id": 1}):
+            if await db.conversations.find_one({"user_id": user_doc["id"]}, {"_id": 1}):
+                continue
+            await db.users.delete_one({"id": user_doc["id"]})
+            logging.info(f"Purged deleted user {user_doc['id']}.")
+            return True
+        return False
+
+
+async def release_blob(blob_hash: str) -> None:
+    """
+    Görsele başka mesaj referans vermiyorsa blob store'dan siler. Son
+    BLOB_GC_GRACE_SECONDS içinde yeniden yüklenmiş görseller atlanır: o sırada
+    henüz kaydedilmemiş bir mesaj onu kullanıyor olabilir.
+    """
+    in_use = await db.messages.find_one(
+        {"$or": [{"image_ref": blob_hash}, {"thumb_ref": blob_hash}]}, {"_id": 1}
+    )
+    if in_use:
+        return
+
+    meta = await db.blobs.find_one({"_id": blob_hash}, {"last_ref_at": 1})
+    if meta is None:
+        return
+    if meta.get("last_ref_at") and meta["last_ref_at"] > utc_now() - timedelta(seconds=BLOB_GC_GRACE_SECONDS):
+        return
+
+    await blob_store.delete(blob_hash)
+
+
+conversation_purger = ConversationPurger()
+
+
+@app.on_event("startup")
+async def start_conversation_purger():
+    conversation_purger.start()
+
+
+@app.on_event("shutdown")
+async def stop_conversation_purger():
+    await conversation_purger.stop()
+
 # =========================================================================
 # GENEL YAPILANDIRMA VE STATİK DOSYALAR
 # =========================================================================
@@ -648,19 +4289,214 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
 logger = logging.getLogger(__name__)
 
-STATIC_DIR = "."
 
-app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrikleri."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# =========================================================================
+# STATİK DOSYALAR (YALNIZCA FRONTEND, ÖN SIKIŞTIRILMIŞ, PARMAK İZLİ)
+# =========================================================================
+
+FRONTEND_DIR = Path(__file__).resolve().parent
+# Sunulan dosyalar yalnızca bunlar; çalışma klasörünün geri kalanı dışarı açılmaz
+FRONTEND_ASSETS = {
+    "app-final.js": "application/javascript; charset=utf-8",
+    "app.css": "text/css; charset=utf-8",
+}
+FRONTEND_INDEX = "index.html"
+# index.html'deki "app.css" / "app-final.js?v=..." referansları parmak izli adreslerle değiştirilir
+ASSET_REFERENCE_RE = re.compile(r'(src|href)="(' + "|".join(map(re.escape, FRONTEND_ASSETS)) + r')(\?[^"]*)?"')
+
+NO_CACHE = "no-cache"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+class StaticAsset:
+    """Bellekte tutulan bir dosya: ham hali + gzip/brotli varyantları ve ETag."""
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.variants: Dict[str, bytes] = {"identity": body}
+        compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(body, quality=11)
+        for encoding, data in compressed.items():
+            if len(data) < len(body):
+                self.variants[encoding] = data
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        accepted = {e.split(";")[0].strip() for e in request.headers.get("accept-encoding", "").split(",")}
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in self.variants), "identity")
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.content_type, headers=headers)
+
+
+# Yol -> StaticAsset (açılışta doldurulur)
+static_assets: Dict[str, StaticAsset] = {}
+
+
+def build_static_assets() -> Dict[str, StaticAsset]:
+    """
+    Frontend dosyalarını okur, içerik hash'i ile parmak izli adlar üretir
+    (/assets/app-final.<hash>.js, süresiz önbelleklenir) ve index.html'i bu
+    adlara göre yeniden yazar. index.html ve eski adlar her seferinde ETag ile
+    doğrulanır (no-cache), böylece yeni sürüm hemen görünür.
+    """
+    assets: Dict[str, StaticAsset] = {}
+    fingerprinted: Dict[str, str] = {}
+    for name, content_type in FRONTEND_ASSETS.items():
+        body = (FRONTEND_DIR / name).read_bytes()
+        stem, dot, suffix = name.rpartition(".")
+        path = f"/assets/{stem}.{hashlib.sha256(body).hexdigest()[:12]}{dot}{suffix}"
+        fingerprinted[name] = path
+        assets[path] = StaticAsset(body, content_type, IMMUTABLE_CACHE)
+        assets[f"/{name}"] = StaticAsset(body, content_type, NO_CACHE)
+
+    index_html = (FRONTEND_DIR / FRONTEND_INDEX).read_text(encoding="utf-8")
+    index_html = ASSET_REFERENCE_RE.sub(lambda m: f'{m.group(1)}="{fingerprinted[m.group(2)]}"', index_html)
+    index = StaticAsset(index_html.encode("utf-8"), "text/html; charset=utf-8", NO_CACHE)
+    assets["/"] = index
+    assets[f"/{FRONTEND_INDEX}"] = index
+    return assets
+
+
+@app.on_event("startup")
+async def load_static_assets():
+    try:
+        static_assets.update(build_static_assets())
+    except OSError as e:
+        logging.error(f"Frontend dosyaları yüklenemedi: {e}")
+
+
+class JSONGzipMiddleware:
+    """
+    GZIP_MIN_BYTES'tan büyük, tek parça JSON yanıtlarını (mesaj/konuşma
+    listeleri vb.) gzip ile sıkıştırır. Akış yanıtları (NDJSON) ve görseller
+    olduğu gibi geçer; parça parça iletilmeleri bozulmaz.
+    """
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"")
+        if b"gzip" not in accept:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def send_maybe_gzipped(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                return await send(message)
+
+            start, start_message = start_message, None
+            headers = dict((k.lower(), v) for k, v in start["headers"])
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and headers.get(b"content-type", b"").startswith(b"application/json")
+                and b"content-encoding" not in headers
+                and len(body) >= self.minimum_size
+            ):
+                body = gzip.compress(body, compresslevel=6)
+                raw_headers = [(k, v) for k, v in start["headers"] if k.lower() != b"content-length"]
+                raw_headers += [
+                    (b"content-encoding", b"gzip"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"vary", b"Accept-Encoding"),
+                ]
+                start = {**start, "headers": raw_headers}
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_maybe_gzipped)
+
+
+app.add_middleware(JSONGzipMiddleware, minimum_size=GZIP_MIN_BYTES)
 
 
 @app.get("/health")
 async def health_check():
-    """Render için Health check endpoint'i."""
+    """Liveness: süreç ayakta mı (bağımlılıklara bakmaz). Trafik yönlendirmesi için /ready."""
     return {"status": "healthy"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Render readiness (Health Check Path): açılış bitti mi (Mongo indeksleri,
+    LLM SDK'ları ve ısınma) ve Mongo şu an erişilebilir mi? Değilse 503.
+    LLM erişimi ve devre durumları raporlanır; açık devre ya da başarısız
+    ısınma yalnızca "degraded" yapar (sağlayıcı kesintisinde tüm instance'lar
+    trafikten çıkmasın).
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READY_PING_TIMEOUT_SECONDS)
+        mongo = {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        mongo = {"ok": False, "error": repr(e)}
+
+    backends = {
+        b.name: {
+            "configured": b.configured,
+            "reachable": llm_providers.reachable.get(b.name),
+            "circuit": "open" if b.breaker.opened_at is not None else "closed",
+        }
+        for b in chat_router.backends
+    }
+    if not startup_report.ready:
+        state = "starting"
+    elif not mongo["ok"] or not chat_router.configured:
+        state = "unavailable"
+    elif all(b["configured"] and b["reachable"] is not False and b["circuit"] == "closed" for b in backends.values()):
+        state = "ready"
+    else:
+        state = "degraded"
+
+    body = {
+        "status": state,
+        "startup": startup_report.phases,
+        "mongo": mongo,
+        "llm": {"loaded": llm_providers.loaded, "backends": backends},
+    }
+    code = status.HTTP_200_OK if state in ("ready", "degraded") else status.HTTP_503_SERVICE_UNAVAILABLE
+    return FastJSONResponse(body, status_code=code, headers={"Cache-Control": "no-store"})
+
+
+# En sona kayıtlı olmalı: diğer tüm route'lardan sonra eşleşir
+@app.get("/{asset_path:path}", include_in_schema=False)
+async def serve_frontend(asset_path: str, request: Request):
+    asset = static_assets.get(f"/{asset_path}")
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return asset.response(request)
+
+
+startup_report.mark("import")
@@ -0,0 +1,40 @@
+"""
+Testler server.py'yi dış servis olmadan içe aktarır: Motor istemcisi
+mongomock_motor ile değiştirilir (bench/serve_app.py'deki gibi), blob'lar
+geçici bir dizine yazılır. LLM çağrısı yapılmaz.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import mongomock_motor
+import motor.motor_asyncio
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("DB_NAME", "alpine_ai_test")
+os.environ["BLOB_BACKEND"] = "local"
+os.environ["BLOB_DIR"] = tempfile.mkdtemp(prefix="alpine-test-blobs-")
+
+
+class InMemoryMotorClient(mongomock_motor.AsyncMongoMockClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(tz_aware=kwargs.get("tz_aware", False))
+
+
+motor.motor_asyncio.AsyncIOMotorClient = InMemoryMotorClient
+
+import server  # noqa: E402  (Motor istemcisi değiştirildikten sonra içe aktarılmalı)
+
+
+@pytest.fixture
+def db():
+    """Her test boş bir veritabanıyla başlar."""
+    asyncio.run(server.client.drop_database(server.DB_NAME))
+    return server.db
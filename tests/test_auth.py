@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_concurrent_registration_with_same_email_returns_400(db, monkeypatch):
+    asyncio.run(db.users.create_index("email", unique=True))
+    rival = server.User(full_name="B", email="a@example.com", hashed_password="x")
+
+    async def hash_while_rival_registers(password):
+        # Kontrol geçtikten sonra aynı e-postayla başka bir kayıt yazılır
+        await db.users.insert_one(rival.model_dump())
+        return "hashed"
+
+    monkeypatch.setattr(server.password_hasher, "hash", hash_while_rival_registers)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.register_user(server.UserCreate(full_name="A", email="a@example.com", password="pw")))
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Email already registered"
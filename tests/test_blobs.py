@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+def make_user(db, email):
+    user = server.User(full_name="A", email=email, hashed_password="x")
+    asyncio.run(db.users.insert_one(user.model_dump()))
+    return user
+
+
+@pytest.fixture
+def setup(db):
+    owner = make_user(db, "owner@example.com")
+    other = make_user(db, "other@example.com")
+    blob_hash = asyncio.run(server.blob_store.put(b"jpeg-bytes", "image/jpeg"))
+    conversation = server.Conversation(user_id=owner.id)
+    message = server.Message(
+        conversation_id=conversation.id, user_id=owner.id, role="user", content="bak",
+        has_image=True, image_ref=blob_hash, image_mime="image/jpeg", thumb_ref=blob_hash,
+    )
+    asyncio.run(db.conversations.insert_one(conversation.model_dump()))
+    asyncio.run(db.messages.insert_one(message.model_dump()))
+    return TestClient(server.app), owner, other, conversation, message, blob_hash
+
+
+def test_signed_url_from_message_response_serves_the_image(setup):
+    client, _, _, _, message, _ = setup
+    out = server.message_out(message)
+    response = client.get("/api" + out["image_url"])
+    assert response.status_code == 200
+    assert response.content == b"jpeg-bytes"
+    assert client.get("/api" + out["thumb_url"]).status_code == 200
+
+
+def test_unauthenticated_request_is_rejected(setup):
+    client, _, _, _, _, blob_hash = setup
+    assert client.get(f"/api/blobs/{blob_hash}").status_code == 401
+
+
+def test_signature_is_bound_to_the_blob(setup):
+    client, owner, _, _, _, blob_hash = setup
+    token = server.blob_token("0" * 64, owner.id)
+    assert client.get(f"/api/blobs/{blob_hash}?t={token}").status_code == 403
+    assert client.get(f"/api/blobs/{blob_hash}?t=garbage").status_code == 403
+
+
+def test_knowing_the_hash_is_not_enough(setup):
+    client, _, other, _, _, blob_hash = setup
+    # Aynı görseli bilen başka kullanıcı: kendi imzası ya da bearer token'ı işe yaramaz
+    token = server.blob_token(blob_hash, other.id)
+    assert client.get(f"/api/blobs/{blob_hash}?t={token}").status_code == 404
+    headers = {"Authorization": f"Bearer {server.create_access_token(other)}"}
+    assert client.get(f"/api/blobs/{blob_hash}", headers=headers).status_code == 404
+
+
+def test_owner_bearer_token_and_soft_delete(setup, db):
+    client, owner, _, conversation, _, blob_hash = setup
+    headers = {"Authorization": f"Bearer {server.create_access_token(owner)}"}
+    assert client.get(f"/api/blobs/{blob_hash}", headers=headers).status_code == 200
+
+    asyncio.run(db.conversations.update_one({"id": conversation.id}, {"$set": {"deleted_at": server.utc_now()}}))
+    assert client.get(f"/api/blobs/{blob_hash}", headers=headers).status_code == 404
@@ -0,0 +1,60 @@
+import asyncio
+
+import server
+
+
+def test_bulk_delete_publishes_only_the_callers_live_conversations(db, monkeypatch):
+    owner = server.User(full_name="A", email="a@example.com", hashed_password="x")
+    other = server.User(full_name="B", email="b@example.com", hashed_password="x")
+    live = [server.Conversation(user_id=owner.id) for _ in range(2)]
+    already_deleted = server.Conversation(user_id=owner.id, deleted_at=server.utc_now())
+    foreign = server.Conversation(user_id=other.id)
+    asyncio.run(db.conversations.insert_many([c.model_dump() for c in (*live, already_deleted, foreign)]))
+
+    published = []
+    monkeypatch.setattr(server, "publish_conversations_deleted", lambda user_id, ids: published.append((user_id, ids)))
+    request = server.DeleteConversationsRequest(
+        conversation_ids=[c.id for c in (*live, already_deleted, foreign)] + ["missing"]
+    )
+
+    assert asyncio.run(server.delete_conversations(request, owner)) == {"deleted_count": 2}
+    assert [(user_id, sorted(ids)) for user_id, ids in published] == [(owner.id, sorted(c.id for c in live))]
+    foreign_doc = asyncio.run(db.conversations.find_one({"id": foreign.id}))
+    assert foreign_doc["deleted_at"] is None
+
+    # Tekrar: silinecek bir şey kalmadı, olay da yayınlanmaz
+    published.clear()
+    assert asyncio.run(server.delete_conversations(request, owner)) == {"deleted_count": 0}
+    assert published == []
+
+
+def test_title_job_skips_a_conversation_deleted_meanwhile(db, monkeypatch):
+    user = server.User(full_name="A", email="a@example.com", hashed_password="x")
+    live, deleted = server.Conversation(user_id=user.id), server.Conversation(user_id=user.id, deleted_at=server.utc_now())
+    asyncio.run(db.conversations.insert_many([live.model_dump(), deleted.model_dump()]))
+
+    async def fake_title(first_message):
+        return "Yeni başlık"
+
+    published = []
+    monkeypatch.setattr(server, "generate_title_from_message", fake_title)
+    monkeypatch.setattr(server, "publish_conversation_updated", published.append)
+
+    asyncio.run(server.update_conversation_title(deleted.id, "merhaba"))
+    assert asyncio.run(db.conversations.find_one({"id": deleted.id}))["title"] == deleted.title
+    assert published == []
+
+    asyncio.run(server.update_conversation_title(live.id, "merhaba"))
+    assert asyncio.run(db.conversations.find_one({"id": live.id}))["title"] == "Yeni başlık"
+    assert [event["id"] for event in published] == [live.id]
+
+
+def test_touch_skips_a_conversation_deleted_during_the_turn(db, monkeypatch):
+    user = server.User(full_name="A", email="a@example.com", hashed_password="x")
+    deleted = server.Conversation(user_id=user.id, deleted_at=server.utc_now())
+    asyncio.run(db.conversations.insert_one(deleted.model_dump()))
+    events = []
+    monkeypatch.setattr(server.conversation_events, "publish", lambda user_id, event: events.append(event))
+
+    asyncio.run(server.touch_conversation(deleted.id, server.utc_now()))
+    assert events == []
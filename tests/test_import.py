@@ -0,0 +1,44 @@
+import asyncio
+
+import server
+
+
+def test_conversations_without_messages_are_flushed_in_batches(db, monkeypatch):
+    monkeypatch.setattr(server, "IMPORT_BATCH_SIZE", 2)
+    importer = server.ConversationImporter(server.User(full_name="A", email="a@example.com", hashed_password="x"))
+
+    async def scenario():
+        for i in range(5):
+            await importer.add(i + 1, {"type": "conversation", "conversation": {"id": f"old-{i}", "title": f"t{i}"}})
+            assert len(importer.conversations) < 2
+        await importer.flush()
+
+    asyncio.run(scenario())
+    assert importer.result()["imported_conversations"] == 5
+    assert asyncio.run(db.conversations.count_documents({"user_id": importer.user.id})) == 5
+
+
+def test_image_ref_is_only_reused_when_the_user_already_owns_it(db):
+    blob_hash = asyncio.run(server.blob_store.put(b"jpeg-bytes", "image/jpeg"))
+    owner = server.User(full_name="A", email="a@example.com", hashed_password="x")
+    conversation = server.Conversation(user_id=owner.id)
+    asyncio.run(db.conversations.insert_one(conversation.model_dump()))
+    asyncio.run(db.messages.insert_one(server.Message(
+        conversation_id=conversation.id, user_id=owner.id, role="user", content="", has_image=True, image_ref=blob_hash,
+    ).model_dump()))
+
+    def import_ref(user):
+        importer = server.ConversationImporter(user)
+
+        async def scenario():
+            await importer.add(1, {"type": "conversation", "conversation": {"id": "old", "title": "t"}})
+            await importer.add(2, {"type": "message", "message": {
+                "conversation_id": "old", "role": "user", "content": "", "image_ref": blob_hash,
+            }})
+            return importer.messages[0]
+
+        return asyncio.run(scenario())
+
+    assert import_ref(owner)["image_ref"] == blob_hash
+    stranger = server.User(full_name="B", email="b@example.com", hashed_password="x")
+    assert import_ref(stranger)["image_ref"] is None
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class FakeBackend:
+    configured = True
+
+    def __init__(self, name, delay=0.0, fail=False, fail_after_first=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.fail_after_first = fail_after_first
+        self.calls = 0
+        self.cancelled = 0
+        self.breaker = server.CircuitBreaker(name, failure_threshold=2, cooldown=60)
+        self.latency = server.LatencyTracker()
+        self.first_token_latency = server.LatencyTracker()
+
+    async def _wait(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    async def chat(self, history, message, system_instruction, cache=None):
+        self.calls += 1
+        await self._wait()
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        return f"{self.name}:{message}"
+
+    async def stream(self, history, message, system_instruction, cache=None):
+        self.calls += 1
+        await self._wait()
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        yield f"{self.name}:1"
+        if self.fail_after_first:
+            raise RuntimeError(f"{self.name} broke mid-stream")
+        yield f"{self.name}:2"
+
+
+def make_router(*backends, hedge=False):
+    router = server.LLMRouter("", hedge)
+    router.backends = list(backends)
+    return router
+
+
+def chat(router, message="hi"):
+    return asyncio.run(router.chat([], message))
+
+
+def stream(router):
+    async def collect():
+        return [text async for text in router.stream([], "hi")]
+
+    return asyncio.run(collect())
+
+
+@pytest.fixture
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(server, "LLM_HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(server, "LLM_HEDGE_MIN_DELAY_SECONDS", 0.01)
+
+
+def test_fails_over_to_next_backend():
+    primary, secondary = FakeBackend("a", fail=True), FakeBackend("b")
+    assert chat(make_router(primary, secondary)) == "b:hi"
+    assert primary.breaker.failures == 1
+    assert secondary.breaker.failures == 0
+
+
+def test_open_circuit_is_skipped_until_cooldown(monkeypatch):
+    primary, secondary = FakeBackend("a", fail=True), FakeBackend("b")
+    router = make_router(primary, secondary)
+    chat(router)
+    chat(router)
+    assert primary.breaker.opened_at is not None
+
+    chat(router)
+    assert primary.calls == 2
+
+    # Cooldown geçti: yarı açık devre bir istek geçirir, başarı devreyi kapatır
+    opened_at = primary.breaker.opened_at
+    monkeypatch.setattr(server.time, "monotonic", lambda: opened_at + 61)
+    primary.fail = False
+    assert chat(router) == "a:hi"
+    assert primary.breaker.opened_at is None and primary.breaker.failures == 0
+
+
+def test_all_backends_failing_raises_unavailable_with_cause():
+    router = make_router(FakeBackend("a", fail=True), FakeBackend("b", fail=True))
+    with pytest.raises(server.LLMUnavailable) as exc:
+        chat(router)
+    assert isinstance(exc.value.__cause__, RuntimeError)
+
+
+def test_all_circuits_open_raises_without_calling():
+    backend = FakeBackend("a")
+    backend.breaker.failures = 2
+    backend.breaker.record_failure()
+    with pytest.raises(server.LLMUnavailable):
+        chat(make_router(backend))
+    assert backend.calls == 0
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled(fast_hedging):
+    primary, secondary = FakeBackend("a", delay=5), FakeBackend("b")
+    primary.latency.add(0.01)
+    assert chat(make_router(primary, secondary, hedge=True)) == "b:hi"
+    assert primary.cancelled == 1
+
+
+def test_no_hedge_without_latency_samples(fast_hedging):
+    primary, secondary = FakeBackend("a", delay=0.05), FakeBackend("b")
+    assert chat(make_router(primary, secondary, hedge=True)) == "a:hi"
+    assert secondary.calls == 0
+
+
+def test_no_hedge_when_disabled(fast_hedging):
+    primary, secondary = FakeBackend("a", delay=0.05), FakeBackend("b")
+    primary.latency.add(0.001)
+    assert chat(make_router(primary, secondary, hedge=False)) == "a:hi"
+    assert secondary.calls == 0
+
+
+def test_stream_fails_over_before_first_chunk():
+    primary, secondary = FakeBackend("a", fail=True), FakeBackend("b")
+    assert stream(make_router(primary, secondary)) == ["b:1", "b:2"]
+    assert primary.breaker.failures == 1
+
+
+def test_stream_error_after_first_chunk_is_not_retried():
+    primary, secondary = FakeBackend("a", fail_after_first=True), FakeBackend("b")
+    with pytest.raises(RuntimeError, match="mid-stream"):
+        stream(make_router(primary, secondary))
+    assert secondary.calls == 0
+    assert primary.breaker.failures == 1
+
+
+def test_stream_hedge_wins_on_first_chunk(fast_hedging):
+    primary, secondary = FakeBackend("a", delay=5), FakeBackend("b")
+    primary.first_token_latency.add(0.01)
+    assert stream(make_router(primary, secondary, hedge=True)) == ["b:1", "b:2"]
+    assert primary.cancelled == 1
+
+
+def test_stream_all_failing_raises_unavailable():
+    with pytest.raises(server.LLMUnavailable):
+        stream(make_router(FakeBackend("a", fail=True), FakeBackend("b", fail=True)))
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def page(db, **kwargs):
+    options = dict(
+        query={"conversation_id": "c1"},
+        projection={"_id": 0, "id": 1, "created_at": 1},
+        time_field="created_at",
+        newest_first=False,
+        limit=3,
+        before=None,
+        after=None,
+    )
+    options.update(kwargs)
+    return asyncio.run(server.keyset_page(db.messages, **options))
+
+
+def seed(db, count, same_time=False):
+    start = server.utc_now()
+    docs = [
+        {"id": f"m{i:02d}", "conversation_id": "c1", "created_at": start if same_time else start + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+    asyncio.run(db.messages.insert_many([dict(d) for d in docs]))
+    return [d["id"] for d in docs]
+
+
+def ids(result):
+    return [item["id"] for item in result["items"]]
+
+
+def test_cursor_round_trip_keeps_timezone_and_id():
+    timestamp = server.utc_now()
+    cursor = server.encode_cursor(timestamp, "abc")
+    assert "=" not in cursor
+    assert server.decode_cursor(cursor) == (timestamp, "abc")
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30", server.encode_cursor(server.utc_now(), "x")[:-4]])
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        server.decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_before_walks_back_without_gaps_or_duplicates(db):
+    all_ids = seed(db, 8)
+    first = page(db)
+    assert ids(first) == all_ids[-3:]
+
+    seen, cursor = ids(first), first["next_cursor"]
+    while cursor:
+        result = page(db, before=cursor)
+        seen = ids(result) + seen
+        cursor = result["next_cursor"]
+    assert seen == all_ids
+
+
+def test_ties_on_timestamp_are_broken_by_id(db):
+    all_ids = seed(db, 7, same_time=True)
+    seen, cursor = [], None
+    while True:
+        result = page(db, before=cursor)
+        seen = ids(result) + seen
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == all_ids
+
+
+def test_after_walks_forward_newest_first(db):
+    all_ids = seed(db, 6)
+    oldest_cursor = server.encode_cursor(asyncio.run(db.messages.find_one({"id": "m00"}))["created_at"], "m00")
+    result = page(db, after=oldest_cursor, newest_first=True)
+    assert ids(result) == list(reversed(all_ids[1:4]))
+    result = page(db, after=result["next_cursor"], newest_first=True)
+    assert ids(result) == list(reversed(all_ids[4:]))
+    assert result["next_cursor"] is None
+
+
+def test_last_page_exactly_full_has_no_next_cursor(db):
+    seed(db, 3)
+    assert page(db)["next_cursor"] is None
+
+
+def test_before_and_after_together_is_400(db):
+    cursor = server.encode_cursor(server.utc_now(), "x")
+    with pytest.raises(HTTPException) as exc:
+        page(db, before=cursor, after=cursor)
+    assert exc.value.status_code == 400
+
+
+def test_search_offset_cursor_round_trip_and_cap():
+    assert server.decode_offset_cursor(server.encode_offset_cursor(40)) == 40
+    assert server.decode_offset_cursor(server.encode_offset_cursor(server.SEARCH_MAX_OFFSET)) == server.SEARCH_MAX_OFFSET
+    for cursor in (server.encode_offset_cursor(server.SEARCH_MAX_OFFSET + 1), server.encode_offset_cursor(-1), "not-a-cursor"):
+        with pytest.raises(HTTPException) as exc:
+            server.decode_offset_cursor(cursor)
+        assert exc.value.status_code == 400
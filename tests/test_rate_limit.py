@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    return clock
+
+
+def take(backend, key="u", rate=1.0, burst=3):
+    return asyncio.run(backend.take(key, rate, burst))
+
+
+def test_burst_then_retry_after(clock):
+    backend = server.InMemoryTokenBucketBackend()
+    assert [take(backend) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take(backend) == pytest.approx(1.0)
+
+
+def test_refill_is_proportional_and_capped_at_burst(clock):
+    backend = server.InMemoryTokenBucketBackend()
+    for _ in range(3):
+        take(backend, rate=0.5)
+    clock.now += 1
+    # Yarım token birikti: kalan yarım token için 1 sn daha
+    assert take(backend, rate=0.5) == pytest.approx(1.0)
+    clock.now += 1000
+    assert [take(backend, rate=0.5) for _ in range(4)][:3] == [0.0, 0.0, 0.0]
+    assert take(backend, rate=0.5) > 0
+
+
+def test_rejected_request_does_not_consume(clock):
+    backend = server.InMemoryTokenBucketBackend()
+    for _ in range(3):
+        take(backend)
+    assert take(backend) == pytest.approx(1.0)
+    clock.now += 1
+    assert take(backend) == 0.0
+
+
+def test_keys_are_independent(clock):
+    backend = server.InMemoryTokenBucketBackend()
+    for _ in range(3):
+        take(backend, key="a")
+    assert take(backend, key="a") > 0
+    assert take(backend, key="b") == 0.0
+
+
+def test_zero_rate_disables_limiter():
+    class Exploding:
+        async def take(self, *args):
+            raise AssertionError("backend must not be called")
+
+    assert asyncio.run(server.RateLimiter(Exploding(), 0, 10).check("u")) == 0.0
+
+
+def test_backend_error_fails_open():
+    class Broken:
+        async def take(self, *args):
+            raise ConnectionError("down")
+
+    assert asyncio.run(server.RateLimiter(Broken(), 60, 1).check("u")) == 0.0
+
+
+def test_admission_returns_429_with_rounded_up_retry_after(clock, monkeypatch):
+    limiter = server.RateLimiter(server.InMemoryTokenBucketBackend(), rate_per_minute=24, burst=1)
+    monkeypatch.setattr(server, "chat_rate_limiter", limiter)
+    user = server.User(full_name="A", email="a@example.com", hashed_password="x")
+
+    assert asyncio.run(server.chat_admission(user)) is user
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.chat_admission(user))
+    assert exc.value.status_code == 429
+    # 24/dk = 0.4 token/sn; bir token için 2.5 sn -> "3"
+    assert exc.value.headers["Retry-After"] == "3"
+
+
+def test_mongo_backend_is_shared_between_workers(db):
+    # İki worker aynı koleksiyonu kullanır: kova ortak
+    first = server.MongoTokenBucketBackend(db.rate_limits)
+    second = server.MongoTokenBucketBackend(db.rate_limits)
+    assert take(first, burst=2) == 0.0
+    assert take(second, burst=2) == 0.0
+    assert take(first, burst=2) == pytest.approx(1.0, abs=0.05)
+    doc = asyncio.run(db.rate_limits.find_one({"_id": "u"}))
+    assert doc["expires_at"] > doc["updated_at"]
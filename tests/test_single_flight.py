@@ -0,0 +1,142 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import server
+
+
+class Factory:
+    def __init__(self, body=None, fail=False, delay=0.0):
+        self.body = body or {"answer": "ok"}
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("llm down")
+        return self.body
+
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(server.SingleFlight, "POLL_SECONDS", 0.01)
+
+
+def make_flight(db, lease_seconds=60.0):
+    return server.SingleFlight(db.idempotency_keys, ttl_seconds=3600, lease_seconds=lease_seconds)
+
+
+def test_concurrent_duplicates_join_the_running_call(db):
+    flight = make_flight(db)
+    factory = Factory(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("u:k", "fp", factory) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == [{"answer": "ok"}] * 5
+    assert factory.calls == 1
+
+
+def test_completed_response_is_replayed(db):
+    flight = make_flight(db)
+    factory = Factory()
+    asyncio.run(flight.run("u:k", "fp", factory))
+    assert asyncio.run(flight.run("u:k", "fp", factory)) == {"answer": "ok"}
+    assert factory.calls == 1
+
+    record = asyncio.run(db.idempotency_keys.find_one({"_id": "u:k"}))
+    assert record["status"] == "done"
+    assert record["response"] == {"answer": "ok"}
+    assert record["expires_at"] > server.utc_now() + timedelta(seconds=3500)
+
+
+def test_replay_across_workers_comes_from_mongo(db):
+    factory = Factory()
+    asyncio.run(make_flight(db).run("u:k", "fp", factory))
+    # Başka worker: bellekte kayıt yok, Mongo'daki yanıt döner
+    assert asyncio.run(make_flight(db).run("u:k", "fp", factory)) == {"answer": "ok"}
+    assert factory.calls == 1
+
+
+def test_key_reused_with_different_request(db):
+    flight = make_flight(db)
+    asyncio.run(flight.run("u:k", "fp", Factory()))
+    with pytest.raises(server.IdempotencyKeyReused):
+        asyncio.run(flight.run("u:k", "other", Factory()))
+    with pytest.raises(server.IdempotencyKeyReused):
+        asyncio.run(make_flight(db).run("u:k", "other", Factory()))
+
+
+def test_key_reused_while_in_flight(db):
+    flight = make_flight(db)
+
+    async def scenario():
+        first = asyncio.create_task(flight.run("u:k", "fp", Factory(delay=0.05)))
+        await asyncio.sleep(0)
+        with pytest.raises(server.IdempotencyKeyReused):
+            await flight.run("u:k", "other", Factory())
+        return await first
+
+    assert asyncio.run(scenario()) == {"answer": "ok"}
+
+
+def test_failure_releases_the_key(db):
+    flight = make_flight(db)
+    with pytest.raises(RuntimeError):
+        asyncio.run(flight.run("u:k", "fp", Factory(fail=True)))
+    assert asyncio.run(db.idempotency_keys.find_one({"_id": "u:k"})) is None
+
+    retry = Factory()
+    assert asyncio.run(flight.run("u:k", "fp", retry)) == {"answer": "ok"}
+    assert retry.calls == 1
+
+
+def test_pending_on_another_worker_is_in_progress(db, fast_poll):
+    now = server.utc_now()
+    asyncio.run(db.idempotency_keys.insert_one({
+        "_id": "u:k", "fingerprint": "fp", "status": "pending",
+        "claimed_at": now + timedelta(hours=1), "expires_at": now + timedelta(hours=1),
+    }))
+    factory = Factory()
+    with pytest.raises(server.IdempotencyInProgress):
+        asyncio.run(make_flight(db, lease_seconds=0.05).run("u:k", "fp", factory))
+    assert factory.calls == 0
+
+
+def test_waits_for_other_worker_to_finish(db, fast_poll):
+    first, second = make_flight(db), make_flight(db)
+    factory = Factory(delay=0.05)
+
+    async def scenario():
+        lead = asyncio.create_task(first.run("u:k", "fp", factory))
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(lead, second.run("u:k", "fp", factory))
+
+    assert asyncio.run(scenario()) == [{"answer": "ok"}] * 2
+    assert factory.calls == 1
+
+
+def test_expired_lease_is_taken_over(db, fast_poll):
+    now = server.utc_now()
+    asyncio.run(db.idempotency_keys.insert_one({
+        "_id": "u:k", "fingerprint": "fp", "status": "pending",
+        "claimed_at": now - timedelta(minutes=5), "expires_at": now + timedelta(hours=1),
+    }))
+    factory = Factory()
+    assert asyncio.run(make_flight(db).run("u:k", "fp", factory)) == {"answer": "ok"}
+    assert factory.calls == 1
+
+
+def test_memory_replay_expires_with_ttl(db):
+    flight = server.SingleFlight(db.idempotency_keys, ttl_seconds=3600, lease_seconds=60)
+    factory = Factory()
+    asyncio.run(flight.run("u:k", "fp", factory))
+    flight._done.expire(time=flight._done.timer() + 3601)
+    assert "u:k" not in flight._done
+    # Bellekten düşen yanıt Mongo kaydından yine tekrar edilir
+    assert asyncio.run(flight.run("u:k", "fp", factory)) == {"answer": "ok"}
+    assert factory.calls == 1